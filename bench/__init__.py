@@ -0,0 +1,9 @@
+"""
+性能基准测试脚本
+
+每个模块都可以单独运行，例如:
+
+    python -m bench.keepalive
+
+python -m bench 运行端到端负载测试（bench/load.py），结果保存在 bench/results/ 中。
+"""
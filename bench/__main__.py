@@ -0,0 +1,6 @@
+"""
+python -m bench 运行端到端负载测试，参数见 bench/load.py
+"""
+from bench.load import main
+
+main()
@@ -0,0 +1,71 @@
+"""
+测量访问日志的开销：请求线程中单次记录的耗时（与 BaseHTTPRequestHandler
+逐行格式化并写入标准错误对比），以及关闭、写入文件和抽样时的请求吞吐量
+
+    python -m bench.access_log --requests 5000 --rounds 3
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from bench.metrics import measure_servers
+from server.access_log import AccessLog
+from server.server import BookServer, ENGINES
+
+
+def measure_record(count, path):
+    """单次 AccessLog.record 的平均耗时（纳秒），不包括后台线程的写出"""
+    log = AccessLog(path, max_pending=count)
+    start = time.perf_counter()
+    for i in range(count):
+        log.record('GET', '/books/1', '/books/{book_id:int}', 200, 0.0004, 0, 120, '127.0.0.1')
+    elapsed = time.perf_counter() - start
+    log.close()
+    return elapsed / count * 1e9
+
+
+def measure_line_per_request(count, path):
+    """BaseHTTPRequestHandler.log_message 的方式：每个请求格式化一行并立即写出"""
+    with open(path, 'a', buffering=1) as f:
+        start = time.perf_counter()
+        for i in range(count):
+            f.write("%s - - [%s] %s\n" % ('127.0.0.1', time.strftime('%d/%b/%Y %H:%M:%S'),
+                                          '"GET /books/1 HTTP/1.1" 200 -'))
+            f.flush()
+        return (time.perf_counter() - start) / count * 1e9
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="访问日志开销基准测试")
+    parser.add_argument("--requests", type=int, default=5000, help="每轮的请求数")
+    parser.add_argument("--rounds", type=int, default=3, help="每种配置测量的轮数")
+    parser.add_argument("--engine", choices=ENGINES, default="threaded", help="服务器引擎")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "access.log")
+        print(f"逐行写出: {measure_line_per_request(100000, path):.0f} ns")
+        print(f"单次记录: {measure_record(100000, path):.0f} ns")
+
+        configs = [("关闭", None, 1.0), ("写入文件", path, 1.0), ("抽样 10%", path, 0.1)]
+        servers = [
+            BookServer(port=0, engine=args.engine, metrics=False, access_log=access_log,
+                       access_log_sample_rate=sample_rate, max_keepalive_requests=args.requests + 1)
+            for _, access_log, sample_rate in configs
+        ]
+        for server in servers:
+            server.start()
+        try:
+            for route in ("/books/1", "/books"):
+                results = measure_servers(servers, route, args.requests, args.rounds)
+                print(f"GET {route:<10} " + "  ".join(
+                    f"{name} {rps:>8.0f} req/s" for (name, _, _), rps in zip(configs, results)
+                ))
+        finally:
+            for server in servers:
+                server.stop()
+
+
+if __name__ == "__main__":
+    main()
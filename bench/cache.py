@@ -0,0 +1,56 @@
+"""
+比较开启和关闭响应缓存时热点 GET 请求的吞吐量
+
+    python -m bench.cache --requests 5000 --books 1000
+"""
+import argparse
+import http.client
+import time
+
+from server.models.book import Book
+from server.server import BookServer, ENGINES
+
+
+def run_keep_alive(port, path, count):
+    """在一个长连接上重复请求同一个路径"""
+    conn = http.client.HTTPConnection("localhost", port)
+    for _ in range(count):
+        conn.request("GET", path)
+        conn.getresponse().read()
+    conn.close()
+
+
+def measure(name, port, path, count):
+    start = time.perf_counter()
+    run_keep_alive(port, path, count)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<16} {count / elapsed:>10.0f} req/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="响应缓存基准测试")
+    parser.add_argument("--requests", type=int, default=5000, help="每个路径的请求数")
+    parser.add_argument("--books", type=int, default=1000, help="书籍总数")
+    parser.add_argument("--engine", choices=ENGINES, default="threaded", help="服务器引擎")
+    args = parser.parse_args(argv)
+
+    for cache_size in (0, 10000):
+        server = BookServer(port=0, engine=args.engine, cache_size=cache_size, access_log=None,
+                            max_keepalive_requests=args.requests + 1)
+        server.database.add_books(
+            Book(None, f"书籍{i}", f"作者{i % 100}", 2000 + i % 20, None)
+            for i in range(args.books - len(server.database.get_all_books()))
+        )
+        server.start()
+        try:
+            print(f"缓存{'开启' if cache_size else '关闭'} ({args.books} 本书籍)")
+            measure("GET /books/1", server.port, "/books/1", args.requests)
+            measure("GET /books", server.port, "/books", args.requests // 10)
+            if server.cache is not None:
+                print(f"  {server.cache.stats()}")
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+比较各个 JSON 后端和 MessagePack 编解码书籍数据的速度和输出大小
+
+    python -m bench.codec --books 1 100 10000
+"""
+import argparse
+import json
+import timeit
+
+from common import msgpack_codec
+from common.codec import BACKENDS, Codec, get_codec
+
+
+def stdlib_default():
+    """改用编解码层之前的方式：标准库默认参数，中文转义为 \\uXXXX"""
+    return Codec(
+        'json(旧)',
+        lambda obj: json.dumps(obj).encode('utf-8'),
+        lambda data: json.loads(data.decode('utf-8'))
+    )
+
+
+def build_payload(count):
+    """与 GET /books 响应结构相同的数据"""
+    return {"data": [
+        {
+            "id": i,
+            "title": f"深入理解计算机系统 第{i % 5 + 1}版",
+            "author": f"作者{i % 100}",
+            "publication_year": 2000 + i % 20,
+            "isbn": f"978{i:010d}"
+        }
+        for i in range(1, count + 1)
+    ]}
+
+
+def measure(func, arg, min_time):
+    """返回单次调用的平均耗时（秒）"""
+    timer = timeit.Timer(lambda: func(arg))
+    number, _ = timer.autorange()
+    number = max(number, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON/MessagePack 编解码基准测试")
+    parser.add_argument("--books", type=int, nargs="+", default=[1, 100, 10000],
+                        help="每个响应包含的书籍数，可以指定多个")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每项测量的最短时间（秒）")
+    args = parser.parse_args(argv)
+
+    codecs = [stdlib_default()]
+    for name in BACKENDS:
+        try:
+            codecs.append(get_codec(name))
+        except ImportError:
+            print(f"{name} 未安装，跳过")
+    for name in ('python', 'msgpack'):
+        try:
+            implementation = msgpack_codec.get_codec(name)
+        except ImportError:
+            print(f"{name} 未安装，跳过")
+            continue
+        codecs.append(implementation._replace(name=f"mp-{name}"))
+
+    for count in args.books:
+        payload = build_payload(count)
+        print(f"{count} 本书籍")
+        for codec in codecs:
+            body = codec.dumps(payload)
+            encode = measure(codec.dumps, payload, args.min_time)
+            decode = measure(codec.loads, body, args.min_time)
+            print(f"  {codec.name:<10} {len(body):>10} 字节"
+                  f"  编码 {encode * 1e6:>10.1f} us  解码 {decode * 1e6:>10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+比较不同压缩级别下完整书籍列表的传输字节数和压缩耗时
+
+    python -m bench.compression --books 100 1000 10000
+"""
+import argparse
+import time
+
+from server.compression import compress
+from server.controllers import BookController
+from server.models import Database
+from server.models.book import Book
+from server.views.book_view import encode_body
+
+LEVELS = (1, 6, 9)
+
+
+def build_body(count):
+    """编码与 GET /books 相同的响应体"""
+    database = Database()
+    database.add_books(
+        Book(None, f"书籍{i}", f"作者{i % 100}", 2000 + i % 20, f"978{i:010d}")
+        for i in range(count)
+    )
+    return encode_body(BookController(database).get_all_books())
+
+
+def measure(body, encoding, level, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        compressed = compress(body, encoding, level)
+    elapsed = (time.perf_counter() - start) / repeat
+    return len(compressed), elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="响应压缩基准测试")
+    parser.add_argument("--books", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="书籍总数，可以指定多个")
+    parser.add_argument("--encoding", choices=("gzip", "deflate"), default="gzip", help="压缩编码")
+    parser.add_argument("--repeat", type=int, default=20, help="每个级别重复压缩的次数")
+    args = parser.parse_args(argv)
+
+    for count in args.books:
+        body = build_body(count)
+        print(f"{count} 本书籍，未压缩 {len(body)} 字节")
+        for level in LEVELS:
+            size, elapsed = measure(body, args.encoding, level, args.repeat)
+            print(f"  {args.encoding} 级别 {level}: {size:>10} 字节 ({size / len(body):6.1%})"
+                  f"  {elapsed * 1000:8.2f} ms  {len(body) / elapsed / 1e6:7.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+比较短连接、长连接和流水线三种方式下 GET /books/{id} 的吞吐量
+
+    python -m bench.keepalive --requests 5000 --engine threaded
+"""
+import argparse
+import http.client
+import socket
+import time
+
+from server.server import BookServer, ENGINES
+
+
+def run_short_connections(port, count):
+    """每个请求新建一个连接（HTTP/1.0 时代的行为）"""
+    for _ in range(count):
+        conn = http.client.HTTPConnection("localhost", port)
+        conn.request("GET", "/books/1", headers={"Connection": "close"})
+        conn.getresponse().read()
+        conn.close()
+
+
+def run_keep_alive(port, count):
+    """所有请求复用同一个连接"""
+    conn = http.client.HTTPConnection("localhost", port)
+    for _ in range(count):
+        conn.request("GET", "/books/1")
+        conn.getresponse().read()
+    conn.close()
+
+
+def run_pipelined(port, count, depth=16):
+    """每次发送 depth 个请求后再统一读取响应"""
+    request = b"GET /books/1 HTTP/1.1\r\nHost: localhost\r\n\r\n"
+    with socket.create_connection(("localhost", port)) as sock:
+        reader = sock.makefile('rb')
+        sent = 0
+        while sent < count:
+            batch = min(depth, count - sent)
+            sock.sendall(request * batch)
+            for _ in range(batch):
+                length = 0
+                while True:
+                    line = reader.readline()
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                    if line in (b"\r\n", b""):
+                        break
+                reader.read(length)
+            sent += batch
+
+
+def measure(name, func, port, count):
+    start = time.perf_counter()
+    func(port, count)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<20} {count / elapsed:>10.0f} req/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="长连接与流水线吞吐量基准测试")
+    parser.add_argument("--requests", type=int, default=5000, help="每种方式的请求数")
+    parser.add_argument("--engine", choices=ENGINES, default="threaded", help="服务器引擎")
+    args = parser.parse_args(argv)
+
+    server = BookServer(port=0, engine=args.engine, max_keepalive_requests=args.requests + 1,
+                        access_log=None)
+    server.start()
+    try:
+        print(f"引擎: {args.engine}, 每种方式 {args.requests} 个请求")
+        measure("短连接", run_short_connections, server.port, args.requests)
+        measure("长连接", run_keep_alive, server.port, args.requests)
+        measure("流水线(深度16)", run_pipelined, server.port, args.requests)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""
+端到端负载测试：在子进程中启动服务器，按给定的读写比例施加负载
+
+    python -m bench --mix read mixed --concurrency 16 --duration 10
+    python -m bench --mode open --rate 2000 --mix get=90,create=10
+    python -m bench --server-args "--engine asyncio --cache-size 0" --baseline old.json
+
+闭环（closed）模式下每个连接收到响应后立即发出下一个请求，测量服务器
+能承受的最大吞吐量。开环（open）模式按泊松过程以固定的平均速率发出请求，
+与响应快慢无关；延迟从计划发出的时刻算起，包含在客户端排队的时间，
+服务器变慢时不会因为客户端跟着放慢而低估尾延迟（coordinated omission）。
+测量期间发出、测量结束后才完成的请求同样计入延迟，并单独报告其数量；
+吞吐量只统计测量期间完成的请求。
+
+负载由多个客户端进程产生，每个进程用多个线程各自维持一个长连接，
+--concurrency 是连接总数。服务器的 CPU 时间和内存从 /proc 读取，
+包括多进程模式下的所有工作进程（仅 Linux）。
+
+结果以 JSON 保存到 --output（默认 bench/results/），包含提交号和运行
+环境；--baseline 指定之前保存的结果时逐项比较吞吐量和延迟。
+"""
+import argparse
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from array import array
+from urllib.parse import quote
+
+from bench.report import ROOT, change, read_results, write_results
+
+# 预设的请求比例，也可以直接写成 get=90,create=10
+MIXES = {
+    "read": "get=90,list=5,search=5",
+    "write": "create=50,update=40,delete=10",
+    "mixed": "get=70,list=5,search=5,create=10,update=8,delete=2",
+}
+OPERATIONS = ("get", "list", "search", "create", "update", "delete")
+MODES = ("closed", "open")
+PERCENTILES = (50, 90, 99, 99.9)
+HEADERS = {"Content-Type": "application/json"}
+
+
+def parse_mix(spec):
+    """把 "get=90,create=10" 或预设名称解析为 {操作: 权重}"""
+    spec = MIXES.get(spec, spec)
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"未知的操作: {name}，可选: {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise ValueError(f"无效的权重: {part}") from None
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError(f"无效的请求比例: {spec}")
+    return mix
+
+
+class Client:
+    """一个长连接和它创建过的书籍，由一个线程独占使用"""
+
+    def __init__(self, port, book_ids, rng):
+        self.conn = http.client.HTTPConnection("localhost", port, timeout=30)
+        self.book_ids = book_ids
+        self.created = []
+        self.rng = rng
+
+    def request(self, method, path, body=None):
+        """发送请求并读完响应，返回状态码和响应体"""
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        try:
+            self.conn.request(method, path, data, HEADERS if data is not None else {})
+            response = self.conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            # 下一次请求时 http.client 会重新连接
+            self.conn.close()
+            raise
+
+    def new_book(self):
+        n = self.rng.randrange(1 << 30)
+        return {"title": f"负载测试{n}", "author": f"作者{n % 100}", "publication_year": 2000 + n % 25}
+
+    def get(self):
+        return self.request("GET", f"/books/{self.rng.choice(self.book_ids)}")[0]
+
+    def list(self):
+        return self.request("GET", "/books?limit=50")[0]
+
+    def search(self):
+        return self.request("GET", f"/books/search?q={quote(f'作者{self.rng.randrange(100)}')}")[0]
+
+    def create(self):
+        status, body = self.request("POST", "/books", self.new_book())
+        if status == 201:
+            self.created.append(json.loads(body)["data"]["id"])
+        return status
+
+    def update(self):
+        book_id = self.rng.choice(self.created or self.book_ids)
+        return self.request("PUT", f"/books/{book_id}", self.new_book())[0]
+
+    def delete(self):
+        # 只删除自己创建的书籍，其他操作引用的预置书籍始终存在
+        if not self.created:
+            return self.create()
+        return self.request("DELETE", f"/books/{self.created.pop()}")[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class Recorder:
+    """一个客户端进程中各操作的延迟（秒）、错误数和测量结束后才完成的请求数"""
+
+    def __init__(self, mix):
+        self.latencies = {name: array("d") for name in mix}
+        self.errors = {name: 0 for name in mix}
+        self.late = 0
+        self._lock = threading.Lock()
+
+    def record(self, name, latency, ok, late=False):
+        with self._lock:
+            self.latencies[name].append(latency)
+            if not ok:
+                self.errors[name] += 1
+            if late:
+                self.late += 1
+
+
+def run_closed(client, choose, recorder, start, deadline):
+    while True:
+        name = choose()
+        begin = time.perf_counter()
+        if begin >= deadline:
+            return
+        ok = execute(client, name)
+        end = time.perf_counter()
+        if begin >= start:
+            recorder.record(name, end - begin, ok)
+
+
+def run_open(client, pending, recorder, start, deadline):
+    while True:
+        item = pending.get()
+        if item is None:
+            return
+        scheduled, name = item
+        ok = execute(client, name)
+        end = time.perf_counter()
+        # 测量结束后才完成的请求往往是最慢的，丢弃它们会低估尾延迟
+        if scheduled >= start:
+            recorder.record(name, end - scheduled, ok, late=end >= deadline)
+
+
+def execute(client, name):
+    try:
+        return getattr(client, name)() < 400
+    except (OSError, http.client.HTTPException, ValueError, KeyError):
+        return False
+
+
+def run_process(port, book_ids, mix, mode, rate, threads, warmup, duration, seed):
+    """客户端进程：返回 (各操作的延迟, 各操作的错误数, 开环模式下未能发出的请求数,
+    测量结束后才完成的请求数)"""
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    recorder = Recorder(mix)
+    start = time.perf_counter() + warmup
+    deadline = start + duration
+    clients = [Client(port, book_ids, random.Random(rng.random())) for _ in range(threads)]
+    pending = queue.Queue()
+    if mode == "closed":
+        workers = [threading.Thread(target=run_closed, args=(
+            client, lambda r=client.rng: r.choices(names, weights)[0], recorder, start, deadline))
+            for client in clients]
+    else:
+        workers = [threading.Thread(target=run_open, args=(client, pending, recorder, start, deadline))
+                   for client in clients]
+    for worker in workers:
+        worker.start()
+
+    missed = 0
+    if mode == "open":
+        # 泊松到达：间隔服从指数分布，平均速率为 rate
+        scheduled = time.perf_counter()
+        while True:
+            scheduled += rng.expovariate(rate)
+            if scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pending.put((scheduled, rng.choices(names, weights)[0]))
+        while True:
+            try:
+                pending.get_nowait()
+                missed += 1
+            except queue.Empty:
+                break
+        for _ in workers:
+            pending.put(None)
+    for worker in workers:
+        worker.join()
+    for client in clients:
+        client.close()
+    return ({name: latencies.tobytes() for name, latencies in recorder.latencies.items()},
+            recorder.errors, missed, recorder.late)
+
+
+def percentile(ordered, p):
+    """最近秩法的百分位数"""
+    if not ordered:
+        return None
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def latency_summary(latencies):
+    ordered = sorted(latencies)
+    summary = {f"p{p:g}": percentile(ordered, p) for p in PERCENTILES}
+    summary["mean"] = sum(ordered) / len(ordered) if ordered else None
+    summary["max"] = ordered[-1] if ordered else None
+    return {key: None if value is None else round(value * 1000, 3) for key, value in summary.items()}
+
+
+def process_tree(pid):
+    """pid 及其所有子孙进程（通过 /proc 查找）"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 进程名可能包含空格，父进程ID在最后一个右括号之后的第二个字段
+        parents.setdefault(int(stat.rpartition(")")[2].split()[1]), []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(parents.get(current, ()))
+    return tree
+
+
+def server_usage(pid):
+    """服务器进程树的 (CPU 秒数, 常驻内存字节数, 峰值常驻内存字节数)，不支持时返回 None"""
+    if not os.path.isdir("/proc"):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpu, rss, peak = 0.0, 0, 0
+    for member in process_tree(pid):
+        try:
+            with open(f"/proc/{member}/stat") as f:
+                fields = f.read().rpartition(")")[2].split()
+            with open(f"/proc/{member}/status") as f:
+                status = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        # utime 和 stime 是 stat 中的第 14、15 个字段
+        cpu += (int(fields[11]) + int(fields[12])) / ticks
+        rss += int(status.get("VmRSS", "0 kB").split()[0]) * 1024
+        peak += int(status.get("VmHWM", "0 kB").split()[0]) * 1024
+    return cpu, rss, peak
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, server_args, timeout=30.0):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "server.server", "--port", str(port), *server_args],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器启动失败，退出码 {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("localhost", port, timeout=1)
+            conn.request("GET", "/books?limit=1")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("服务器未能在规定时间内启动")
+
+
+def preload(port, count):
+    """通过批量接口添加 count 本书籍，返回服务器上全部书籍的ID"""
+    conn = http.client.HTTPConnection("localhost", port)
+    for offset in range(0, count, 1000):
+        books = [{"title": f"预置书籍{i}", "author": f"作者{i % 100}", "publication_year": 1950 + i % 70}
+                 for i in range(offset, min(count, offset + 1000))]
+        conn.request("POST", "/books:batch", json.dumps(books).encode("utf-8"), HEADERS)
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"预置书籍失败: {response.status} {response.read()[:200]!r}")
+        response.read()
+    ids, cursor = [], ""
+    while True:
+        conn.request("GET", f"/books?limit=1000{cursor}")
+        page = json.loads(conn.getresponse().read())
+        ids.extend(book["id"] for book in page["data"])
+        if not page.get("next_cursor"):
+            break
+        cursor = f"&cursor={quote(page['next_cursor'])}"
+    conn.close()
+    return ids
+
+
+def measure(port, pid, book_ids, mix, args):
+    """施加一轮负载，返回汇总结果"""
+    processes = args.processes or max(1, min(os.cpu_count() or 1, args.concurrency))
+    threads = [args.concurrency // processes + (i < args.concurrency % processes)
+               for i in range(processes)]
+    rate = args.rate / processes if args.mode == "open" else None
+    jobs = [(port, book_ids, mix, args.mode, rate, count, args.warmup, args.duration, args.seed + i)
+            for i, count in enumerate(threads) if count]
+
+    with multiprocessing.Pool(len(jobs)) as pool:
+        pending = pool.starmap_async(run_process, jobs)
+        # 预热结束时开始统计服务器的资源使用
+        time.sleep(args.warmup)
+        before = server_usage(pid)
+        outputs = pending.get()
+        after = server_usage(pid)
+
+    latencies = {name: array("d") for name in mix}
+    errors = dict.fromkeys(mix, 0)
+    missed = late = 0
+    for samples, counts, unsent, finished_late in outputs:
+        for name in mix:
+            latencies[name].frombytes(samples[name])
+            errors[name] += counts[name]
+        missed += unsent
+        late += finished_late
+
+    total = sum(len(values) for values in latencies.values())
+    failed = sum(errors.values())
+    result = {
+        "mix": mix,
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "rate": args.rate if args.mode == "open" else None,
+        "duration": args.duration,
+        "requests": total,
+        "errors": failed,
+        "error_rate": failed / total if total else None,
+        "throughput": (total - late) / args.duration,
+        "missed": missed,
+        "late": late,
+        "latency_ms": latency_summary([x for values in latencies.values() for x in values]),
+        "operations": {
+            name: {"requests": len(latencies[name]), "errors": errors[name],
+                   "latency_ms": latency_summary(latencies[name])}
+            for name in mix
+        },
+        "server": None,
+    }
+    if before and after:
+        cpu = after[0] - before[0]
+        result["server"] = {
+            "cpu_seconds": round(cpu, 3),
+            "cpu_utilization": round(cpu / args.duration, 3),
+            "cpu_us_per_request": round(cpu / total * 1e6, 1) if total else None,
+            "rss_bytes": after[1],
+            "peak_rss_bytes": after[2],
+        }
+    return result
+
+
+def run_label(result):
+    mix = ",".join(f"{name}={weight:g}" for name, weight in result["mix"].items())
+    load = f"{result['rate']:g} req/s" if result["mode"] == "open" else f"{result['concurrency']} 连接"
+    return f"{mix} [{result['mode']}, {load}]"
+
+
+def print_result(label, result):
+    latency = result["latency_ms"]
+    print(f"{label}")
+    print(f"  吞吐量 {result['throughput']:>9.0f} req/s  错误率 {(result['error_rate'] or 0) * 100:.2f}%"
+          + (f"  未发出 {result['missed']}  超时完成 {result.get('late', 0)}"
+             if result["mode"] == "open" else ""))
+    print("  延迟(ms) " + "  ".join(f"{key} {value:.2f}" for key, value in latency.items()
+                                     if value is not None))
+    for name, operation in result["operations"].items():
+        p99 = operation["latency_ms"]["p99"]
+        print(f"    {name:<7} {operation['requests']:>8} 次  错误 {operation['errors']:>5}"
+              + (f"  p99 {p99:.2f} ms" if p99 is not None else ""))
+    server = result["server"]
+    if server:
+        print(f"  服务器 CPU {server['cpu_utilization']:.2f} 核  每请求 {server['cpu_us_per_request']} µs  "
+              f"RSS {server['rss_bytes'] / 2 ** 20:.1f} MiB  峰值 {server['peak_rss_bytes'] / 2 ** 20:.1f} MiB")
+
+
+def compare(results, baseline):
+    """按请求比例、模式和负载逐项与之前的结果比较"""
+    previous = {run_label(result): result for result in baseline["results"]}
+    print(f"与基准 {baseline['environment'].get('commit') or '未知提交'} 比较：")
+    for result in results:
+        label = run_label(result)
+        old = previous.get(label)
+        if old is None:
+            print(f"  {label}: 基准中没有相同的配置")
+            continue
+        throughput = change(result["throughput"], old["throughput"])
+        p99 = change(result["latency_ms"]["p99"], old["latency_ms"]["p99"])
+        parts = [f"吞吐量 {throughput:+.1f}%" if throughput is not None else "吞吐量 -",
+                 f"p99 {p99:+.1f}%" if p99 is not None else "p99 -"]
+        if result["server"] and old.get("server") and old["server"]["cpu_us_per_request"]:
+            cpu = change(result["server"]["cpu_us_per_request"], old["server"]["cpu_us_per_request"])
+            parts.append(f"每请求 CPU {cpu:+.1f}%")
+        print(f"  {label}: " + "  ".join(parts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="端到端负载测试")
+    parser.add_argument("--mix", nargs="+", default=["read", "mixed"],
+                        help=f"请求比例，预设 {', '.join(MIXES)}，或 get=90,create=10 的形式"
+                             f"（操作: {', '.join(OPERATIONS)}）")
+    parser.add_argument("--mode", choices=MODES, default="closed", help="闭环或开环负载")
+    parser.add_argument("--concurrency", type=int, default=16, help="连接总数")
+    parser.add_argument("--rate", type=float, default=1000.0, help="开环模式下每秒发出的请求数")
+    parser.add_argument("--processes", type=int, help="客户端进程数（默认 CPU 核数与连接数中的较小值）")
+    parser.add_argument("--duration", type=float, default=10.0, help="每轮测量的秒数")
+    parser.add_argument("--warmup", type=float, default=2.0, help="每轮开始时不计入结果的秒数")
+    parser.add_argument("--books", type=int, default=1000, help="预置的书籍数")
+    parser.add_argument("--seed", type=int, default=1, help="随机数种子")
+    parser.add_argument("--server-args", default="", help="传给 server.server 的参数，例如 \"--engine asyncio\"")
+    parser.add_argument("--output", help="结果文件路径（默认 bench/results/load-<提交>-<时间>.json）")
+    parser.add_argument("--baseline", help="与之前保存的结果文件比较")
+    args = parser.parse_args(argv)
+    try:
+        mixes = [parse_mix(spec) for spec in args.mix]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.concurrency < 1 or args.duration <= 0 or (args.mode == "open" and args.rate <= 0):
+        parser.error("连接数、测量时间和速率必须为正数")
+    baseline = read_results(args.baseline, "load") if args.baseline else None
+
+    port = free_port()
+    server = start_server(port, shlex.split(args.server_args))
+    results = []
+    try:
+        book_ids = preload(port, args.books)
+        print(f"服务器 pid {server.pid}，端口 {port}，{len(book_ids)} 本书籍，CPU 核数 {os.cpu_count()}")
+        for mix in mixes:
+            result = measure(port, server.pid, book_ids, mix, args)
+            results.append(result)
+            print_result(run_label(result), result)
+    finally:
+        server.terminate()
+        try:
+            server.wait(30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    options = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    path = write_results(args.output, "load", options, results)
+    print(f"结果已保存到 {path}")
+    if baseline:
+        compare(results, baseline)
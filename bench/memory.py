@@ -0,0 +1,80 @@
+"""
+比较不同书籍存储方式每本书占用的内存
+
+    python -m bench.memory --books 200000
+"""
+import argparse
+import gc
+import tracemalloc
+
+from server.models.book import Book
+from server.models.columnar import ColumnarBookStore
+from server.models.database import Database
+
+
+class DictBook:
+    """带 __dict__ 的书籍类，即加 __slots__ 之前 Book 的内存布局"""
+
+    def __init__(self, book_id, title, author, publication_year, isbn):
+        self.book_id = book_id
+        self.title = title
+        self.author = author
+        self.publication_year = publication_year
+        self.isbn = isbn
+
+
+def book_fields(count):
+    # 每本书的字符串都是新对象，与解析 JSON 请求体得到的数据相同
+    for i in range(1, count + 1):
+        yield i, f"书籍标题{i}", f"作者{i % 5000}", 1950 + i % 70, f"978{i:010d}"
+
+
+def fill_dict(count, book_class):
+    store = {}
+    for fields in book_fields(count):
+        store[fields[0]] = book_class(*fields)
+    return store
+
+
+def fill_columnar(count):
+    store = ColumnarBookStore()
+    for fields in book_fields(count):
+        store[fields[0]] = Book(*fields)
+    return store
+
+
+def fill_database(count, compact):
+    db = Database(compact=compact)
+    db.add_books(Book(*fields) for fields in book_fields(count))
+    return db
+
+
+def measure(name, build, count):
+    gc.collect()
+    tracemalloc.start()
+    result = build(count)
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<28} {used / count:>8.1f} 字节/本")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="书籍存储内存占用基准测试")
+    parser.add_argument("--books", type=int, default=200000, help="书籍数量")
+    parser.add_argument("--with-indexes", action="store_true",
+                        help="同时测量包含二级索引和全文索引的完整 Database")
+    args = parser.parse_args(argv)
+
+    print(f"{args.books} 本书籍")
+    measure("dict + Book(__dict__)", lambda n: fill_dict(n, DictBook), args.books)
+    measure("dict + Book(__slots__)", lambda n: fill_dict(n, Book), args.books)
+    measure("ColumnarBookStore", fill_columnar, args.books)
+    if args.with_indexes:
+        measure("Database", lambda n: fill_database(n, False), args.books)
+        measure("Database(compact=True)", lambda n: fill_database(n, True), args.books)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+单个请求热点路径的微基准测试，结果保存后可以在不同提交之间比较
+
+    python -m bench.micro run --rows 1000 100000
+    python -m bench.micro run --filter view. --samples 30 --output new.json
+    python -m bench.micro compare old.json new.json
+
+每项测量先确定循环次数，使一个样本至少耗时 --min-time 秒，再重复采集
+--samples 个样本，保存每个样本的单次耗时（纳秒）。比较时对两组样本做
+Mann-Whitney U 检验：p 值小于 --alpha 且中位数的变化超过 --threshold
+才判定为显著的回退或改进，存在回退时以退出码 1 结束。
+
+数据库测量分别在 --rows 指定的书籍数下进行（默认 1K、100K 和 1M，100 万本
+书籍需要约 1.5 GB 内存，内存不足时可以只指定 --rows 1000 100000）。
+"""
+import argparse
+import gc
+import io
+import math
+import random
+import sys
+import time
+from http.client import parse_headers
+from statistics import median
+
+from bench.report import read_results, write_results
+from common import codec
+from server.controllers.book_controller import BookController
+from server.models.book import Book
+from server.models.database import Database
+from server.views.book_view import BookView, ROUTER
+
+BOOK = {"id": 42, "title": "Python编程：从入门到实践", "author": "埃里克·马瑟斯",
+        "publication_year": 2016, "isbn": "9787115428028"}
+
+
+def make_database(rows):
+    """包含 rows 本书籍的数据库
+
+    出版年份在 1950-2019 之间随机分布（固定随机种子），与真实数据一样
+    新书不总是最新的年份，索引的插入和删除代价不会被顺序数据掩盖。
+    """
+    rng = random.Random(rows)
+    database = Database()
+    database.add_books(
+        Book(None, f"书籍{i}", f"作者{i % 1000}", rng.randrange(1950, 2020), f"978{i:010d}")
+        for i in range(rows)
+    )
+    return database
+
+
+def make_handler(controller, body=b"", headers=None):
+    """不经过套接字构造一个请求处理器，响应写入内存"""
+    handler_class = BookView.create_handler_class(controller)
+    handler = handler_class.__new__(handler_class)
+    lines = "".join(f"{key}: {value}\r\n" for key, value in (headers or {}).items())
+    handler.headers = parse_headers(io.BytesIO(f"{lines}\r\n".encode("latin-1")))
+    handler.rfile = io.BytesIO(body)
+    handler.wfile = io.BytesIO()
+    handler.command = "GET"
+    handler.path = "/books/42"
+    handler.request_version = "HTTP/1.1"
+    handler.requestline = "GET /books/42 HTTP/1.1"
+    handler.client_address = ("127.0.0.1", 0)
+    handler.close_connection = False
+    handler.max_keepalive_requests = float("inf")
+    return handler
+
+
+def model_benchmarks():
+    book = Book.from_dict(BOOK)
+    yield "book.from_dict", lambda: Book.from_dict(BOOK)
+    yield "book.to_dict", book.to_dict
+
+
+def controller_benchmarks():
+    controller = BookController(make_database(1000))
+    data = dict(BOOK, isbn=None)
+    del data["id"]
+    yield "controller.get_book", lambda: controller.get_book("42")
+    yield "controller.get_book.invalid_id", lambda: controller.get_book("abc")
+    yield "controller.create_book", lambda: controller.create_book(data)
+    # 非字典请求体使 Book.from_dict 抛出异常，测量 try/except 的错误路径
+    yield "controller.create_book.invalid", lambda: controller.create_book([1, 2, 3])
+
+
+def view_benchmarks():
+    controller = BookController(make_database(1000))
+    yield "view.route_match", lambda: ROUTER.match("GET", "/books/42")
+    yield "view.route_match.not_found", lambda: ROUTER.match("GET", "/authors/42")
+
+    body = codec.dumps(BOOK)
+    handler = make_handler(controller, body, {"Content-Type": "application/json",
+                                              "Content-Length": len(body)})
+
+    def parse_body():
+        handler.rfile.seek(0)
+        return handler._parse_request_body()
+
+    yield "view.parse_request_body", parse_body
+
+    handler = make_handler(controller)
+    book = controller.get_book(42)[0]
+    books = [dict(book, id=i) for i in range(100)]
+
+    def send(data):
+        def run():
+            handler.wfile.seek(0)
+            handler.wfile.truncate()
+            handler._body_consumed = True
+            handler._send_response(200, data)
+        return run
+
+    yield "view.send_response", send(book)
+    yield "view.send_response.100_books", send(books)
+
+
+def database_benchmarks(rows):
+    database = make_database(rows)
+    rng = random.Random(1)
+    ids = [rng.randint(1, rows) for _ in range(1024)]
+    authors = [f"作者{rng.randrange(1000)}" for _ in range(1024)]
+    years = [rng.randrange(1950, 2020) for _ in range(1024)]
+    counter = iter(range(1 << 62))
+
+    def cycle(values):
+        return lambda: values[next(counter) % len(values)]
+
+    next_id, next_author, next_year = cycle(ids), cycle(authors), cycle(years)
+    prefix = f"database[{rows}]."
+    yield prefix + "get_book_by_id", lambda: database.get_book_by_id(next_id())
+    yield prefix + "get_books_page", lambda: database.get_books_page(next_id(), 100)
+    yield prefix + "find_books.author", lambda: database.find_books(author=next_author())
+
+    def find_year():
+        year = next_year()
+        return database.find_books(year_from=year, year_to=year)
+
+    yield prefix + "find_books.year", find_year
+    yield prefix + "search_books", lambda: database.search_books(next_author())
+
+    # 写入使用随机年份，每次修改都会把书籍移到年份索引的另一个位置
+    def update():
+        book_id = next_id()
+        database.update_book(book_id, Book(None, f"书籍{book_id}", "作者0", next_year(), None))
+
+    def add_and_delete():
+        book = database.add_book(Book(None, "新书", "作者0", next_year(), None))
+        database.delete_book(book.book_id)
+
+    yield prefix + "update_book", update
+    yield prefix + "add_book+delete_book", add_and_delete
+    yield prefix + "get_all_books", database.get_all_books
+
+
+def calibrate(func, min_time):
+    """使一个样本至少耗时 min_time 秒的循环次数"""
+    number = 1
+    while True:
+        elapsed = time_loop(func, number)
+        if elapsed >= min_time:
+            return number
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+
+
+def time_loop(func, number):
+    loop = range(number)
+    start = time.perf_counter()
+    for _ in loop:
+        func()
+    return time.perf_counter() - start
+
+
+def measure(func, samples, min_time):
+    """返回 samples 个样本的单次耗时（纳秒）"""
+    number = calibrate(func, min_time)
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return [time_loop(func, number) / number * 1e9 for _ in range(samples)]
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def mann_whitney(a, b):
+    """双侧 Mann-Whitney U 检验的 p 值，使用带并列修正和连续性修正的正态近似"""
+    n1, n2 = len(a), len(b)
+    n = n1 + n2
+    if n1 == 0 or n2 == 0:
+        return 1.0
+    combined = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    rank_sum, ties, i = 0.0, 0.0, 0
+    while i < n:
+        j = i
+        while j + 1 < n and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        # 并列的值取平均秩
+        rank = (i + j) / 2 + 1
+        rank_sum += rank * sum(1 for k in range(i, j + 1) if combined[k][1] == 0)
+        count = j - i + 1
+        ties += count ** 3 - count
+        i = j + 1
+    u = rank_sum - n1 * (n1 + 1) / 2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = max(abs(u - n1 * n2 / 2) - 0.5, 0) / math.sqrt(variance)
+    return math.erfc(z / math.sqrt(2))
+
+
+def run(args):
+    suites = [model_benchmarks, controller_benchmarks, view_benchmarks]
+    suites += [lambda rows=rows: database_benchmarks(rows) for rows in args.rows]
+    results = {}
+    for suite in suites:
+        for name, func in suite():
+            if args.filter and not any(pattern in name for pattern in args.filter):
+                continue
+            samples = measure(func, args.samples, args.min_time)
+            results[name] = {"unit": "ns", "median": median(samples), "samples": samples}
+            print(f"  {name:<42} {format_time(median(samples)):>12}")
+    options = {"samples": args.samples, "min_time": args.min_time, "rows": args.rows,
+               "filter": args.filter, "json_backend": codec.BACKEND}
+    path = write_results(args.output, "micro", options, results)
+    print(f"结果已保存到 {path}")
+
+
+def format_time(ns):
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("µs", 1e3)):
+        if ns >= scale:
+            return f"{ns / scale:.2f} {unit}"
+    return f"{ns:.0f} ns"
+
+
+# 环境元数据中不同时需要提醒的字段
+_ENVIRONMENT_KEYS = ("python", "implementation", "platform", "machine", "cpu_count")
+
+
+def compare(args):
+    old = read_results(args.old, "micro")
+    new = read_results(args.new, "micro")
+    for key in _ENVIRONMENT_KEYS:
+        if old["environment"].get(key) != new["environment"].get(key):
+            print(f"注意: 运行环境不同 {key}: {old['environment'].get(key)} -> {new['environment'].get(key)}")
+    if old["options"].get("json_backend") != new["options"].get("json_backend"):
+        print(f"注意: JSON 后端不同 {old['options'].get('json_backend')} -> {new['options'].get('json_backend')}")
+    print(f"{old['environment'].get('commit') or '?'} -> {new['environment'].get('commit') or '?'}")
+
+    regressions = 0
+    for name, result in new["results"].items():
+        baseline = old["results"].get(name)
+        if baseline is None:
+            continue
+        before, after = baseline["median"], result["median"]
+        delta = (after - before) / before * 100
+        p = mann_whitney(baseline["samples"], result["samples"])
+        verdict = ""
+        if p < args.alpha and abs(delta) >= args.threshold:
+            verdict = "回退" if delta > 0 else "改进"
+            regressions += delta > 0
+        print(f"  {name:<42} {format_time(before):>10} -> {format_time(after):>10}  "
+              f"{delta:+7.1f}%  p={p:.3g}  {verdict}")
+    if regressions:
+        print(f"{regressions} 项显著回退")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.micro", description="热点路径微基准测试")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="运行微基准测试并保存结果")
+    run_parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000, 1000000],
+                            help="数据库测量使用的书籍数")
+    run_parser.add_argument("--samples", type=int, default=20, help="每项的样本数")
+    run_parser.add_argument("--min-time", type=float, default=0.05, help="每个样本的最短秒数")
+    run_parser.add_argument("--filter", nargs="+", help="只运行名称包含这些字符串之一的测量")
+    run_parser.add_argument("--output", help="结果文件路径（默认 bench/results/micro-<提交>-<时间>.json）")
+
+    compare_parser = commands.add_parser("compare", help="比较两次运行的结果")
+    compare_parser.add_argument("old", help="基准结果文件")
+    compare_parser.add_argument("new", help="新的结果文件")
+    compare_parser.add_argument("--alpha", type=float, default=0.01, help="显著性水平")
+    compare_parser.add_argument("--threshold", type=float, default=5.0,
+                                help="中位数变化至少达到该百分比才报告")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        if args.samples < 2 or args.min_time <= 0:
+            parser.error("样本数至少为 2，每个样本的最短时间必须为正数")
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+基准测试结果的保存和读取
+
+结果保存为 JSON，包含运行环境（提交号、Python 版本、平台、CPU 核数）
+和各项测量值，用于比较不同提交之间的性能变化。
+"""
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 未指定 --output 时结果保存的目录
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+
+def git_commit():
+    """返回 (提交号, 工作区是否有未提交的修改)，不在 git 仓库中时返回 (None, None)"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def environment():
+    """描述运行环境的元数据"""
+    commit, dirty = git_commit()
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def default_path(kind):
+    """bench/results/<kind>-<提交号前 8 位>-<时间>.json"""
+    commit, dirty = git_commit()
+    label = (commit or "unknown")[:8] + ("-dirty" if dirty else "")
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(RESULTS_DIR, f"{kind}-{label}-{stamp}.json")
+
+
+def write_results(path, kind, options, results):
+    """保存一次运行的结果，返回写入的路径"""
+    path = path or default_path(kind)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    document = {"kind": kind, "environment": environment(), "options": options, "results": results}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    return path
+
+
+def read_results(path, kind):
+    """读取之前保存的结果，类型不符时抛出 ValueError"""
+    with open(path, encoding="utf-8") as f:
+        document = json.load(f)
+    if document.get("kind") != kind:
+        raise ValueError(f"{path} 不是 {kind} 基准测试的结果")
+    return document
+
+
+def change(current, baseline):
+    """相对变化的百分比，基准值为 0 或缺失时返回 None"""
+    if not baseline or current is None:
+        return None
+    return (current - baseline) / baseline * 100
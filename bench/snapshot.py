@@ -0,0 +1,67 @@
+"""
+测量读写并发时写入的吞吐量和点查询的延迟
+
+    python -m bench.snapshot --books 100000 --readers 0 2
+
+读者线程不停地获取完整列表（相当于导出）。默认存储的完整列表读取
+快照，不持有数据库锁；紧凑存储先在内部锁内复制各列。单核机器上读者
+和写入方同样要争抢 GIL，吞吐量的下降主要来自 CPU 时间的分摊。
+"""
+import argparse
+import threading
+import time
+
+from bench.storage import make_books
+from server.models.book import Book
+from server.models.database import Database
+
+
+def measure(db, readers, writes):
+    """返回 (写入 ops/s, 点查询最大延迟毫秒, 读者完成的完整列表次数)"""
+    stop = threading.Event()
+    listings = [0] * readers
+
+    def read_all(slot):
+        while not stop.is_set():
+            db.get_all_books()
+            listings[slot] += 1
+
+    threads = [threading.Thread(target=read_all, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    try:
+        worst = 0.0
+        start = time.perf_counter()
+        for i in range(writes):
+            book = db.add_book(Book(None, f"新书{i}", "作者", 2024, None))
+            before = time.perf_counter()
+            db.get_book_by_id(book.book_id)
+            worst = max(worst, time.perf_counter() - before)
+            db.delete_book(book.book_id)
+        elapsed = time.perf_counter() - start
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return writes * 2 / elapsed, worst * 1000, sum(listings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="读写并发基准测试")
+    parser.add_argument("--books", type=int, default=100000, help="预先导入的书籍数")
+    parser.add_argument("--writes", type=int, default=2000, help="添加并删除的书籍数")
+    parser.add_argument("--readers", type=int, nargs="+", default=[0, 2], help="获取完整列表的读者线程数")
+    args = parser.parse_args(argv)
+
+    for compact in (False, True):
+        db = Database(compact=compact)
+        db.add_books(make_books(args.books))
+        print(f"{'Database(compact=True)' if compact else 'Database'} ({args.books} 本书籍)")
+        for readers in args.readers:
+            throughput, worst, listings = measure(db, readers, args.writes)
+            print(f"  {readers} 个读者  写入 {throughput:>8.0f} ops/s  "
+                  f"点查询最大延迟 {worst:>7.2f} ms  完整列表 {listings} 次")
+
+
+if __name__ == "__main__":
+    main()
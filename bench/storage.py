@@ -0,0 +1,64 @@
+"""
+比较不同存储后端的写入、批量导入和查询吞吐量
+
+    python -m bench.storage --books 20000
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+from server.models.book import Book
+from server.models.database import Database
+from server.models.persistence import PersistentDatabase
+from server.models.sqlite_database import SQLiteDatabase
+
+
+def make_books(count, offset=0):
+    return [
+        Book(None, f"书籍{i}", f"作者{i % 500}", 1950 + i % 70, f"978{i:010d}")
+        for i in range(offset, offset + count)
+    ]
+
+
+def measure(name, func, count):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<16} {count / elapsed:>10.0f} ops/s")
+
+
+def run(name, db, books):
+    print(name)
+    bulk = make_books(books)
+    single = make_books(books // 10, offset=books)
+    ids = [random.randint(1, books) for _ in range(books)]
+    authors = [f"作者{random.randrange(500)}" for _ in range(books // 10)]
+
+    measure("add_books", lambda: db.add_books(bulk), len(bulk))
+    measure("add_book", lambda: [db.add_book(book) for book in single], len(single))
+    measure("get_book_by_id", lambda: [db.get_book_by_id(book_id) for book_id in ids], len(ids))
+    measure("find_books", lambda: [db.find_books(author=author) for author in authors], len(authors))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="存储后端基准测试")
+    parser.add_argument("--books", type=int, default=20000, help="批量导入的书籍数")
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix="bench-storage-")
+    try:
+        run("memory", Database(), args.books)
+        db = PersistentDatabase(f"{data_dir}/wal")
+        run("memory+wal", db, args.books)
+        db.close()
+        db = SQLiteDatabase(f"{data_dir}/books.db")
+        run("sqlite", db, args.books)
+        db.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
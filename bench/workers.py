@@ -0,0 +1,99 @@
+"""
+比较不同工作进程数下的请求吞吐量（多进程模式，SO_REUSEPORT）
+
+    python -m bench.workers --workers 1 2 4 --clients 8 --duration 5
+
+客户端同样运行在多个进程中，避免客户端自身受 GIL 限制成为瓶颈。每个
+客户端进程使用一个长连接，内核按连接在工作进程之间分配，客户端数应为
+最大工作进程数的数倍。吞吐量能否随进程数增长取决于机器的 CPU 核数。
+"""
+import argparse
+import http.client
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+
+from server.supervisor import Supervisor
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def run_supervisor(workers, port, data_dir):
+    logging.disable(logging.INFO)
+    Supervisor(workers, host="localhost", port=port, storage="sqlite", data_dir=data_dir,
+               access_log=None).run()
+
+
+def run_client(port, path, duration):
+    """在一个长连接上重复请求 duration 秒，返回完成的请求数"""
+    deadline = time.monotonic() + duration
+    count = 0
+    conn = http.client.HTTPConnection("localhost", port)
+    while time.monotonic() < deadline:
+        conn.request("GET", path)
+        conn.getresponse().read()
+        count += 1
+        # 服务器按 max_keepalive_requests 关闭连接时重新连接
+        if count % 500 == 0:
+            conn.close()
+            conn = http.client.HTTPConnection("localhost", port)
+    conn.close()
+    return count
+
+
+def wait_ready(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("localhost", port, timeout=1)
+            conn.request("GET", "/books/1")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("服务器未能启动")
+
+
+def measure(workers, clients, path, duration):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as data_dir:
+        supervisor = multiprocessing.Process(target=run_supervisor, args=(workers, port, data_dir))
+        supervisor.start()
+        try:
+            wait_ready(port)
+            with multiprocessing.Pool(clients) as pool:
+                start = time.perf_counter()
+                counts = pool.starmap(run_client, [(port, path, duration)] * clients)
+                elapsed = time.perf_counter() - start
+        finally:
+            # SIGTERM 触发主进程的优雅退出
+            supervisor.terminate()
+            supervisor.join()
+    return sum(counts) / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多进程模式吞吐量基准测试")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="工作进程数")
+    parser.add_argument("--clients", type=int, default=8, help="客户端进程数")
+    parser.add_argument("--duration", type=float, default=5.0, help="每种配置的测量秒数")
+    parser.add_argument("--path", default="/books/1", help="请求的路径")
+    args = parser.parse_args(argv)
+
+    print(f"CPU 核数: {os.cpu_count()}，客户端进程: {args.clients}，GET {args.path}")
+    baseline = None
+    for workers in args.workers:
+        throughput = measure(workers, args.clients, args.path, args.duration)
+        baseline = baseline or throughput
+        print(f"  {workers:>3} 个工作进程 {throughput:>10.0f} req/s  {throughput / baseline:>5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
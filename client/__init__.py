@@ -1,3 +1,4 @@
 from client.book_client import BookClient
+from client.async_book_client import AsyncBookClient
 
-__all__ = ['BookClient'] 
\ No newline at end of file
+__all__ = ['BookClient', 'AsyncBookClient']
@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import zlib
+from urllib.parse import urlsplit
+
+from common import codec
+
+logger = logging.getLogger(__name__)
+
+# 单次 gather_books 在一个连接上连续发送的最大请求数
+DEFAULT_PIPELINE_DEPTH = 32
+
+# 复用的连接失效时可以重发的请求方法：服务器可能已经处理了请求，
+# 只有不修改数据的请求重发后结果不变
+RETRY_METHODS = frozenset(('GET', 'HEAD'))
+
+# 接受的响应压缩编码及对应的 zlib wbits
+ACCEPT_ENCODING = 'gzip, deflate'
+_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+class HTTPError(Exception):
+    """服务器返回了错误状态码"""
+
+    def __init__(self, status, message):
+        self.status = status
+        super().__init__(f"{status} 错误: {message}")
+
+
+class _Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return codec.loads(self.body) if self.body else {}
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            try:
+                message = self.json().get('message', '')
+            except ValueError:
+                message = ''
+            raise HTTPError(self.status, message)
+
+
+class _Connection:
+    """一个HTTP/1.1长连接，同一时间只处理一组请求"""
+
+    def __init__(self, host, port, reader, writer):
+        self.host = host
+        self.port = port
+        self.reader = reader
+        self.writer = writer
+        self.reusable = True
+        self.requests_sent = 0
+
+    @classmethod
+    async def open(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(host, port, reader, writer)
+
+    def _encode_request(self, method, path, body=None):
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Accept: application/json",
+            f"Accept-Encoding: {ACCEPT_ENCODING}",
+        ]
+        if body is not None:
+            lines.append("Content-Type: application/json")
+            lines.append(f"Content-Length: {len(body)}")
+        elif method in ('POST', 'PUT', 'PATCH'):
+            lines.append("Content-Length: 0")
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        return head + body if body is not None else head
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("服务器关闭了连接")
+        parts = status_line.decode('latin-1').split(None, 2)
+        status = int(parts[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked_body()
+        elif status == 204 or status == 304:
+            body = b''
+        else:
+            body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+
+        encoding = headers.get('content-encoding', '').lower()
+        if body and encoding in _WBITS:
+            body = zlib.decompress(body, _WBITS[encoding])
+
+        if headers.get('connection', '').lower() == 'close':
+            self.reusable = False
+        return _Response(status, headers, body)
+
+    async def _read_chunked_body(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';', 1)[0], 16)
+            if size == 0:
+                # 跳过可能存在的 trailer 直到空行
+                while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+    async def request(self, method, path, body=None):
+        responses = await self.pipeline([(method, path, body)])
+        return responses[0]
+
+    async def pipeline(self, requests):
+        """一次写入多个请求，再按顺序读取全部响应"""
+        self.writer.write(b''.join(self._encode_request(*req) for req in requests))
+        self.requests_sent += len(requests)
+        await self.writer.drain()
+        responses = []
+        for _ in requests:
+            responses.append(await self._read_response())
+        return responses
+
+    def close(self):
+        self.reusable = False
+        self.writer.close()
+
+
+class _ConnectionPool:
+    """按需创建、最多保留 max_connections 个空闲连接的连接池"""
+
+    def __init__(self, host, port, max_connections):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def acquire(self):
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                conn = self._idle.pop()
+                if conn.reusable and not conn.reader.at_eof():
+                    return conn
+                conn.close()
+            return await _Connection.open(self.host, self.port)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        if conn.reusable:
+            self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def close(self):
+        for conn in self._idle:
+            conn.close()
+        self._idle = []
+
+
+class AsyncBookClient:
+    """基于 asyncio streams 的异步书籍服务客户端
+
+    方法与 BookClient 一致，返回 (data, error) 元组。请求通过少量
+    HTTP/1.1 长连接发送，max_concurrency 限制同时进行中的请求数
+    （gather_books 在一个连接上流水线发送的一组请求算作一个）：
+
+        async with AsyncBookClient() as client:
+            book, error = await client.get_book(1)
+            results = await client.gather_books([1, 2, 3])
+    """
+
+    def __init__(self, base_url='http://localhost:8000', max_connections=8,
+                 max_concurrency=100, timeout=30.0,
+                 pipeline_depth=DEFAULT_PIPELINE_DEPTH):
+        parsed = urlsplit(base_url)
+        self.base_url = base_url
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 80
+        self.base_path = parsed.path.rstrip('/')
+        self.timeout = timeout
+        self.pipeline_depth = pipeline_depth
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self._pool = None
+        self._limiter = None
+
+    def _ensure_pool(self):
+        # 连接池和信号量必须在事件循环中创建
+        if self._pool is None:
+            self._pool = _ConnectionPool(self.host, self.port, self.max_connections)
+            self._limiter = asyncio.Semaphore(self.max_concurrency)
+        return self._pool
+
+    async def close(self):
+        """关闭所有空闲连接"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _send(self, requests):
+        """在一个连接上发送一组请求
+
+        复用的连接已被服务器关闭时，只有全部是 GET/HEAD 的请求组重试一次；
+        写请求可能已经被服务器处理，直接报告错误。
+        """
+        pool = self._ensure_pool()
+        retry = all(method in RETRY_METHODS for method, _, _ in requests)
+        for attempt in range(2):
+            conn = await pool.acquire()
+            reused = conn.requests_sent > 0
+            try:
+                responses = await asyncio.wait_for(conn.pipeline(requests), self.timeout)
+                pool.release(conn)
+                return responses
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                conn.close()
+                pool.release(conn)
+                if not reused or not retry or attempt == 1:
+                    raise
+                logger.debug(f"长连接已失效，重新连接: {e}")
+            except BaseException:
+                conn.close()
+                pool.release(conn)
+                raise
+
+    async def _request(self, method, path, data=None):
+        body = codec.dumps(data) if data is not None else None
+        self._ensure_pool()
+        async with self._limiter:
+            responses = await self._send([(method, self.base_path + path, body)])
+        return responses[0]
+
+    async def get_all_books(self):
+        """获取所有书籍"""
+        try:
+            response = await self._request('GET', '/books')
+            response.raise_for_status()
+            return response.json().get('data', []), None
+        except (OSError, asyncio.TimeoutError, HTTPError, asyncio.IncompleteReadError) as e:
+            logger.error(f"获取所有书籍时出错: {e}")
+            return None, str(e) or e.__class__.__name__
+        except ValueError:
+            logger.error("解析服务器响应时出错")
+            return None, "无效的服务器响应"
+
+    async def get_book(self, book_id):
+        """获取单本书籍"""
+        try:
+            response = await self._request('GET', f"/books/{book_id}")
+            response.raise_for_status()
+            return response.json().get('data', {}), None
+        except (OSError, asyncio.TimeoutError, HTTPError, asyncio.IncompleteReadError) as e:
+            logger.error(f"获取书籍 ID={book_id} 时出错: {e}")
+            return None, str(e) or e.__class__.__name__
+        except ValueError:
+            logger.error("解析服务器响应时出错")
+            return None, "无效的服务器响应"
+
+    async def create_book(self, book_data):
+        """创建新书籍"""
+        try:
+            response = await self._request('POST', '/books', book_data)
+            response.raise_for_status()
+            return response.json().get('data', {}), None
+        except (OSError, asyncio.TimeoutError, HTTPError, asyncio.IncompleteReadError) as e:
+            logger.error(f"创建书籍时出错: {e}")
+            return None, str(e) or e.__class__.__name__
+        except ValueError:
+            logger.error("解析服务器响应时出错")
+            return None, "无效的服务器响应"
+
+    async def update_book(self, book_id, book_data):
+        """部分更新书籍（PATCH），未提供的字段保持不变"""
+        return await self._save_book('PATCH', book_id, book_data)
+
+    async def replace_book(self, book_id, book_data):
+        """整体替换书籍（PUT），未提供的字段被清空"""
+        return await self._save_book('PUT', book_id, book_data)
+
+    async def _save_book(self, method, book_id, book_data):
+        try:
+            response = await self._request(method, f"/books/{book_id}", book_data)
+            response.raise_for_status()
+            return response.json().get('data', {}), None
+        except (OSError, asyncio.TimeoutError, HTTPError, asyncio.IncompleteReadError) as e:
+            logger.error(f"更新书籍 ID={book_id} 时出错: {e}")
+            return None, str(e) or e.__class__.__name__
+        except ValueError:
+            logger.error("解析服务器响应时出错")
+            return None, "无效的服务器响应"
+
+    async def delete_book(self, book_id):
+        """删除书籍"""
+        try:
+            response = await self._request('DELETE', f"/books/{book_id}")
+            response.raise_for_status()
+            return True, None
+        except (OSError, asyncio.TimeoutError, HTTPError, asyncio.IncompleteReadError) as e:
+            logger.error(f"删除书籍 ID={book_id} 时出错: {e}")
+            return False, str(e) or e.__class__.__name__
+
+    async def gather_books(self, book_ids):
+        """批量获取书籍，返回与 book_ids 顺序一致的 (data, error) 列表
+
+        请求按 pipeline_depth 分组，每组在一个长连接上流水线发送，
+        各组并发使用连接池中的连接，同时进行的组数受 max_concurrency 限制。
+        """
+        book_ids = list(book_ids)
+        groups = [
+            book_ids[i:i + self.pipeline_depth]
+            for i in range(0, len(book_ids), self.pipeline_depth)
+        ]
+        results = await asyncio.gather(*(self._gather_group(group) for group in groups))
+        return [item for group_results in results for item in group_results]
+
+    async def _gather_group(self, book_ids):
+        requests = [('GET', f"{self.base_path}/books/{book_id}", None) for book_id in book_ids]
+        self._ensure_pool()
+        try:
+            async with self._limiter:
+                responses = await self._send(requests)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            logger.error(f"批量获取书籍时出错: {e}")
+            error = str(e) or e.__class__.__name__
+            return [(None, error) for _ in book_ids]
+
+        results = []
+        for response in responses:
+            try:
+                response.raise_for_status()
+                results.append((response.json().get('data', {}), None))
+            except HTTPError as e:
+                results.append((None, str(e)))
+            except ValueError:
+                results.append((None, "无效的服务器响应"))
+        return results
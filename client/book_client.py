@@ -1,88 +1,383 @@
-import json
+import itertools
+import threading
 import requests
 import logging
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common import codec, msgpack_codec
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# 可以安全重试的请求方法；POST 不是幂等的，只在连接建立失败时重试
+RETRY_METHODS = frozenset(['GET', 'PUT', 'DELETE', 'HEAD', 'OPTIONS'])
+# 服务器繁忙或网关错误时重试
+RETRY_STATUS_CODES = (502, 503, 504)
+# 分页遍历时每页的条目数
+DEFAULT_PAGE_SIZE = 100
+# 批量操作每个请求包含的条目数，与服务器的 MAX_BATCH_SIZE 一致
+DEFAULT_BATCH_SIZE = 1000
+# 本地最多保存的带 ETag 的响应数
+DEFAULT_VALIDATOR_CACHE_SIZE = 1024
+# 请求体和响应体的数据格式，msgpack 编码后体积更小，安装了 msgpack 库时编解码也更快
+WIRE_FORMATS = {
+    'json': codec,
+    'msgpack': msgpack_codec,
+}
+# 按响应的 Content-Type 选择解码方式，未知类型按 JSON 解码
+_DECODERS = {
+    msgpack_codec.CONTENT_TYPE: msgpack_codec.loads,
+    msgpack_codec.LEGACY_CONTENT_TYPE: msgpack_codec.loads,
+}
+
+def decode_body(content, content_type):
+    """按 Content-Type 解码响应体"""
+    media_type = content_type.partition(';')[0].strip().lower() if isinstance(content_type, str) else None
+    return _DECODERS.get(media_type, codec.loads)(content)
+
 class BookClient:
-    def __init__(self, base_url='http://localhost:8000'):
+    """书籍服务客户端
+
+    所有请求通过同一个 requests.Session 发送，底层连接池复用长连接。
+    可以作为上下文管理器使用，退出时关闭连接池：
+
+        with BookClient() as client:
+            book, error = client.get_book(1)
+    
+    get_book 和 get_all_books 会在本地保存带 ETag 的响应，再次请求时发送
+    If-None-Match，数据未变化时服务器只返回 304 响应头。
+    
+    wire_format='msgpack' 时请求体和响应体使用 MessagePack 编码，适合服务间调用。
+    """
+    
+    def __init__(self, base_url='http://localhost:8000', pool_size=10,
+                 timeout=(3.05, 30), max_retries=3, backoff_factor=0.2,
+                 keep_alive=True, validator_cache_size=DEFAULT_VALIDATOR_CACHE_SIZE,
+                 wire_format='json'):
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"不支持的数据格式: {wire_format}")
         self.base_url = base_url
         self.books_url = f"{base_url}/books"
+        self.batch_url = f"{base_url}/books:batch"
+        # 连接超时和读取超时，可以是单个数值或 (connect, read) 元组
+        self.timeout = timeout
+        self.session = self._create_session(pool_size, max_retries, backoff_factor, keep_alive)
+        self.wire_format = WIRE_FORMATS[wire_format]
+        if wire_format != 'json':
+            self.session.headers['Accept'] = self.wire_format.CONTENT_TYPE
+        # URL -> (ETag, 响应体, Content-Type)，按最近使用排序
+        self.validator_cache_size = validator_cache_size
+        self._validators = OrderedDict()
+        self._validators_lock = threading.Lock()
+    
+    @staticmethod
+    def _create_session(pool_size, max_retries, backoff_factor, keep_alive):
+        """创建带连接池和重试策略的会话"""
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=RETRY_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+    
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    @staticmethod
+    def _decode(response):
+        return decode_body(response.content, response.headers.get('Content-Type'))
+    
+    def _remember(self, url, response):
+        """保存带 ETag 的响应体，超过上限时淘汰最久未使用的"""
+        etag = response.headers.get('ETag')
+        if not etag or not self.validator_cache_size:
+            return
+        with self._validators_lock:
+            self._validators[url] = (etag, response.content, response.headers.get('Content-Type'))
+            self._validators.move_to_end(url)
+            while len(self._validators) > self.validator_cache_size:
+                self._validators.popitem(last=False)
+    
+    def _forget(self, url):
+        with self._validators_lock:
+            self._validators.pop(url, None)
+    
+    def _conditional_get(self, url):
+        """发送条件 GET 请求，返回解析后的响应体
+
+        本地有该 URL 的 ETag 时带上 If-None-Match，服务器返回 304 则使用本地保存的响应体。
+        """
+        with self._validators_lock:
+            cached = self._validators.get(url)
+        if cached is None:
+            response = self.session.get(url, timeout=self.timeout)
+        else:
+            response = self.session.get(url, headers={'If-None-Match': cached[0]}, timeout=self.timeout)
+            if response.status_code == 304:
+                with self._validators_lock:
+                    if url in self._validators:
+                        self._validators.move_to_end(url)
+                return decode_body(cached[1], cached[2])
+        response.raise_for_status()
+        body = self._decode(response)
+        self._remember(url, response)
+        return body
+    
+    def get_book_etag(self, book_id):
+        """返回本地保存的书籍 ETag，可用于 update_book/delete_book 的乐观并发控制"""
+        with self._validators_lock:
+            cached = self._validators.get(f"{self.books_url}/{book_id}")
+        return cached[0] if cached else None
     
     def get_all_books(self):
         """获取所有书籍"""
         try:
-            response = requests.get(self.books_url)
-            response.raise_for_status()
-            return response.json().get('data', []), None
+            return self._conditional_get(self.books_url).get('data', []), None
         except requests.exceptions.RequestException as e:
             logger.error(f"获取所有书籍时出错: {e}")
             return None, str(e)
-        except json.JSONDecodeError:
+        except codec.DecodeError:
             logger.error("解析服务器响应时出错")
             return None, "无效的服务器响应"
     
+    def find_books(self, author=None, isbn=None, year_from=None, year_to=None, fields=None):
+        """按作者、ISBN和出版年份范围在服务器端查询书籍"""
+        params = {
+            'author': author,
+            'isbn': isbn,
+            'year_from': year_from,
+            'year_to': year_to,
+            'fields': ','.join(fields) if fields else None
+        }
+        try:
+            response = self.session.get(
+                self.books_url,
+                params={k: v for k, v in params.items() if v is not None},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return self._decode(response).get('data', []), None
+        except requests.exceptions.RequestException as e:
+            logger.error(f"查询书籍时出错: {e}")
+            return None, str(e)
+        except codec.DecodeError:
+            logger.error("解析服务器响应时出错")
+            return None, "无效的服务器响应"
+    
+    def search_books(self, query, limit=20):
+        """全文检索标题和作者，结果按相关度排序"""
+        try:
+            response = self.session.get(
+                f"{self.books_url}/search",
+                params={'q': query, 'limit': limit},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return self._decode(response).get('data', []), None
+        except requests.exceptions.RequestException as e:
+            logger.error(f"检索书籍时出错: {e}")
+            return None, str(e)
+        except codec.DecodeError:
+            logger.error("解析服务器响应时出错")
+            return None, "无效的服务器响应"
+    
+    def get_books_page(self, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None):
+        """获取一页书籍，返回 ((书籍列表, 下一页游标), 错误信息)"""
+        params = {'limit': limit}
+        if cursor:
+            params['cursor'] = cursor
+        if fields:
+            params['fields'] = ','.join(fields)
+        try:
+            response = self.session.get(self.books_url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            body = self._decode(response)
+            return (body.get('data', []), body.get('next_cursor')), None
+        except requests.exceptions.RequestException as e:
+            logger.error(f"分页获取书籍时出错: {e}")
+            return None, str(e)
+        except codec.DecodeError:
+            logger.error("解析服务器响应时出错")
+            return None, "无效的服务器响应"
+    
+    def iter_pages(self, page_size=DEFAULT_PAGE_SIZE, fields=None):
+        """逐页遍历所有书籍，每次只请求一页
+
+        出错时抛出 requests.exceptions.RequestException。
+        """
+        cursor = None
+        while True:
+            page, error = self.get_books_page(page_size, cursor, fields)
+            if error:
+                raise requests.exceptions.RequestException(error)
+            books, cursor = page
+            if books:
+                yield books
+            if not cursor:
+                return
+    
+    def iter_books(self, page_size=DEFAULT_PAGE_SIZE, fields=None):
+        """按ID顺序逐本遍历所有书籍，按需分页请求"""
+        for books in self.iter_pages(page_size, fields):
+            yield from books
+    
+    def stream_books(self, fields=None):
+        """以NDJSON流的方式逐本读取全部书籍，内存占用与书籍总数无关
+
+        出错时抛出 requests.exceptions.RequestException。
+        """
+        params = {'fields': ','.join(fields)} if fields else None
+        response = self.session.get(
+            self.books_url,
+            params=params,
+            headers={'Accept': 'application/x-ndjson'},
+            stream=True,
+            timeout=self.timeout
+        )
+        with response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield codec.loads(line)
+    
     def get_book(self, book_id):
         """获取单本书籍"""
         try:
             url = f"{self.books_url}/{book_id}"
-            response = requests.get(url)
-            response.raise_for_status()
-            return response.json().get('data', {}), None
+            return self._conditional_get(url).get('data', {}), None
         except requests.exceptions.RequestException as e:
             logger.error(f"获取书籍 ID={book_id} 时出错: {e}")
             return None, str(e)
-        except json.JSONDecodeError:
+        except codec.DecodeError:
             logger.error("解析服务器响应时出错")
             return None, "无效的服务器响应"
     
     def create_book(self, book_data):
         """创建新书籍"""
         try:
-            response = requests.post(
+            response = self.session.post(
                 self.books_url,
-                json=book_data,
-                headers={'Content-Type': 'application/json'}
+                data=self.wire_format.dumps(book_data),
+                headers={'Content-Type': self.wire_format.CONTENT_TYPE},
+                timeout=self.timeout
             )
             response.raise_for_status()
-            return response.json().get('data', {}), None
+            return self._decode(response).get('data', {}), None
         except requests.exceptions.RequestException as e:
             logger.error(f"创建书籍时出错: {e}")
             return None, str(e)
-        except json.JSONDecodeError:
+        except codec.DecodeError:
             logger.error("解析服务器响应时出错")
             return None, "无效的服务器响应"
     
-    def update_book(self, book_id, book_data):
-        """更新书籍"""
+    def update_book(self, book_id, book_data, etag=None):
+        """部分更新书籍（PATCH），未提供的字段保持不变
+
+        指定 etag 时只在书籍仍是该版本时更新，否则服务器返回 412。
+        """
+        return self._save_book(self.session.patch, book_id, book_data, etag)
+    
+    def replace_book(self, book_id, book_data, etag=None):
+        """整体替换书籍（PUT），未提供的字段被清空"""
+        return self._save_book(self.session.put, book_id, book_data, etag)
+    
+    def _save_book(self, send, book_id, book_data, etag):
         try:
             url = f"{self.books_url}/{book_id}"
-            response = requests.put(
+            headers = {'Content-Type': self.wire_format.CONTENT_TYPE}
+            if etag:
+                headers['If-Match'] = etag
+            response = send(
                 url,
-                json=book_data,
-                headers={'Content-Type': 'application/json'}
+                data=self.wire_format.dumps(book_data),
+                headers=headers,
+                timeout=self.timeout
             )
             response.raise_for_status()
-            return response.json().get('data', {}), None
+            self._remember(url, response)
+            return self._decode(response).get('data', {}), None
         except requests.exceptions.RequestException as e:
             logger.error(f"更新书籍 ID={book_id} 时出错: {e}")
             return None, str(e)
-        except json.JSONDecodeError:
+        except codec.DecodeError:
             logger.error("解析服务器响应时出错")
             return None, "无效的服务器响应"
     
-    def delete_book(self, book_id):
-        """删除书籍"""
+    def delete_book(self, book_id, etag=None):
+        """删除书籍，指定 etag 时只在书籍仍是该版本时删除"""
         try:
             url = f"{self.books_url}/{book_id}"
-            response = requests.delete(url)
+            if etag:
+                response = self.session.delete(url, headers={'If-Match': etag}, timeout=self.timeout)
+            else:
+                response = self.session.delete(url, timeout=self.timeout)
             response.raise_for_status()
+            self._forget(url)
             return True, None
         except requests.exceptions.RequestException as e:
             logger.error(f"删除书籍 ID={book_id} 时出错: {e}")
-            return False, str(e) 
\ No newline at end of file
+            return False, str(e)
+    
+    def _send_batch(self, method, items, chunk_size):
+        """按 chunk_size 分块发送批量请求，返回所有块的逐项结果
+
+        某一块失败时返回此前已完成的结果和错误信息，调用方可以据此续传。
+        """
+        results = []
+        iterator = iter(items)
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                return results, None
+            try:
+                response = self.session.request(
+                    method,
+                    self.batch_url,
+                    data=self.wire_format.dumps(chunk),
+                    headers={'Content-Type': self.wire_format.CONTENT_TYPE},
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                results.extend(self._decode(response).get('data', []))
+            except requests.exceptions.RequestException as e:
+                logger.error(f"批量操作 {method} 在第 {len(results) + 1} 项附近出错: {e}")
+                return results, str(e)
+            except codec.DecodeError:
+                logger.error("解析服务器响应时出错")
+                return results, "无效的服务器响应"
+    
+    def create_books(self, books, chunk_size=DEFAULT_BATCH_SIZE):
+        """批量创建书籍，books 可以是任意可迭代对象"""
+        return self._send_batch('POST', books, chunk_size)
+    
+    def update_books(self, books, chunk_size=DEFAULT_BATCH_SIZE):
+        """批量部分更新书籍，每项必须包含 id，未提供的字段保持不变"""
+        return self._send_batch('PATCH', books, chunk_size)
+    
+    def replace_books(self, books, chunk_size=DEFAULT_BATCH_SIZE):
+        """批量整体替换书籍，每项必须包含 id"""
+        return self._send_batch('PUT', books, chunk_size)
+    
+    def delete_books(self, book_ids, chunk_size=DEFAULT_BATCH_SIZE):
+        """批量删除书籍"""
+        return self._send_batch('DELETE', book_ids, chunk_size)
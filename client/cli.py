@@ -2,15 +2,11 @@ import argparse
 import json
 import sys
 import logging
+import requests
 from tabulate import tabulate
 
 from client.book_client import BookClient
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 def print_books(books):
@@ -33,6 +29,19 @@ def print_books(books):
     
     print(tabulate(table_data, headers=headers, tablefmt="grid"))
 
+def list_books(client, page_size):
+    """逐页获取并打印书籍，不会一次性加载全部数据"""
+    found = False
+    try:
+        for books in client.iter_pages(page_size):
+            found = True
+            print_books(books)
+    except requests.exceptions.RequestException as e:
+        print(f"错误: {e}")
+        return
+    if not found:
+        print("没有找到书籍")
+
 def print_book(book):
     """打印单本书籍的详细信息"""
     if not book:
@@ -65,6 +74,10 @@ def get_book_input():
     return book
 
 def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     parser = argparse.ArgumentParser(description="书籍管理客户端")
     parser.add_argument("--host", default="localhost", help="服务器主机")
     parser.add_argument("--port", type=int, default=8000, help="服务器端口")
@@ -72,7 +85,8 @@ def main():
     subparsers = parser.add_subparsers(dest="command", help="子命令")
     
     # 列出所有书籍
-    subparsers.add_parser("list", help="列出所有书籍")
+    list_parser = subparsers.add_parser("list", help="列出所有书籍")
+    list_parser.add_argument("--page-size", type=int, default=100, help="每页书籍数")
     
     # 获取单本书籍
     get_parser = subparsers.add_parser("get", help="获取单本书籍")
@@ -107,11 +121,7 @@ def main():
     client = BookClient(base_url)
     
     if args.command == "list":
-        books, error = client.get_all_books()
-        if books:
-            print_books(books)
-        else:
-            print(f"错误: {error}")
+        list_books(client, args.page_size)
     
     elif args.command == "get":
         book, error = client.get_book(args.id)
@@ -214,11 +224,7 @@ def interactive_mode(client):
             print("  help              - 显示此帮助")
         
         elif command == "list":
-            books, error = client.get_all_books()
-            if books:
-                print_books(books)
-            else:
-                print(f"错误: {error}")
+            list_books(client, 100)
         
         elif command.startswith("get "):
             parts = command.split(" ", 1)
@@ -0,0 +1,3 @@
+from common.codec import BACKEND, BACKENDS, DecodeError, dumps, loads, get_codec
+
+__all__ = ['BACKEND', 'BACKENDS', 'DecodeError', 'dumps', 'loads', 'get_codec']
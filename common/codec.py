@@ -0,0 +1,135 @@
+"""
+服务器和客户端共用的 JSON 编解码
+
+按 BACKENDS 的顺序使用第一个已安装的库（orjson、ujson，最后是标准库 json），
+也可以用环境变量 BOOK_JSON_BACKEND 指定。所有后端都输出紧凑的 UTF-8，
+中文字符不转义为 \\uXXXX。
+"""
+import json
+import os
+from collections import namedtuple
+
+# 按速度排序的后端
+BACKENDS = ('orjson', 'ujson', 'json')
+
+FORMAT = 'json'
+CONTENT_TYPE = 'application/json'
+
+Codec = namedtuple('Codec', ['name', 'dumps', 'loads'])
+
+
+class DecodeError(ValueError):
+    """无效的 JSON 数据"""
+
+
+# 19 位及以上的连续数字可能超出 64 位整数的范围，orjson 会把它解码为浮点数，
+# 丢失精度；包含这样的数字时改用标准库解码。把数字映射为 0、其他字节映射为空格
+# 再查找 19 个 0，比正则表达式快一个数量级。字符串中的长数字也会命中，只是多走一次慢路径
+_DIGITS_TABLE = bytes(0x30 if 0x30 <= c <= 0x39 else 0x20 for c in range(256))
+_LONG_DIGITS = b'0' * 19
+
+
+def _has_long_digits(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8', 'surrogatepass')
+    elif isinstance(data, memoryview):
+        data = data.tobytes()
+    elif not isinstance(data, (bytes, bytearray)):
+        return False
+    return _LONG_DIGITS in data.translate(_DIGITS_TABLE)
+
+
+def _json_codec():
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    decoder = json.JSONDecoder()
+
+    def dumps(obj):
+        return encoder.encode(obj).encode('utf-8')
+
+    def loads(data):
+        try:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                data = bytes(data).decode('utf-8')
+            return decoder.decode(data)
+        except (ValueError, TypeError) as e:
+            # json.JSONDecodeError 和 UnicodeDecodeError 都是 ValueError
+            raise DecodeError(str(e)) from None
+
+    return Codec('json', dumps, loads)
+
+
+def _orjson_codec(fallback):
+    import orjson
+
+    orjson_dumps = orjson.dumps
+    orjson_loads = orjson.loads
+
+    def dumps(obj):
+        try:
+            return orjson_dumps(obj)
+        except TypeError:
+            # 超过 64 位的整数、非字符串的字典键等 orjson 不支持的值
+            return fallback.dumps(obj)
+
+    def loads(data):
+        if _has_long_digits(data):
+            return fallback.loads(data)
+        try:
+            return orjson_loads(data)
+        except orjson.JSONDecodeError as e:
+            raise DecodeError(str(e)) from None
+
+    return Codec('orjson', dumps, loads)
+
+
+def _ujson_codec(fallback):
+    import ujson
+
+    def dumps(obj):
+        try:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+        except (TypeError, OverflowError):
+            return fallback.dumps(obj)
+
+    def loads(data):
+        if _has_long_digits(data):
+            return fallback.loads(data)
+        try:
+            return ujson.loads(data)
+        except (ValueError, TypeError) as e:
+            raise DecodeError(str(e)) from None
+
+    return Codec('ujson', dumps, loads)
+
+
+def get_codec(name):
+    """返回指定后端的编解码器，库未安装时抛出 ImportError"""
+    if name not in BACKENDS:
+        raise ValueError(f"不支持的JSON后端: {name}")
+    fallback = _json_codec()
+    if name == 'orjson':
+        return _orjson_codec(fallback)
+    if name == 'ujson':
+        return _ujson_codec(fallback)
+    return fallback
+
+
+def _select_codec():
+    preferred = os.environ.get('BOOK_JSON_BACKEND')
+    if preferred:
+        return get_codec(preferred)
+    for name in BACKENDS:
+        try:
+            return get_codec(name)
+        except ImportError:
+            continue
+
+
+_codec = _select_codec()
+
+# 当前使用的后端名
+BACKEND = _codec.name
+# obj -> UTF-8 bytes
+dumps = _codec.dumps
+# bytes/str -> obj，无效数据抛出 DecodeError
+loads = _codec.loads
@@ -0,0 +1,307 @@
+"""
+MessagePack 编解码，供服务间调用使用的二进制格式
+
+安装了 msgpack 库时使用它，否则使用本模块中只依赖标准库的实现。两者的输出
+相同：整数、字符串和容器总是使用能容纳其值的最短格式，浮点数使用 float64。
+接口与 common.codec 相同，无效数据抛出 codec.DecodeError。
+"""
+import struct
+
+from common.codec import Codec, DecodeError
+
+FORMAT = 'msgpack'
+CONTENT_TYPE = 'application/msgpack'
+# 部分客户端仍使用的旧媒体类型
+LEGACY_CONTENT_TYPE = 'application/x-msgpack'
+
+_U8 = struct.Struct('>B')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+_I8 = struct.Struct('>b')
+_I16 = struct.Struct('>h')
+_I32 = struct.Struct('>i')
+_I64 = struct.Struct('>q')
+_F32 = struct.Struct('>f')
+_F64 = struct.Struct('>d')
+
+
+def _pack_length(out, n, fix_base, fix_max, codes):
+    """写入 str/bin/array/map 的长度头，codes 是 8/16/32 位长度对应的类型字节"""
+    if n <= fix_max and fix_base is not None:
+        out.append(fix_base | n)
+    elif n < 0x100 and codes[0] is not None:
+        out.append(codes[0])
+        out.append(n)
+    elif n < 0x10000:
+        out.append(codes[1])
+        out += _U16.pack(n)
+    elif n < 0x100000000:
+        out.append(codes[2])
+        out += _U32.pack(n)
+    else:
+        raise ValueError("MessagePack 对象过大")
+
+
+def _pack_int(out, n):
+    if 0 <= n < 0x80:
+        out.append(n)
+    elif -32 <= n < 0:
+        out.append(n & 0xff)
+    elif n >= 0:
+        if n < 0x100:
+            out.append(0xcc)
+            out.append(n)
+        elif n < 0x10000:
+            out.append(0xcd)
+            out += _U16.pack(n)
+        elif n < 0x100000000:
+            out.append(0xce)
+            out += _U32.pack(n)
+        elif n < 0x10000000000000000:
+            out.append(0xcf)
+            out += _U64.pack(n)
+        else:
+            raise OverflowError("整数超出 MessagePack 的表示范围")
+    elif n >= -0x80:
+        out.append(0xd0)
+        out += _I8.pack(n)
+    elif n >= -0x8000:
+        out.append(0xd1)
+        out += _I16.pack(n)
+    elif n >= -0x80000000:
+        out.append(0xd2)
+        out += _I32.pack(n)
+    elif n >= -0x8000000000000000:
+        out.append(0xd3)
+        out += _I64.pack(n)
+    else:
+        raise OverflowError("整数超出 MessagePack 的表示范围")
+
+
+def _pack(obj, out):
+    t = type(obj)
+    if t is str:
+        data = obj.encode('utf-8')
+        _pack_length(out, len(data), 0xa0, 31, (0xd9, 0xda, 0xdb))
+        out += data
+    elif t is int:
+        _pack_int(out, obj)
+    elif t is dict:
+        _pack_length(out, len(obj), 0x80, 15, (None, 0xde, 0xdf))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    elif t is list or t is tuple:
+        _pack_length(out, len(obj), 0x90, 15, (None, 0xdc, 0xdd))
+        for item in obj:
+            _pack(item, out)
+    elif obj is None:
+        out.append(0xc0)
+    elif obj is False:
+        out.append(0xc2)
+    elif obj is True:
+        out.append(0xc3)
+    elif t is float:
+        out.append(0xcb)
+        out += _F64.pack(obj)
+    elif t is bytes or t is bytearray or t is memoryview:
+        data = bytes(obj)
+        _pack_length(out, len(data), None, -1, (0xc4, 0xc5, 0xc6))
+        out += data
+    # 子类按基类编码
+    elif isinstance(obj, str):
+        _pack(str(obj), out)
+    elif isinstance(obj, int):
+        _pack(int(obj), out)
+    elif isinstance(obj, float):
+        _pack(float(obj), out)
+    elif isinstance(obj, dict):
+        _pack(dict(obj), out)
+    elif isinstance(obj, (list, tuple)):
+        _pack(list(obj), out)
+    else:
+        raise TypeError(f"无法编码为 MessagePack 的类型: {t.__name__}")
+
+
+def _take(data, pos, n):
+    end = pos + n
+    if end > len(data):
+        raise DecodeError("MessagePack 数据不完整")
+    return data[pos:end], end
+
+
+def _unpack_array(data, pos, n):
+    items = []
+    append = items.append
+    for _ in range(n):
+        item, pos = _unpack(data, pos)
+        append(item)
+    return items, pos
+
+
+def _unpack_map(data, pos, n):
+    result = {}
+    for _ in range(n):
+        key, pos = _unpack(data, pos)
+        value, pos = _unpack(data, pos)
+        result[key] = value
+    return result, pos
+
+
+def _unpack_str(data, pos, n):
+    raw, pos = _take(data, pos, n)
+    return raw.decode('utf-8'), pos
+
+
+def _unpack_bin(data, pos, n):
+    return _take(data, pos, n)
+
+
+def _unpack_struct(fmt):
+    def unpack(data, pos):
+        raw, pos = _take(data, pos, fmt.size)
+        return fmt.unpack(raw)[0], pos
+    return unpack
+
+
+def _unpack_sized(fmt, read):
+    """先读取 fmt 表示的长度，再由 read 读取内容"""
+    def unpack(data, pos):
+        raw, pos = _take(data, pos, fmt.size)
+        return read(data, pos, fmt.unpack(raw)[0])
+    return unpack
+
+
+# 定长格式以外的类型字节及其解码函数
+_UNPACKERS = {
+    0xc0: lambda data, pos: (None, pos),
+    0xc2: lambda data, pos: (False, pos),
+    0xc3: lambda data, pos: (True, pos),
+    0xc4: _unpack_sized(_U8, _unpack_bin),
+    0xc5: _unpack_sized(_U16, _unpack_bin),
+    0xc6: _unpack_sized(_U32, _unpack_bin),
+    0xca: _unpack_struct(_F32),
+    0xcb: _unpack_struct(_F64),
+    0xcc: _unpack_struct(_U8),
+    0xcd: _unpack_struct(_U16),
+    0xce: _unpack_struct(_U32),
+    0xcf: _unpack_struct(_U64),
+    0xd0: _unpack_struct(_I8),
+    0xd1: _unpack_struct(_I16),
+    0xd2: _unpack_struct(_I32),
+    0xd3: _unpack_struct(_I64),
+    0xd9: _unpack_sized(_U8, _unpack_str),
+    0xda: _unpack_sized(_U16, _unpack_str),
+    0xdb: _unpack_sized(_U32, _unpack_str),
+    0xdc: _unpack_sized(_U16, _unpack_array),
+    0xdd: _unpack_sized(_U32, _unpack_array),
+    0xde: _unpack_sized(_U16, _unpack_map),
+    0xdf: _unpack_sized(_U32, _unpack_map),
+}
+
+
+def _unpack(data, pos):
+    if pos >= len(data):
+        raise DecodeError("MessagePack 数据不完整")
+    b = data[pos]
+    pos += 1
+    if b < 0x80:
+        return b, pos
+    if b >= 0xe0:
+        return b - 0x100, pos
+    if b >= 0xa0 and b < 0xc0:
+        return _unpack_str(data, pos, b & 0x1f)
+    if b < 0x90:
+        return _unpack_map(data, pos, b & 0x0f)
+    if b < 0xa0:
+        return _unpack_array(data, pos, b & 0x0f)
+    unpack = _UNPACKERS.get(b)
+    if unpack is None:
+        # 0xc1 未使用，扩展类型（ext）不在支持的数据模型内
+        raise DecodeError(f"不支持的 MessagePack 类型: 0x{b:02x}")
+    return unpack(data, pos)
+
+
+def check_json_compatible(obj):
+    """检查解码结果只包含 JSON 能表示的值，否则抛出 DecodeError
+
+    MessagePack 比 JSON 多出 bin 类型（解码为 bytes）和非字符串的键。请求体
+    按 JSON 的数据模型处理和保存，这些值既不能建立索引也不能编码为 JSON 响应。
+    """
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        t = type(obj)
+        if t is dict:
+            for key, value in obj.items():
+                if type(key) is not str:
+                    raise DecodeError(f"对象的键必须是字符串: {key!r}")
+                stack.append(value)
+        elif t is list:
+            stack.extend(obj)
+        elif t is bytes:
+            raise DecodeError("不支持 MessagePack bin 类型")
+
+
+def _python_codec():
+    def dumps(obj):
+        out = bytearray()
+        _pack(obj, out)
+        return bytes(out)
+
+    def loads(data):
+        if isinstance(data, str):
+            raise DecodeError("MessagePack 数据必须是字节串")
+        data = bytes(data)
+        try:
+            obj, pos = _unpack(data, 0)
+        except (UnicodeDecodeError, TypeError, RecursionError) as e:
+            # 无效的 UTF-8、不可哈希的键、嵌套过深
+            raise DecodeError(str(e)) from None
+        if pos != len(data):
+            raise DecodeError("MessagePack 数据末尾有多余的字节")
+        return obj
+
+    return Codec('python', dumps, loads)
+
+
+def _library_codec():
+    import msgpack
+
+    unpack_errors = (msgpack.UnpackException, ValueError, TypeError, RecursionError)
+
+    def reject_ext(code, data):
+        # 与纯 Python 实现一致，不接受扩展类型
+        raise ValueError(f"不支持的 MessagePack 扩展类型: {code}")
+
+    def dumps(obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(data):
+        try:
+            return msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=reject_ext)
+        except unpack_errors as e:
+            raise DecodeError(str(e)) from None
+
+    return Codec('msgpack', dumps, loads)
+
+
+def get_codec(name):
+    """返回指定实现：msgpack 为第三方库（未安装时抛出 ImportError），python 为纯 Python 实现"""
+    if name == 'msgpack':
+        return _library_codec()
+    if name == 'python':
+        return _python_codec()
+    raise ValueError(f"不支持的 MessagePack 实现: {name}")
+
+
+try:
+    _codec = get_codec('msgpack')
+except ImportError:
+    _codec = get_codec('python')
+
+# 当前使用的实现
+BACKEND = _codec.name
+dumps = _codec.dumps
+loads = _codec.loads
@@ -0,0 +1,126 @@
+import datetime
+import logging
+import random
+import sys
+import threading
+import time
+
+from common import codec
+
+logger = logging.getLogger(__name__)
+
+# 后台线程在攒够一批或等待超过该秒数后写出
+DEFAULT_BATCH_SIZE = 512
+DEFAULT_FLUSH_INTERVAL = 0.5
+# 等待写出的记录数上限，超过后新的记录被丢弃，写出缓慢时内存不会无限增长
+DEFAULT_MAX_PENDING = 10000
+
+
+class AccessLog:
+    """结构化访问日志，每个请求一行 JSON
+
+    请求线程只把各字段组成一个元组追加到待写列表，不做格式化也不做 I/O；
+    后台线程每攒够 batch_size 条或每隔 flush_interval 秒把整批记录序列化
+    并一次写出。sample_rate 小于 1 时按该比例抽样记录成功的请求（状态码
+    小于 400），错误请求始终记录，抽样的记录带有 sample_rate 字段。待写
+    记录超过 max_pending 条时丢弃新记录，并在日志中写入一条 dropped 记录。
+
+    stream 是以二进制方式写入的文件对象；path 为 "-" 时写入标准错误，
+    其他路径以追加方式打开。
+    """
+
+    def __init__(self, path='-', sample_rate=1.0, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, max_pending=DEFAULT_MAX_PENDING,
+                 stream=None):
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"无效的抽样比例: {sample_rate}")
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._owns_stream = stream is None and path != '-'
+        if stream is None:
+            stream = sys.stderr.buffer if path == '-' else open(path, 'ab')
+        self.stream = stream
+        self.written = 0
+        self.dropped = 0
+        self._unreported = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name='access-log-writer', daemon=True)
+        self._writer.start()
+
+    def record(self, method, path, route, status, duration, bytes_in, bytes_out, client=None):
+        """记录一个已完成的请求，在请求线程中调用"""
+        if status < 400 and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        entry = (time.time(), method, path, route, status, duration, bytes_in, bytes_out, client)
+        with self._lock:
+            if len(self._pending) >= self.max_pending or self._closed:
+                self.dropped += 1
+                self._unreported += 1
+                return
+            self._pending.append(entry)
+            if len(self._pending) == self.batch_size:
+                self._ready.notify()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if len(self._pending) < self.batch_size and not self._closed:
+                    self._ready.wait(self.flush_interval)
+                batch, self._pending = self._pending, []
+                dropped, self._unreported = self._unreported, 0
+                closed = self._closed
+            if batch or dropped:
+                self._write(batch, dropped)
+            if closed:
+                return
+
+    def _format(self, entry):
+        ts, method, path, route, status, duration, bytes_in, bytes_out, client = entry
+        record = {
+            'ts': _timestamp(ts),
+            'method': method,
+            'path': path,
+            'route': route,
+            'status': status,
+            'duration_ms': round(duration * 1000, 3),
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+        }
+        if client is not None:
+            record['client'] = client
+        if status < 400 and self.sample_rate < 1.0:
+            record['sample_rate'] = self.sample_rate
+        return codec.dumps(record)
+
+    def _write(self, batch, dropped):
+        lines = [self._format(entry) for entry in batch]
+        if dropped:
+            lines.append(codec.dumps({'ts': _timestamp(time.time()), 'event': 'dropped', 'count': dropped}))
+        try:
+            self.stream.write(b'\n'.join(lines) + b'\n')
+            self.stream.flush()
+        except (OSError, ValueError) as e:
+            # ValueError: 文件已被关闭
+            logger.error(f"写入访问日志失败，丢弃 {len(batch)} 条记录: {e}")
+            return
+        self.written += len(batch)
+
+    def close(self):
+        """写出剩余的记录并停止后台线程"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._ready.notify()
+        self._writer.join()
+        if self._owns_stream:
+            self.stream.close()
+
+
+def _timestamp(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat(timespec='milliseconds')
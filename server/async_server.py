@@ -0,0 +1,309 @@
+import asyncio
+import http.client
+import io
+import socket
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+
+from common import codec
+from server.compression import compress_stream
+from server.views import BookView
+
+logger = logging.getLogger(__name__)
+
+# 请求行加请求头的最大长度
+MAX_HEAD_BYTES = 65536
+# 在线程池中执行的请求方法：写操作可能等待日志 fsync 或 SQLite 写入
+WRITE_METHODS = frozenset(('POST', 'PUT', 'PATCH', 'DELETE'))
+
+
+class AsyncRequestHandler:
+    """asyncio引擎中的请求对象
+
+    提供 BookView 用到的 BaseHTTPRequestHandler 接口子集（path、headers、
+    rfile、wfile、send_response、send_header、end_headers），使 BookView
+    的处理方法可以不加修改地在事件循环中运行。响应先写入内存缓冲区，
+    由引擎统一补齐 Content-Length 后发送。
+    """
+
+    server_version = 'BookServer/async'
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, command, path, request_version, headers, body):
+        self.command = command
+        self.path = path
+        self.request_version = request_version
+        self.headers = headers
+        self.rfile = io.BytesIO(body)
+        self.wfile = io.BytesIO()
+        self.status_code = None
+        self.response_headers = []
+        self.close_connection = False
+        self.requests_handled = 0
+        self.client_address = None
+        self.server = None
+        # 流式响应的分块迭代器，由引擎在事件循环中逐块写出
+        self.stream = None
+        self.chunked = False
+
+    def send_response(self, code, message=None):
+        self.status_code = code
+        self.send_header('Server', self.server_version)
+        self.send_header('Date', formatdate(usegmt=True))
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'connection' and str(value).lower() == 'close':
+            self.close_connection = True
+        self.response_headers.append((keyword, str(value)))
+
+    def end_headers(self):
+        pass
+
+    def _send_stream(self, chunks, content_type):
+        """替代 BookView._send_stream，只记录分块迭代器，不在这里写出"""
+        self.requests_handled += 1
+        self._response_status = 200
+        self.chunked = self.request_version != 'HTTP/1.0'
+        encoding = self._response_encoding()
+        if encoding is not None:
+            chunks = compress_stream(chunks, encoding, self.compression_level)
+        if self.metrics is not None or self.access_log is not None:
+            # 分块由引擎在请求处理结束后写出，字节数和访问日志在写完时单独记录
+            chunks = self._count_stream(chunks)
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept, Accept-Encoding' if self.compression_level > 0 else 'Accept')
+        if self.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        if not self.chunked or self._last_request():
+            self.send_header('Connection', 'close')
+        self.stream = chunks
+
+    def build_response(self):
+        """组装完整的响应报文"""
+        body = self.wfile.getvalue()
+        try:
+            reason = HTTPStatus(self.status_code).phrase
+        except ValueError:
+            reason = ''
+        lines = [f"{self.protocol_version} {self.status_code} {reason}"]
+        names = set()
+        for keyword, value in self.response_headers:
+            names.add(keyword.lower())
+            lines.append(f"{keyword}: {value}")
+        if self.stream is not None:
+            # 流式响应只返回响应头，响应体由引擎逐块发送
+            return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        if 'content-length' not in names and self.status_code not in (204, 304):
+            lines.append(f"Content-Length: {len(body)}")
+        if self.close_connection and 'connection' not in names:
+            lines.append("Connection: close")
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        return head + body
+
+
+class AsyncHTTPServer:
+    """基于 asyncio streams 的HTTP/1.1服务器
+
+    对外提供与 socketserver 相同的 serve_forever/shutdown/server_close
+    接口，便于 BookServer 在不同引擎之间切换。所有连接由一个事件循环
+    处理，空闲的长连接只占用一个协程。
+
+    读请求直接在事件循环中处理；写请求交给最多 pool_size 个线程执行，
+    等待持久化时不阻塞其他连接，并发的写入也能合并为一次组提交。
+    """
+
+    def __init__(self, server_address, book_controller, idle_timeout=60.0,
+                 request_timeout=30.0, max_keepalive_requests=None, backlog=1024,
+                 compression_level=None, compression_min_size=None, metrics=None,
+                 reuse_port=False, access_log=None, pool_size=16):
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.backlog = backlog
+        attrs = BookView.handler_methods(
+            book_controller, compression_level, compression_min_size, metrics, access_log
+        )
+        if max_keepalive_requests is not None:
+            attrs['max_keepalive_requests'] = max_keepalive_requests
+        attrs['_send_stream'] = AsyncRequestHandler._send_stream
+        self.handler_class = type('AsyncBookView', (AsyncRequestHandler,), attrs)
+        self.socket = socket.create_server(server_address, backlog=backlog, reuse_port=reuse_port)
+        self.socket.setblocking(False)
+        self.server_address = self.socket.getsockname()[:2]
+        self._loop = None
+        self._stop_event = None
+        self._stopped = threading.Event()
+        self._connections = {}
+        self._executor = ThreadPoolExecutor(max_workers=pool_size,
+                                            thread_name_prefix='book-server-writer')
+        # 等待下一个请求的连接，停止时直接关闭
+        self._idle = set()
+        # 停止时置位，之后的响应都告知客户端关闭连接
+        self.draining = False
+
+    def serve_forever(self):
+        """在当前线程中运行事件循环，直到调用 shutdown()"""
+        self._stopped.clear()
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self._stopped.set()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        server = await asyncio.start_server(
+            self._handle_connection, sock=self.socket,
+            limit=MAX_HEAD_BYTES, backlog=self.backlog
+        )
+        async with server:
+            await self._stop_event.wait()
+            self.draining = True
+            server.close()
+            # 关闭空闲的连接，正在处理请求的连接写完响应后关闭；
+            # 等待连接协程退出，避免事件循环结束时强制取消
+            for task in list(self._idle):
+                self._connections[task].close()
+            if self._connections:
+                await asyncio.wait(list(self._connections), timeout=self.request_timeout)
+            await server.wait_closed()
+
+    def shutdown(self):
+        """停止事件循环并等待 serve_forever 返回"""
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+            self._stopped.wait()
+
+    def server_close(self):
+        self.socket.close()
+        # 等待正在执行的写请求完成，之后数据库才能关闭
+        self._executor.shutdown(wait=True)
+
+    async def _handle_connection(self, reader, writer):
+        self._connections[asyncio.current_task()] = writer
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            # 流水线请求的多个小响应不能等待前一个响应的ACK
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        peer = writer.get_extra_info('peername')
+        requests_handled = 0
+        try:
+            while True:
+                handler = await self._read_request(reader, writer)
+                if handler is None:
+                    break
+                # 每个请求都会创建新的处理器对象，由连接负责累计请求数
+                handler.requests_handled = requests_handled
+                handler.client_address = peer
+                handler.server = self
+                requests_handled += 1
+                if handler.command in WRITE_METHODS:
+                    await self._loop.run_in_executor(self._executor, self._dispatch, handler)
+                else:
+                    self._dispatch(handler)
+                writer.write(handler.build_response())
+                if handler.stream is not None:
+                    await self._write_stream(writer, handler)
+                await writer.drain()
+                if handler.close_connection or self.draining:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def _read_request(self, reader, writer):
+        """读取一个请求，连接关闭、空闲超时、服务器停止或请求无效时返回 None"""
+        if self.draining:
+            return None
+        task = asyncio.current_task()
+        self._idle.add(task)
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            return None
+        except asyncio.LimitOverrunError:
+            writer.write(self._error_response(431, "请求头过长"))
+            return None
+        finally:
+            self._idle.discard(task)
+
+        try:
+            handler = self._parse_head(head)
+            content_length = int(handler.headers.get('Content-Length', 0))
+            if content_length > 0:
+                body = await asyncio.wait_for(
+                    reader.readexactly(content_length), self.request_timeout
+                )
+                handler.rfile = io.BytesIO(body)
+            return handler
+        except asyncio.TimeoutError:
+            logger.info("读取请求体超时，关闭连接")
+            return None
+        except (ValueError, http.client.HTTPException, UnicodeDecodeError):
+            writer.write(self._error_response(400, "无效的请求"))
+            return None
+
+    def _parse_head(self, head):
+        """解析请求行和请求头"""
+        request_line, _, header_block = head.partition(b'\r\n')
+        words = request_line.decode('latin-1').split()
+        if len(words) != 3 or not words[2].startswith('HTTP/'):
+            raise ValueError("无效的请求行")
+        command, path, version = words
+        headers = http.client.parse_headers(io.BytesIO(header_block))
+
+        handler = self.handler_class(command, path, version, headers, b'')
+        connection = headers.get('Connection', '').lower()
+        if version == 'HTTP/1.0':
+            handler.close_connection = connection != 'keep-alive'
+        else:
+            handler.close_connection = connection == 'close'
+        return handler
+
+    @staticmethod
+    async def _write_stream(writer, handler):
+        """逐块写出流式响应，每块写出后等待缓冲区排空，内存占用保持恒定"""
+        for chunk in handler.stream:
+            if not chunk:
+                continue
+            if handler.chunked:
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            else:
+                writer.write(chunk)
+            await writer.drain()
+        if handler.chunked:
+            writer.write(b'0\r\n\r\n')
+
+    def _dispatch(self, handler):
+        method = getattr(handler, f"do_{handler.command}", None)
+        if method is None:
+            handler.send_response(501)
+            handler.close_connection = True
+            return
+        try:
+            method()
+        except Exception:
+            logger.exception(f"处理请求 {handler.command} {handler.path} 时出错")
+            handler.wfile = io.BytesIO()
+            handler.response_headers = []
+            handler.send_response(500)
+            handler.close_connection = True
+
+    @staticmethod
+    def _error_response(status_code, message):
+        body = codec.dumps({"message": message})
+        reason = HTTPStatus(status_code).phrase
+        head = (
+            f"HTTP/1.1 {status_code} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n"
+        )
+        return head.encode('latin-1') + body
@@ -0,0 +1,112 @@
+import threading
+from collections import OrderedDict
+
+# 默认最多缓存的响应数和总字节数
+DEFAULT_CACHE_ENTRIES = 10000
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# 单本书籍的缓存键以 (BOOK_KEY, 书籍ID) 开头，后面可以跟表示的变体（如压缩编码），
+# 其他键都视为集合响应，任何修改都会使其失效
+BOOK_KEY = 'book'
+
+
+class ResponseCache:
+    """已编码响应体的 LRU 缓存
+
+    缓存由数据库的修改通知精确失效：修改一本书只删除这本书的响应和所有
+    集合响应（如完整列表）。为了避免并发时把修改前读到的数据写入缓存，
+    调用方在读取数据之前取得 generation，put 时如果期间发生过修改就不缓存。
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._collection_keys = set()
+        # 书籍ID -> 这本书所有变体的缓存键
+        self._book_keys = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """返回缓存的响应体，未命中时返回 None"""
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def peek(self, key):
+        """与 get 相同，但不计入命中率，用于查找已命中响应的其他变体"""
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body, generation):
+        """缓存响应体，generation 是读取数据之前的 self.generation"""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._remove(key)
+            self._entries[key] = body
+            self._size += len(body)
+            if key[0] == BOOK_KEY:
+                self._book_keys.setdefault(key[1], set()).add(key)
+            else:
+                self._collection_keys.add(key)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, book_id):
+        """书籍被添加、修改或删除时调用"""
+        with self._lock:
+            self.generation += 1
+            for key in list(self._book_keys.get(book_id, ())):
+                self._remove(key)
+            for key in list(self._collection_keys):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._collection_keys.clear()
+            self._book_keys.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _remove(self, key):
+        body = self._entries.pop(key, None)
+        if body is not None:
+            self._size -= len(body)
+            if key[0] == BOOK_KEY:
+                keys = self._book_keys[key[1]]
+                keys.discard(key)
+                if not keys:
+                    del self._book_keys[key[1]]
+            else:
+                self._collection_keys.discard(key)
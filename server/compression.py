@@ -0,0 +1,58 @@
+import zlib
+
+# 支持的内容编码，按服务器偏好排序
+ENCODINGS = ('gzip', 'deflate')
+# 默认压缩级别（1 最快，9 压缩率最高，0 表示不压缩）
+DEFAULT_COMPRESSION_LEVEL = 6
+# 小于该字节数的响应不压缩，压缩的收益抵不过 CPU 开销和 gzip 头部
+DEFAULT_COMPRESSION_MIN_SIZE = 1024
+
+# zlib 的 wbits：gzip 格式带 gzip 头，HTTP 的 deflate 实际是 zlib 格式
+_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def negotiate_encoding(accept_encoding):
+    """根据 Accept-Encoding 请求头选择内容编码，不压缩时返回 None"""
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    best = None
+    best_quality = 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding, level=DEFAULT_COMPRESSION_LEVEL):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+    return compressor.compress(body) + compressor.flush()
+
+
+def compress_stream(chunks, encoding, level=DEFAULT_COMPRESSION_LEVEL):
+    """逐块压缩流式响应
+
+    zlib 攒够数据才输出，不对每块单独刷新，压缩率与一次性压缩接近。
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,52 +1,328 @@
+import base64
+import binascii
 import json
 from server.models.book import Book
+from server.models.database import DuplicateISBNError, InvalidBookError
+from server.versions import VersionTracker, etag_matches
+
+# 单个批量请求最多包含的操作数
+MAX_BATCH_SIZE = 1000
+
+# 分页查询的默认和最大每页条数
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# 全文检索的默认和最大返回条数
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# 可以通过 fields 参数选择的字段
+BOOK_FIELDS = ("id", "title", "author", "publication_year", "isbn")
+
+INVALID_BOOK_ID = "无效的书籍ID"
+BOOK_NOT_FOUND = "找不到指定的书籍"
+DUPLICATE_ISBN = "ISBN已存在"
+PRECONDITION_FAILED = "书籍已被修改"
+
+def status_for_error(error):
+    """根据控制器返回的错误信息选择HTTP状态码"""
+    if error == BOOK_NOT_FOUND:
+        return 404
+    if error.startswith(DUPLICATE_ISBN):
+        return 409
+    if error == PRECONDITION_FAILED:
+        return 412
+    return 400
+
+def parse_book_id(book_id):
+    """将书籍ID转换为整数，无效时返回 None
+
+    路由已经把路径中的ID解析为整数，这里只需处理批量请求体中的ID。
+    """
+    if type(book_id) is int:
+        return book_id
+    try:
+        return int(book_id)
+    except (TypeError, ValueError):
+        return None
 
 class BookController:
-    def __init__(self, database):
+    def __init__(self, database, max_batch_size=MAX_BATCH_SIZE, response_cache=None,
+                 versions=None):
         self.database = database
+        self.max_batch_size = max_batch_size
+        # 已编码响应体的缓存，由数据库的修改通知失效
+        self.response_cache = response_cache
+        if response_cache is not None:
+            database.add_listener(response_cache.invalidate)
+        # 版本号必须在缓存失效之后更新：读到新版本号时，缓存中只可能是新数据。
+        # 多个进程共享数据库时传入 DatabaseVersionTracker
+        self.versions = versions if versions is not None else VersionTracker()
+        database.add_listener(self.versions.book_changed)
     
-    def get_all_books(self):
+    def book_etag(self, book_id):
+        """书籍当前版本的 ETag，book_id 为整数"""
+        return self.versions.book_etag(book_id)
+    
+    def books_etag(self, fields=None):
+        """完整列表当前版本的 ETag，不同的字段投影使用不同的 ETag"""
+        return self.versions.collection_etag(','.join(fields) if fields else None)
+    
+    def get_all_books(self, fields=None):
         books = self.database.get_all_books()
-        return [book.to_dict() for book in books]
+        if fields is None:
+            return [book.to_dict() for book in books]
+        return [self._project(book, fields) for book in books]
     
-    def get_book(self, book_id):
+    @staticmethod
+    def encode_cursor(book_id):
+        """将最后一本书的ID编码为不透明的游标"""
+        return base64.urlsafe_b64encode(str(book_id).encode('ascii')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii'))
+    
+    @staticmethod
+    def parse_fields(fields):
+        """解析逗号分隔的字段列表，返回 (字段元组, 错误信息)"""
+        if not fields:
+            return None, None
+        selected = tuple(field.strip() for field in fields.split(',') if field.strip())
+        unknown = [field for field in selected if field not in BOOK_FIELDS]
+        if unknown:
+            return None, f"未知字段: {', '.join(unknown)}"
+        return selected, None
+    
+    @staticmethod
+    def _project(book, fields):
+        book_dict = book.to_dict()
+        if fields is None:
+            return book_dict
+        return {field: book_dict[field] for field in fields}
+    
+    def get_books_page(self, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None):
+        """按ID升序分页获取书籍
+
+        返回 ((书籍列表, 下一页游标), 错误信息)，没有更多数据时游标为 None。
+        """
         try:
-            book_id = int(book_id)
-        except ValueError:
-            return None, "无效的书籍ID"
+            limit = int(limit)
+        except (TypeError, ValueError):
+            return None, "无效的limit参数"
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return None, f"limit必须在1到{MAX_PAGE_SIZE}之间"
+        
+        after_id = None
+        if cursor:
+            try:
+                after_id = self.decode_cursor(cursor)
+            except (ValueError, binascii.Error):
+                return None, "无效的游标"
+        
+        selected, error = self.parse_fields(fields)
+        if error:
+            return None, error
+        
+        # 多取一条用于判断是否还有下一页
+        books = self.database.get_books_page(after_id, limit + 1)
+        next_cursor = None
+        if len(books) > limit:
+            books = books[:limit]
+            next_cursor = self.encode_cursor(books[-1].book_id)
+        return ([self._project(book, selected) for book in books], next_cursor), None
+    
+    def iter_book_pages(self, fields=None, page_size=DEFAULT_PAGE_SIZE):
+        """按ID顺序逐页生成书籍字典列表，用于流式导出
+
+        每次只从数据库取一页，内存占用与书籍总数无关。
+        """
+        after_id = None
+        while True:
+            books = self.database.get_books_page(after_id, page_size)
+            if not books:
+                return
+            yield [self._project(book, fields) for book in books]
+            after_id = books[-1].book_id
+    
+    def find_books(self, author=None, isbn=None, year_from=None, year_to=None, fields=None):
+        """按作者、ISBN和出版年份范围查询书籍"""
+        try:
+            year_from = int(year_from) if year_from is not None else None
+            year_to = int(year_to) if year_to is not None else None
+        except (TypeError, ValueError):
+            return None, "无效的年份参数"
+        selected, error = self.parse_fields(fields)
+        if error:
+            return None, error
+        
+        books = self.database.find_books(author=author, isbn=isbn,
+                                         year_from=year_from, year_to=year_to)
+        return [self._project(book, selected) for book in books], None
+    
+    def search_books(self, query, limit=DEFAULT_SEARCH_LIMIT, fields=None):
+        """全文检索标题和作者，结果按相关度排序并附带 score 字段"""
+        if not query or not query.strip():
+            return None, "缺少检索词"
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            return None, "无效的limit参数"
+        if not 1 <= limit <= MAX_SEARCH_LIMIT:
+            return None, f"limit必须在1到{MAX_SEARCH_LIMIT}之间"
+        selected, error = self.parse_fields(fields)
+        if error:
+            return None, error
+        
+        results = []
+        for book, score in self.database.search_books(query, limit):
+            book_dict = self._project(book, selected)
+            book_dict["score"] = round(score, 4)
+            results.append(book_dict)
+        return results, None
+    
+    def get_book(self, book_id):
+        book_id = parse_book_id(book_id)
+        if book_id is None:
+            return None, INVALID_BOOK_ID
         
         book = self.database.get_book_by_id(book_id)
         if book:
             return book.to_dict(), None
-        return None, "找不到指定的书籍"
+        return None, BOOK_NOT_FOUND
     
     def create_book(self, book_data):
         try:
             book = Book.from_dict(book_data)
             book = self.database.add_book(book)
             return book.to_dict(), None
+        except DuplicateISBNError as e:
+            return None, str(e)
         except Exception as e:
             return None, f"创建书籍失败: {str(e)}"
     
-    def update_book(self, book_id, book_data):
-        try:
-            book_id = int(book_id)
-        except ValueError:
-            return None, "无效的书籍ID"
+    def update_book(self, book_id, book_data, if_match=None):
+        """部分更新书籍（PATCH），未提供的字段保持不变
+
+        if_match 为 If-Match 请求头，书籍的当前 ETag 不匹配时不更新。
+        """
+        return self._save_book(book_id, book_data, if_match, merge=True)
+    
+    def replace_book(self, book_id, book_data, if_match=None):
+        """整体替换书籍（PUT），未提供的字段被清空"""
+        return self._save_book(book_id, book_data, if_match, merge=False)
+    
+    def _save_book(self, book_id, book_data, if_match, merge):
+        book_id = parse_book_id(book_id)
+        if book_id is None:
+            return None, INVALID_BOOK_ID
         
-        book = Book.from_dict(book_data)
-        success = self.database.update_book(book_id, book)
-        if success:
-            return book.to_dict(), None
-        return None, "找不到指定的书籍"
+        # 合并未提供的字段和检查 ETag 都需要先读后写，持有数据库锁避免并发更新互相覆盖
+        with self.database.lock:
+            existing = self.database.get_book_by_id(book_id)
+            if existing is None:
+                return None, BOOK_NOT_FOUND
+            if if_match is not None and not etag_matches(if_match, self.book_etag(book_id)):
+                return None, PRECONDITION_FAILED
+            try:
+                if merge:
+                    merged = existing.to_dict()
+                    merged.update(book_data)
+                    book_data = merged
+                book = Book.from_dict(book_data)
+                self.database.update_book(book_id, book)
+            except DuplicateISBNError as e:
+                return None, str(e)
+            except Exception as e:
+                return None, f"更新书籍失败: {str(e)}"
+        return book.to_dict(), None
     
-    def delete_book(self, book_id):
-        try:
-            book_id = int(book_id)
-        except ValueError:
-            return False, "无效的书籍ID"
+    def delete_book(self, book_id, if_match=None):
+        """删除书籍，if_match 为 If-Match 请求头，书籍的当前 ETag 不匹配时不删除"""
+        book_id = parse_book_id(book_id)
+        if book_id is None:
+            return False, INVALID_BOOK_ID
         
-        success = self.database.delete_book(book_id)
+        with self.database.lock:
+            if (if_match is not None and self.database.get_book_by_id(book_id) is not None
+                    and not etag_matches(if_match, self.book_etag(book_id))):
+                return False, PRECONDITION_FAILED
+            success = self.database.delete_book(book_id)
         if success:
             return True, None
-        return False, "找不到指定的书籍" 
\ No newline at end of file
+        return False, BOOK_NOT_FOUND
+    
+    def _check_batch(self, items):
+        if not isinstance(items, list):
+            return "批量请求必须是数组"
+        if len(items) > self.max_batch_size:
+            return f"批量请求最多包含 {self.max_batch_size} 个操作"
+        return None
+    
+    def create_books(self, items):
+        """批量创建书籍，返回与请求顺序一致的逐项结果"""
+        error = self._check_batch(items)
+        if error:
+            return None, error
+        
+        results = [None] * len(items)
+        books = []
+        positions = []
+        for i, book_data in enumerate(items):
+            if not isinstance(book_data, dict):
+                results[i] = {"status": 400, "message": "创建书籍失败: 书籍数据必须是对象"}
+                continue
+            if book_data.get("id") is not None:
+                book_id = parse_book_id(book_data["id"])
+                if book_id is None:
+                    results[i] = {"status": 400, "message": INVALID_BOOK_ID}
+                    continue
+                book_data = dict(book_data, id=book_id)
+            books.append(Book.from_dict(book_data))
+            positions.append(i)
+        
+        for i, result in zip(positions, self.database.add_books(books)):
+            if isinstance(result, DuplicateISBNError):
+                results[i] = {"status": 409, "message": str(result)}
+            elif isinstance(result, InvalidBookError):
+                results[i] = {"status": 400, "message": f"创建书籍失败: {result}"}
+            else:
+                results[i] = {"status": 201, "data": result.to_dict()}
+        return results, None
+    
+    def update_books(self, items, replace=False):
+        """批量更新书籍，每项必须包含 id
+
+        replace 为 False 时未提供的字段保持不变（PATCH），为 True 时整体替换（PUT）。
+        """
+        error = self._check_batch(items)
+        if error:
+            return None, error
+        
+        results = []
+        with self.database.lock:
+            for book_data in items:
+                if not isinstance(book_data, dict) or "id" not in book_data:
+                    results.append({"status": 400, "message": "缺少书籍ID"})
+                    continue
+                book, error = self._save_book(book_data["id"], book_data, None, merge=not replace)
+                if book:
+                    results.append({"status": 200, "data": book})
+                else:
+                    results.append({"status": status_for_error(error), "message": error})
+        return results, None
+    
+    def delete_books(self, book_ids):
+        """批量删除书籍"""
+        error = self._check_batch(book_ids)
+        if error:
+            return None, error
+        
+        results = []
+        with self.database.lock:
+            for book_id in book_ids:
+                success, error = self.delete_book(book_id)
+                if success:
+                    results.append({"status": 204})
+                else:
+                    results.append({"status": status_for_error(error), "message": error})
+        return results, None
@@ -0,0 +1,199 @@
+import bisect
+import threading
+import time
+
+# 请求耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# /metrics 中由直方图估算的分位数
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Prometheus 文本格式的媒体类型
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 没有匹配任何路由的请求使用的 route 标签
+UNMATCHED_ROUTE = 'unmatched'
+
+
+class _Shard:
+    """一个线程的计数器，只由该线程修改，不需要加锁"""
+
+    __slots__ = ('requests', 'routes', 'started', 'finished')
+
+    def __init__(self):
+        # (方法, 路由, 状态码) -> 请求数
+        self.requests = {}
+        # (方法, 路由) -> [各个桶的计数..., 超出最大桶的计数, 耗时总和, 请求字节数, 响应字节数]
+        self.routes = {}
+        self.started = 0
+        self.finished = 0
+
+
+class Metrics:
+    """请求级别的指标，以 Prometheus 文本格式导出
+
+    每个线程写入自己的计数器分片，记录一次请求只有几次字典和列表操作，
+    没有锁竞争；导出时汇总所有分片。分片中的字典在导出时整体复制，CPython
+    中复制字典不会与其他线程的修改交错。
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.start_time = time.time()
+        # 每个路由的计数列表中耗时总和、请求字节数和响应字节数的下标
+        self._sum = len(self.buckets) + 1
+        self._bytes_in = self._sum + 1
+        self._bytes_out = self._sum + 2
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    def _route(self, shard, method, route):
+        key = (method, route)
+        counts = shard.routes.get(key)
+        if counts is None:
+            counts = shard.routes[key] = [0] * (len(self.buckets) + 1) + [0.0, 0, 0]
+        return counts
+
+    def request_started(self):
+        self._shard().started += 1
+
+    def request_finished(self, method, route, status, duration, bytes_in=0, bytes_out=0):
+        """记录一个已完成的请求，duration 为秒"""
+        shard = self._shard()
+        shard.finished += 1
+        requests = shard.requests
+        key = (method, route, status)
+        requests[key] = requests.get(key, 0) + 1
+        counts = self._route(shard, method, route)
+        counts[bisect.bisect_left(self.buckets, duration)] += 1
+        counts[self._sum] += duration
+        counts[self._bytes_in] += bytes_in
+        counts[self._bytes_out] += bytes_out
+
+    def add_bytes_out(self, method, route, count):
+        """记录响应字节数，流式响应在发送完成后单独调用"""
+        self._route(self._shard(), method, route)[self._bytes_out] += count
+
+    def _snapshot(self):
+        """汇总所有分片，返回 (请求数, 各路由的计数)"""
+        requests = {}
+        routes = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, count in dict(shard.requests).items():
+                requests[key] = requests.get(key, 0) + count
+            for key, counts in dict(shard.routes).items():
+                counts = list(counts)
+                total = routes.get(key)
+                if total is None:
+                    routes[key] = counts
+                else:
+                    for i, count in enumerate(counts):
+                        total[i] += count
+        return requests, routes
+
+    def in_flight(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        # 先读 finished 再读 started，并发时结果不会小于 0
+        finished = sum(shard.finished for shard in shards)
+        return sum(shard.started for shard in shards) - finished
+
+    def quantile(self, counts, q):
+        """由直方图的桶计数估算分位数，桶内按线性插值"""
+        total = sum(counts[:len(self.buckets) + 1])
+        if total == 0:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            count = counts[i]
+            if cumulative + count >= rank and count:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        # 落在最大的桶之外，只能返回最大的桶上界
+        return self.buckets[-1]
+
+    def render(self, database=None, cache=None):
+        """生成 Prometheus 文本格式的指标"""
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        requests, routes = self._snapshot()
+        routes = sorted(routes.items())
+
+        metric('bookserver_requests_total', 'counter', '处理的请求数')
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(
+                f'bookserver_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}'
+            )
+
+        metric('bookserver_request_duration_seconds', 'histogram', '请求处理耗时')
+        for (method, route), counts in routes:
+            labels = f'method="{method}",route="{route}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'bookserver_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += counts[len(self.buckets)]
+            lines.append(f'bookserver_request_duration_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'bookserver_request_duration_seconds_sum{{{labels}}} {counts[self._sum]:.6f}')
+            lines.append(f'bookserver_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+        metric('bookserver_request_duration_quantile_seconds', 'gauge', '由直方图估算的请求耗时分位数')
+        for (method, route), counts in routes:
+            for q in QUANTILES:
+                lines.append(
+                    f'bookserver_request_duration_quantile_seconds{{method="{method}",route="{route}",'
+                    f'quantile="{q}"}} {self.quantile(counts, q):.6f}'
+                )
+
+        metric('bookserver_requests_in_flight', 'gauge', '正在处理的请求数')
+        lines.append(f'bookserver_requests_in_flight {self.in_flight()}')
+
+        for name, index, help_text in (
+            ('bookserver_request_bytes_total', self._bytes_in, '请求体字节数'),
+            ('bookserver_response_bytes_total', self._bytes_out, '响应体字节数'),
+        ):
+            metric(name, 'counter', help_text)
+            for (method, route), counts in routes:
+                lines.append(f'{name}{{method="{method}",route="{route}"}} {counts[index]}')
+
+        if database is not None:
+            metric('bookserver_books', 'gauge', '数据库中的书籍数')
+            lines.append(f'bookserver_books {database.count_books()}')
+
+        if cache is not None:
+            stats = cache.stats()
+            for key, kind, help_text in (
+                ('hits', 'counter', '响应缓存命中次数'),
+                ('misses', 'counter', '响应缓存未命中次数'),
+                ('evictions', 'counter', '响应缓存淘汰的响应数'),
+                ('entries', 'gauge', '响应缓存中的响应数'),
+                ('bytes', 'gauge', '响应缓存占用的字节数'),
+            ):
+                name = f"bookserver_cache_{key}" + ('_total' if kind == 'counter' else '')
+                metric(name, kind, help_text)
+                lines.append(f'{name} {stats[key]}')
+
+        metric('bookserver_start_time_seconds', 'gauge', '服务器启动时间（Unix 时间戳）')
+        lines.append(f'bookserver_start_time_seconds {self.start_time:.3f}')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
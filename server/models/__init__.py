@@ -1,4 +1,8 @@
 from server.models.book import Book
-from server.models.database import Database
+from server.models.database import Database, DuplicateISBNError, InvalidBookError
+from server.models.search import InvertedIndex, tokenize
+from server.models.persistence import PersistentDatabase, WriteAheadLog, FSYNC_POLICIES
+from server.models.sqlite_database import SQLiteDatabase
 
-__all__ = ['Book', 'Database'] 
\ No newline at end of file
+__all__ = ['Book', 'Database', 'DuplicateISBNError', 'InvalidBookError', 'InvertedIndex', 'tokenize',
+           'PersistentDatabase', 'WriteAheadLog', 'FSYNC_POLICIES', 'SQLiteDatabase']
@@ -1,4 +1,7 @@
 class Book:
+    # 不为每个实例创建 __dict__，数百万本书籍时显著减少内存占用
+    __slots__ = ('book_id', 'title', 'author', 'publication_year', 'isbn')
+    
     def __init__(self, book_id, title, author, publication_year, isbn):
         self.book_id = book_id
         self.title = title
@@ -0,0 +1,298 @@
+import contextlib
+import heapq
+import threading
+from array import array
+
+from server.models.book import Book
+
+# 各列中表示"该值保存在 _other 中"的标记
+_TITLE_OTHER = 0xFFFFFFFF
+_AUTHOR_OTHER = 0xFFFFFFFF
+_YEAR_OTHER = -2 ** 31
+_ISBN_NONE = -1
+_ISBN_OTHER = -2
+# 作者表中下标 0 表示没有作者
+_AUTHOR_NONE = 0
+
+# ID 比当前列长度大出这么多时不再扩展列，改为单独保存 Book 对象
+MAX_ID_GAP = 1 << 16
+# 标题区中已废弃的字节超过该值且超过一半时整理标题区
+COMPACT_THRESHOLD = 1 << 20
+
+_FIELDS = ('title', 'author', 'publication_year', 'isbn')
+
+
+class ColumnarBookStore:
+    """按列存储书籍的 dict 替代品
+
+    以书籍ID为下标，每个字段保存在一个紧凑的 array 中：标题以 UTF-8 拼接在
+    一个 bytearray 里，作者通过驻留表保存为整数下标，出版年份和纯数字 ISBN
+    保存为整数。每本书只占用几十个字节加上标题本身的长度，而不是一个
+    Book 对象和若干字符串对象。
+
+    不适合放入列中的值（如 None 标题、非整数年份、带字母的 ISBN）保存在
+    _other 中；远离现有ID范围的ID保存在 _sparse 中，避免列被撑大。
+    读取时按需生成 Book 对象，修改返回的对象不会影响存储的数据。
+
+    读写都在内部锁内进行。snapshot() 整体复制各列，得到的副本可以在锁外
+    遍历；batch() 在多次修改期间一直持有锁，其他线程看不到中间状态。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._present = bytearray()
+        self._title_offsets = array('Q')
+        self._title_lengths = array('I')
+        self._text = bytearray()
+        self._garbage = 0
+        self._author_refs = array('I')
+        self._authors = [None]
+        self._author_ids = {}
+        self._years = array('i')
+        self._isbns = array('q')
+        self._other = {}
+        self._sparse = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, book_id):
+        with self._lock:
+            return book_id in self._sparse or self._is_dense(book_id)
+
+    def __iter__(self):
+        return iter(self._ids())
+
+    def __getitem__(self, book_id):
+        book = self.get(book_id)
+        if book is None:
+            raise KeyError(book_id)
+        return book
+
+    def __setitem__(self, book_id, book):
+        with self._lock:
+            if book_id in self._sparse or not self._fits(book_id):
+                if book_id not in self._sparse:
+                    self._count += 1
+                self._sparse[book_id] = Book(book_id, book.title, book.author,
+                                             book.publication_year, book.isbn)
+                return
+            if book_id >= len(self._present):
+                self._grow(book_id + 1)
+            if self._present[book_id]:
+                self._release(book_id)
+            else:
+                self._count += 1
+            self._write(book_id, book)
+            self._present[book_id] = 1
+
+    def get(self, book_id, default=None):
+        with self._lock:
+            book = self._sparse.get(book_id)
+            if book is not None:
+                return Book(book_id, book.title, book.author, book.publication_year, book.isbn)
+            if not self._is_dense(book_id):
+                return default
+            return self._read(book_id)
+
+    def page(self, after_id=None, limit=100):
+        """按ID升序返回 ID 大于 after_id 的最多 limit 本书籍"""
+        with self._lock:
+            dense = []
+            start = 0 if after_id is None else max(after_id + 1, 0)
+            while len(dense) < limit:
+                book_id = self._present.find(1, start)
+                if book_id < 0:
+                    break
+                dense.append(book_id)
+                start = book_id + 1
+            sparse = sorted(book_id for book_id in self._sparse
+                            if after_id is None or book_id > after_id)
+            ids = list(heapq.merge(dense, sparse))[:limit]
+            return [self.get(book_id) for book_id in ids]
+
+    def snapshot(self):
+        """返回当前内容的只读副本
+
+        各列按块整体复制，持锁时间远小于逐本生成 Book 对象。副本同样是
+        ColumnarBookStore，调用方不应再修改它。
+        """
+        copy = ColumnarBookStore()
+        with self._lock:
+            copy._present = bytearray(self._present)
+            copy._title_offsets = self._title_offsets[:]
+            copy._title_lengths = self._title_lengths[:]
+            copy._text = bytearray(self._text)
+            copy._garbage = self._garbage
+            copy._author_refs = self._author_refs[:]
+            copy._authors = list(self._authors)
+            copy._author_ids = dict(self._author_ids)
+            copy._years = self._years[:]
+            copy._isbns = self._isbns[:]
+            copy._other = dict(self._other)
+            copy._sparse = dict(self._sparse)
+            copy._count = self._count
+        return copy
+
+    @contextlib.contextmanager
+    def batch(self):
+        """在多次修改期间持有锁，读者要么看到全部修改，要么一个也看不到"""
+        with self._lock:
+            yield
+
+    def pop(self, book_id, *default):
+        with self._lock:
+            if book_id in self._sparse:
+                self._count -= 1
+                return self._sparse.pop(book_id)
+            if not self._is_dense(book_id):
+                if default:
+                    return default[0]
+                raise KeyError(book_id)
+            book = self._read(book_id)
+            self._release(book_id)
+            self._present[book_id] = 0
+            self._count -= 1
+            return book
+
+    def keys(self):
+        return self._ids()
+
+    def values(self):
+        for book_id in self._ids():
+            book = self.get(book_id)
+            if book is not None:
+                yield book
+
+    def items(self):
+        for book in self.values():
+            yield book.book_id, book
+
+    def _ids(self):
+        with self._lock:
+            dense = [i for i, present in enumerate(self._present) if present]
+            # 列增长后较早放入 _sparse 的ID可能落在列的范围内，合并以保持升序
+            return list(heapq.merge(dense, sorted(self._sparse)))
+
+    def _fits(self, book_id):
+        return type(book_id) is int and 0 <= book_id < len(self._present) + MAX_ID_GAP
+
+    def _is_dense(self, book_id):
+        return type(book_id) is int and 0 <= book_id < len(self._present) and self._present[book_id]
+
+    def _grow(self, size):
+        extra = size - len(self._present)
+        self._present.extend(bytes(extra))
+        zeros = [0] * extra
+        for column in (self._title_offsets, self._title_lengths, self._author_refs,
+                       self._years, self._isbns):
+            column.extend(zeros)
+
+    def _write(self, book_id, book):
+        title = book.title
+        encoded = _encode_title(title)
+        if encoded is not None and len(encoded) < _TITLE_OTHER:
+            self._title_offsets[book_id] = len(self._text)
+            self._title_lengths[book_id] = len(encoded)
+            self._text += encoded
+        else:
+            self._title_lengths[book_id] = _TITLE_OTHER
+            self._other[(book_id, 'title')] = title
+
+        author = book.author
+        if author is None:
+            self._author_refs[book_id] = _AUTHOR_NONE
+        elif type(author) is str:
+            self._author_refs[book_id] = self._intern_author(author)
+        else:
+            self._author_refs[book_id] = _AUTHOR_OTHER
+            self._other[(book_id, 'author')] = author
+
+        year = book.publication_year
+        if type(year) is int and _YEAR_OTHER < year < 2 ** 31:
+            self._years[book_id] = year
+        else:
+            self._years[book_id] = _YEAR_OTHER
+            self._other[(book_id, 'publication_year')] = year
+
+        isbn = book.isbn
+        if isbn is None:
+            self._isbns[book_id] = _ISBN_NONE
+        elif _numeric_isbn(isbn):
+            self._isbns[book_id] = int(isbn)
+        else:
+            self._isbns[book_id] = _ISBN_OTHER
+            self._other[(book_id, 'isbn')] = isbn
+
+    def _read(self, book_id):
+        length = self._title_lengths[book_id]
+        if length == _TITLE_OTHER:
+            title = self._other[(book_id, 'title')]
+        else:
+            offset = self._title_offsets[book_id]
+            title = self._text[offset:offset + length].decode('utf-8')
+
+        ref = self._author_refs[book_id]
+        author = self._other[(book_id, 'author')] if ref == _AUTHOR_OTHER else self._authors[ref]
+
+        year = self._years[book_id]
+        if year == _YEAR_OTHER:
+            year = self._other[(book_id, 'publication_year')]
+
+        isbn = self._isbns[book_id]
+        if isbn == _ISBN_NONE:
+            isbn = None
+        elif isbn == _ISBN_OTHER:
+            isbn = self._other[(book_id, 'isbn')]
+        else:
+            isbn = str(isbn)
+        return Book(book_id, title, author, year, isbn)
+
+    def _release(self, book_id):
+        """丢弃一行的旧值，标题字节留在标题区中等待整理"""
+        length = self._title_lengths[book_id]
+        if length != _TITLE_OTHER:
+            self._garbage += length
+            self._title_lengths[book_id] = 0
+        for field in _FIELDS:
+            self._other.pop((book_id, field), None)
+        if self._garbage > COMPACT_THRESHOLD and self._garbage * 2 > len(self._text):
+            self._compact_text()
+
+    def _compact_text(self):
+        text = bytearray()
+        for book_id, present in enumerate(self._present):
+            length = self._title_lengths[book_id]
+            if not present or length == _TITLE_OTHER:
+                continue
+            offset = self._title_offsets[book_id]
+            self._title_offsets[book_id] = len(text)
+            text += self._text[offset:offset + length]
+        self._text = text
+        self._garbage = 0
+
+    def _intern_author(self, author):
+        # 作者数量远少于书籍数量，驻留表只增不减
+        ref = self._author_ids.get(author)
+        if ref is None:
+            ref = len(self._authors)
+            self._authors.append(author)
+            self._author_ids[author] = ref
+        return ref
+
+
+def _encode_title(title):
+    """返回标题的 UTF-8 编码，无法放入标题区时返回 None"""
+    if type(title) is not str:
+        return None
+    try:
+        return title.encode('utf-8')
+    except UnicodeEncodeError:
+        return None
+
+
+def _numeric_isbn(isbn):
+    """可以无损保存为整数的 ISBN：不以 0 开头的纯数字"""
+    return (type(isbn) is str and 0 < len(isbn) <= 18 and isbn.isascii()
+            and isbn.isdigit() and isbn[0] != '0')
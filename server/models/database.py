@@ -1,30 +1,249 @@
+import bisect
+import contextlib
+import threading
+
+from server.models.columnar import ColumnarBookStore
+from server.models.search import InvertedIndex
+from server.models.snapshot import CopyOnWriteBookStore
+
+
+class DuplicateISBNError(ValueError):
+    """ISBN 已被另一本书使用"""
+    
+    def __init__(self, isbn):
+        self.isbn = isbn
+        super().__init__(f"ISBN已存在: {isbn}")
+
+
+class InvalidBookError(ValueError):
+    """书籍字段的类型无法保存或建立索引"""
+
+
+# 书籍字段允许的类型，与 JSON 的标量一致；bool 是 int 的子类，不能作为ID
+_FIELD_TYPES = (str, int, float, bool)
+
+
+def validate_book(book):
+    """检查书籍字段的类型，不合法时抛出 InvalidBookError
+
+    在修改存储和索引之前调用，避免写到一半失败留下不一致的索引。
+    """
+    if book.book_id is not None and (not isinstance(book.book_id, int) or isinstance(book.book_id, bool)):
+        raise InvalidBookError(f"无效的书籍ID: {book.book_id!r}")
+    for name in ('title', 'author', 'publication_year', 'isbn'):
+        value = getattr(book, name)
+        if value is not None and not isinstance(value, _FIELD_TYPES):
+            raise InvalidBookError(f"字段 {name} 必须是字符串、数字或布尔值")
+
+
 class Database:
-    def __init__(self):
-        self.books = {}
+    """内存数据库
+
+    写操作由 lock 串行化。书籍本身保存在写时复制的存储中：按ID读取、
+    完整列表和分页读取的是最近发布的不可变快照，无需加锁，不会被写入
+    阻塞，也不会阻塞写入。二级索引和全文索引原地更新，按条件查询和
+    全文检索仍在锁内进行。
+
+    紧凑存储不支持写时复制，读取在存储内部的锁内进行，完整列表先整体
+    复制各列再在锁外生成 Book 对象。
+    """
+
+    def __init__(self, compact=False):
+        # compact 为 True 时按列紧凑存储书籍，读取时按需生成 Book 对象
+        self.books = ColumnarBookStore() if compact else CopyOnWriteBookStore()
         self.next_id = 1
+        # 二级索引：ISBN -> ID（唯一），作者 -> ID集合，出版年份 -> ID集合
+        self.isbn_index = {}
+        self.author_index = {}
+        self.year_index = {}
+        # year_index 中的年份按升序排列，用于范围查询；不同年份的数量远小于书籍数，
+        # 插入和删除一本书只在出现新年份或某年份最后一本书被删除时修改该列表
+        self.years = []
+        # 标题和作者的全文倒排索引
+        self.search_index = InvertedIndex()
+        # 保护书籍、索引和 next_id 的可重入锁，需要"读取-修改-写入"的调用方也可以持有它
+        self.lock = threading.RLock()
+        # 书籍被添加、修改或删除后以书籍ID调用的回调，例如使响应缓存失效
+        self.listeners = []
+        # batch() 期间暂存的通知，快照发布后再调用回调
+        self._deferred = None
+    
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+    
+    def _notify(self, book_id):
+        if self._deferred is not None:
+            self._deferred.append(book_id)
+            return
+        for callback in self.listeners:
+            callback(book_id)
     
     def get_all_books(self):
-        return list(self.books.values())
+        """按ID升序返回全部书籍，结果来自同一个一致的快照"""
+        return list(self.books.snapshot().values())
+    
+    def count_books(self):
+        return len(self.books)
     
     def get_book_by_id(self, book_id):
         return self.books.get(book_id)
     
+    def get_books_page(self, after_id=None, limit=100):
+        """按ID升序返回 ID 大于 after_id 的最多 limit 本书籍"""
+        return self.books.page(after_id, limit)
+    
+    def find_books(self, author=None, isbn=None, year_from=None, year_to=None):
+        """按作者、ISBN和出版年份范围查询书籍，结果按ID升序
+
+        先用选择性最高的索引得到候选集，再逐本检查其余条件。
+        """
+        if author is None and isbn is None and year_from is None and year_to is None:
+            return self.get_all_books()
+        with self.lock:
+            if isbn is not None:
+                book_id = self.isbn_index.get(isbn)
+                candidates = [] if book_id is None else [book_id]
+            elif author is not None:
+                candidates = sorted(self.author_index.get(author, ()))
+            elif year_from is not None or year_to is not None:
+                start = 0 if year_from is None else bisect.bisect_left(self.years, year_from)
+                end = len(self.years) if year_to is None else bisect.bisect_right(self.years, year_to)
+                candidates = sorted(book_id for year in self.years[start:end]
+                                    for book_id in self.year_index[year])
+            
+            return [
+                self.books[book_id] for book_id in candidates
+                if self._matches(self.books[book_id], author, isbn, year_from, year_to)
+            ]
+    
+    def search_books(self, query, limit=20):
+        """全文检索标题和作者，返回按相关度排序的 (书籍, 分数) 列表"""
+        with self.lock:
+            return [(self.books[book_id], score)
+                    for book_id, score in self.search_index.search(query, limit)]
+    
+    @staticmethod
+    def _matches(book, author, isbn, year_from, year_to):
+        if author is not None and book.author != author:
+            return False
+        if isbn is not None and book.isbn != isbn:
+            return False
+        if year_from is not None or year_to is not None:
+            year = book.publication_year
+            if not isinstance(year, int):
+                return False
+            if year_from is not None and year < year_from:
+                return False
+            if year_to is not None and year > year_to:
+                return False
+        return True
+    
+    def _check_isbn(self, book, book_id):
+        owner = self.isbn_index.get(book.isbn)
+        if book.isbn is not None and owner is not None and owner != book_id:
+            raise DuplicateISBNError(book.isbn)
+    
+    def _index_book(self, book):
+        if book.isbn is not None:
+            self.isbn_index[book.isbn] = book.book_id
+        if book.author is not None:
+            self.author_index.setdefault(book.author, set()).add(book.book_id)
+        # 只有整数年份参与范围查询
+        if isinstance(book.publication_year, int):
+            ids = self.year_index.get(book.publication_year)
+            if ids is None:
+                ids = self.year_index[book.publication_year] = set()
+                bisect.insort(self.years, book.publication_year)
+            ids.add(book.book_id)
+        self.search_index.add(book.book_id, book.title, book.author)
+    
+    def _unindex_book(self, book):
+        if book.isbn is not None:
+            self.isbn_index.pop(book.isbn, None)
+        if book.author is not None:
+            ids = self.author_index.get(book.author)
+            if ids is not None:
+                ids.discard(book.book_id)
+                if not ids:
+                    del self.author_index[book.author]
+        if isinstance(book.publication_year, int):
+            ids = self.year_index.get(book.publication_year)
+            if ids is not None:
+                ids.discard(book.book_id)
+                if not ids:
+                    del self.year_index[book.publication_year]
+                    del self.years[bisect.bisect_left(self.years, book.publication_year)]
+        self.search_index.remove(book.book_id)
+    
     def add_book(self, book):
-        if book.book_id is None:
-            book.book_id = self.next_id
-            self.next_id += 1
-        self.books[book.book_id] = book
-        return book
+        validate_book(book)
+        with self.lock:
+            self._check_isbn(book, book.book_id)
+            if book.book_id is None:
+                book.book_id = self.next_id
+                self.next_id += 1
+            elif book.book_id >= self.next_id:
+                self.next_id = book.book_id + 1
+            existing = self.books.get(book.book_id)
+            if existing is not None:
+                self._unindex_book(existing)
+            self.books[book.book_id] = book
+            self._index_book(book)
+            self._notify(book.book_id)
+            return book
+    
+    @contextlib.contextmanager
+    def batch(self):
+        """在一次加锁中执行多个写操作，读者要么看到全部修改，要么一个也看不到
+
+        修改的通知推迟到最外层 batch() 发布快照之后，回调（例如响应缓存）
+        不会在新数据对读者可见之前重新读到旧的快照。
+        """
+        with self.lock:
+            outermost = self._deferred is None
+            if outermost:
+                self._deferred = []
+            try:
+                with self.books.batch():
+                    yield
+            finally:
+                if outermost:
+                    deferred, self._deferred = self._deferred, None
+                    for book_id in deferred:
+                        self._notify(book_id)
+    
+    def add_books(self, books):
+        """在一次加锁中添加多本书籍，所有书籍同时对读者可见
+
+        返回与输入顺序一致的列表，每项是添加后的书籍，或导致该项失败的
+        DuplicateISBNError 或 InvalidBookError。
+        """
+        results = []
+        with self.batch():
+            for book in books:
+                try:
+                    results.append(self.add_book(book))
+                except (DuplicateISBNError, InvalidBookError) as e:
+                    results.append(e)
+        return results
     
     def update_book(self, book_id, updated_book):
-        if book_id in self.books:
-            updated_book.book_id = book_id
-            self.books[book_id] = updated_book
-            return True
-        return False
+        validate_book(updated_book)
+        with self.lock:
+            if book_id in self.books:
+                self._check_isbn(updated_book, book_id)
+                self._unindex_book(self.books[book_id])
+                updated_book.book_id = book_id
+                self.books[book_id] = updated_book
+                self._index_book(updated_book)
+                self._notify(book_id)
+                return True
+            return False
     
     def delete_book(self, book_id):
-        if book_id in self.books:
-            del self.books[book_id]
-            return True
-        return False 
\ No newline at end of file
+        with self.lock:
+            if book_id in self.books:
+                self._unindex_book(self.books.pop(book_id))
+                self._notify(book_id)
+                return True
+            return False
@@ -0,0 +1,429 @@
+import contextlib
+import os
+import re
+import threading
+import time
+import logging
+
+from common import codec
+from server.models.book import Book
+from server.models.database import Database
+
+logger = logging.getLogger(__name__)
+
+# 日志落盘策略
+#   always:   每条记录写入后立即 fsync，写入返回即已持久化
+#   group:    组提交，后台线程合并多条记录一起 fsync，写入方等待落盘后返回
+#   interval: 后台线程定期 fsync，写入方不等待，崩溃时最多丢失一个周期的数据
+#   none:     只写入操作系统缓存，由操作系统决定何时落盘
+FSYNC_POLICIES = ('always', 'group', 'interval', 'none')
+# interval 策略默认的 fsync 周期（秒）
+DEFAULT_FSYNC_INTERVAL = 1.0
+
+SNAPSHOT_FILE = 'snapshot.jsonl'
+_SEGMENT_PATTERN = re.compile(r'^wal-(\d{10})\.log$')
+
+
+def _segment_name(number):
+    return f"wal-{number:010d}.log"
+
+
+def _fsync_directory(directory):
+    """rename 之后同步目录项，保证新文件名在崩溃后可见"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """按段存储的追加写日志
+
+    每条记录是一行JSON。日志由多个段文件组成，生成快照时切换到新的段，
+    快照完成后删除已被快照覆盖的旧段。
+    """
+
+    def __init__(self, directory, fsync_policy='group', group_commit_interval=0.0,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"不支持的落盘策略: {fsync_policy}")
+        if fsync_interval <= 0:
+            raise ValueError(f"fsync 周期必须为正数: {fsync_interval}")
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        self.group_commit_interval = group_commit_interval
+        self.fsync_interval = fsync_interval
+        self.fsync_count = 0
+
+        os.makedirs(directory, exist_ok=True)
+        existing = self.segments()
+        self.segment = existing[-1] + 1 if existing else 1
+        self._file = open(os.path.join(directory, _segment_name(self.segment)), 'ab')
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._seq = 0
+        self._durable_seq = 0
+        self._closed = False
+        self._flusher = None
+        if fsync_policy in ('group', 'interval'):
+            target = self._flush_loop if fsync_policy == 'group' else self._interval_loop
+            self._flusher = threading.Thread(target=target, name='wal-flusher', daemon=True)
+            self._flusher.start()
+
+    def segments(self):
+        """返回目录中所有日志段的编号，按从旧到新排序"""
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_PATTERN.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def read_segment(self, number):
+        """读取一个日志段中的所有记录，忽略崩溃时写了一半的最后一行"""
+        path = os.path.join(self.directory, _segment_name(number))
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    yield codec.loads(line)
+                except ValueError:
+                    logger.warning(f"日志段 {number} 末尾存在不完整的记录，已忽略")
+                    return
+
+    def append(self, record):
+        """追加一条记录，返回其序号，可用于 wait_durable"""
+        data = codec.dumps(record) + b'\n'
+        with self._lock:
+            self._file.write(data)
+            self._seq += 1
+            seq = self._seq
+            if self.fsync_policy == 'always':
+                self._sync_locked()
+            elif self.fsync_policy == 'none':
+                self._file.flush()
+                self._durable_seq = seq
+            elif self.fsync_policy == 'group':
+                self._synced.notify_all()
+            return seq
+
+    def wait_durable(self, seq):
+        """等待序号不大于 seq 的记录全部落盘（仅 group 策略需要等待）"""
+        if self.fsync_policy != 'group':
+            return
+        with self._lock:
+            while self._durable_seq < seq and not self._closed:
+                self._synced.wait()
+
+    def _sync_locked(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.fsync_count += 1
+        self._durable_seq = self._seq
+        self._synced.notify_all()
+
+    def _flush_loop(self):
+        """group 策略：有新记录就同步"""
+        while True:
+            with self._lock:
+                while self._durable_seq == self._seq and not self._closed:
+                    self._synced.wait()
+                if self._closed:
+                    return
+            # 上一次 fsync 期间到达的写入自然合并为一批；设置等待时间可以
+            # 在 fsync 很慢时进一步增大批次，但会增加单线程写入的延迟
+            if self.group_commit_interval:
+                time.sleep(self.group_commit_interval)
+            if not self._sync_pending():
+                return
+
+    def _interval_loop(self):
+        """interval 策略：每 fsync_interval 秒同步一次这段时间内追加的记录"""
+        while True:
+            with self._lock:
+                # close() 会唤醒等待，不必等到周期结束
+                deadline = time.monotonic() + self.fsync_interval
+                while not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._synced.wait(remaining)
+                if self._closed:
+                    return
+                if self._durable_seq == self._seq:
+                    continue
+            if not self._sync_pending():
+                return
+
+    def _sync_pending(self):
+        """同步已追加的记录，日志已关闭时返回 False"""
+        with self._lock:
+            if self._closed:
+                return False
+            self._file.flush()
+            target = self._seq
+            fileno = self._file.fileno()
+        # fsync 期间不持有锁，写入方可以继续追加下一批记录
+        try:
+            os.fsync(fileno)
+        except OSError:
+            # 文件已被 rotate/close 关闭，它们在关闭前已经完成同步
+            pass
+        with self._lock:
+            self.fsync_count += 1
+            if target > self._durable_seq:
+                self._durable_seq = target
+            self._synced.notify_all()
+        return True
+
+    def rotate(self):
+        """切换到新的日志段，返回被关闭的段编号"""
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
+            closed = self.segment
+            self.segment += 1
+            self._file = open(os.path.join(self.directory, _segment_name(self.segment)), 'ab')
+            _fsync_directory(self.directory)
+            return closed
+
+    def remove_segments_through(self, number):
+        """删除编号不大于 number 的日志段"""
+        for segment in self.segments():
+            if segment <= number:
+                os.remove(os.path.join(self.directory, _segment_name(segment)))
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._sync_locked()
+            self._closed = True
+            self._synced.notify_all()
+            self._file.close()
+        if self._flusher is not None:
+            self._flusher.join()
+
+
+class _CommitLock:
+    """数据库使用的可重入锁
+
+    写操作在持有锁时追加日志并记录序号；最外层释放锁之后再等待日志落盘，
+    这样等待 fsync 时不会阻塞其他写入方，多个并发写入可以合并为一次 fsync。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.wal = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._local.depth -= 1
+        pending = None
+        if self._local.depth == 0:
+            pending = getattr(self._local, 'pending', None)
+            self._local.pending = None
+        self._lock.release()
+        if pending is not None and self.wal is not None:
+            self.wal.wait_durable(pending)
+
+    def mark_pending(self, seq):
+        self._local.pending = seq
+
+
+class PersistentDatabase(Database):
+    """带预写日志和快照的持久化数据库
+
+    接口与 Database 相同。每次增删改先在内存中生效，再在同一把锁内追加
+    一条日志记录，因此日志顺序与内存中的修改顺序一致。修改在 batch() 中
+    进行，追加日志之前读者看不到它；追加失败时撤销内存中的修改再抛出异常，
+    内存中的数据不会多于日志。每写入
+    snapshot_interval 条记录，在后台生成一次快照并删除旧的日志段，
+    重启时只需加载快照并重放最近的日志段，恢复时间有上限。
+    """
+
+    def __init__(self, data_dir, fsync_policy='group', snapshot_interval=100000,
+                 group_commit_interval=0.0, compact=False, fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        super().__init__(compact=compact)
+        self.data_dir = data_dir
+        self.snapshot_interval = snapshot_interval
+        self.lock = _CommitLock()
+        self._records_since_snapshot = 0
+        self._snapshot_thread = None
+        self._replaying = True
+
+        os.makedirs(data_dir, exist_ok=True)
+        self.wal = WriteAheadLog(data_dir, fsync_policy, group_commit_interval, fsync_interval)
+        self._recover()
+        self._replaying = False
+        self.lock.wal = self.wal
+
+    def _recover(self):
+        """加载快照并重放快照之后的日志段"""
+        # 恢复期间的修改合并为一次发布，不必每本书都复制一次页表
+        with self.batch():
+            covered_segment = self._load_snapshot()
+            replayed = 0
+            for segment in self.wal.segments():
+                if segment <= covered_segment or segment == self.wal.segment:
+                    continue
+                for record in self.wal.read_segment(segment):
+                    self._apply(record)
+                    replayed += 1
+        self._records_since_snapshot = replayed
+        if self.books or replayed:
+            logger.info(f"已从 {self.data_dir} 恢复 {len(self.books)} 本书籍（重放 {replayed} 条日志）")
+
+    def _load_snapshot(self):
+        path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as f:
+            header = codec.loads(f.readline())
+            for line in f:
+                self.add_book(Book.from_dict(codec.loads(line)))
+        self.next_id = max(self.next_id, header['next_id'])
+        return header['segment']
+
+    def _apply(self, record):
+        if record['op'] == 'put':
+            self.add_book(Book.from_dict(record['book']))
+        elif record['op'] == 'delete':
+            self.delete_book(record['id'])
+
+    def _log(self, record):
+        if self._replaying:
+            return
+        self.lock.mark_pending(self.wal.append(record))
+        self._records_since_snapshot += 1
+
+    @contextlib.contextmanager
+    def batch(self):
+        """在最外层 batch() 发布修改之后才检查是否需要生成快照
+
+        batch() 中的修改在发布之前不在 books.snapshot() 里，这时切换日志段
+        生成的快照会漏掉已经写入旧日志段的修改，而旧日志段随后被删除。
+        """
+        with self.lock:
+            outermost = self._deferred is None
+            with super().batch():
+                yield
+            if (outermost and not self._replaying
+                    and self._records_since_snapshot >= self.snapshot_interval):
+                # 记录已经写入日志，生成快照失败不影响这次写入，下一次写入时重试
+                try:
+                    self._start_snapshot()
+                except OSError:
+                    logger.exception("生成快照失败")
+
+    def _restore(self, book_id, previous, next_id):
+        """追加日志失败时把 book_id 恢复为修改前的书籍（None 表示原本不存在）"""
+        current = self.books.pop(book_id, None)
+        if current is not None:
+            self._unindex_book(current)
+        if previous is not None:
+            self.books[book_id] = previous
+            self._index_book(previous)
+        self.next_id = next_id
+
+    def add_book(self, book):
+        with self.batch():
+            original_id = book.book_id
+            previous = None if original_id is None else self.books.get(original_id)
+            next_id = self.next_id
+            book = super().add_book(book)
+            try:
+                self._log({'op': 'put', 'book': book.to_dict()})
+            except BaseException:
+                self._restore(book.book_id, previous, next_id)
+                book.book_id = original_id
+                raise
+            return book
+
+    def update_book(self, book_id, updated_book):
+        with self.batch():
+            previous = self.books.get(book_id)
+            success = super().update_book(book_id, updated_book)
+            if success:
+                try:
+                    self._log({'op': 'put', 'book': updated_book.to_dict()})
+                except BaseException:
+                    self._restore(book_id, previous, self.next_id)
+                    raise
+            return success
+
+    def delete_book(self, book_id):
+        with self.batch():
+            previous = self.books.get(book_id)
+            success = super().delete_book(book_id)
+            if success:
+                try:
+                    self._log({'op': 'delete', 'id': book_id})
+                except BaseException:
+                    self._restore(book_id, previous, self.next_id)
+                    raise
+            return success
+
+    def _start_snapshot(self):
+        """在持有锁时切换日志段并取得书籍快照，序列化和写盘在后台线程完成
+
+        调用时不能有未发布的 batch()，否则快照与切换的日志段不一致。
+        """
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return
+        segment = self.wal.rotate()
+        books = self.books.snapshot()
+        next_id = self.next_id
+        self._records_since_snapshot = 0
+        self._snapshot_thread = threading.Thread(
+            target=self._write_snapshot,
+            args=(books, next_id, segment),
+            name='snapshot-writer',
+            daemon=True
+        )
+        self._snapshot_thread.start()
+
+    def snapshot(self):
+        """立即生成一次快照并等待完成"""
+        with self.lock:
+            if self._deferred is not None:
+                raise RuntimeError("不能在 batch() 中生成快照")
+            self._start_snapshot()
+            thread = self._snapshot_thread
+        thread.join()
+
+    def _write_snapshot(self, books, next_id, segment):
+        # 快照不会再被修改，书籍对象在更新时整体替换，可以在锁外序列化
+        path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                header = {'segment': segment, 'next_id': next_id, 'count': len(books)}
+                f.write(codec.dumps(header) + b'\n')
+                for book in books.values():
+                    f.write(codec.dumps(book.to_dict()) + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            _fsync_directory(self.data_dir)
+            self.wal.remove_segments_through(segment)
+            logger.info(f"已生成快照: {len(books)} 本书籍，覆盖日志段 {segment}")
+        except OSError as e:
+            logger.error(f"生成快照失败: {e}")
+
+    def close(self):
+        """等待进行中的快照完成并关闭日志"""
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        self.wal.close()
@@ -0,0 +1,119 @@
+import heapq
+import math
+import re
+import sys
+
+# 中日韩文字连续片段，以及由字母数字组成的单词
+_CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+')
+_WORD = re.compile(r'[^\W_]+')
+
+# 标题中的词比作者中的词更重要
+TITLE_WEIGHT = 2.0
+AUTHOR_WEIGHT = 1.0
+
+
+def tokenize(text, unigrams=False):
+    """将文本切分为检索词
+
+    中日韩文字按二元组（bigram）切分，单个汉字作为一个词；
+    其他文字按单词切分并转为小写。例如 "Python编程" -> ["编程", "python"]。
+    unigrams 为 True 时额外输出每个汉字，建索引时使用，以便支持单字查询。
+    """
+    if not text:
+        return []
+    text = str(text).lower()
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        if unigrams:
+            tokens.extend(run)
+    for word in _WORD.findall(_CJK_RUN.sub(' ', text)):
+        tokens.append(word)
+    return tokens
+
+
+def term_weights(title, author):
+    """计算一本书的检索词及其权重，返回 {检索词: 权重}"""
+    weights = {}
+    for term in tokenize(title, unigrams=True):
+        weights[term] = weights.get(term, 0.0) + TITLE_WEIGHT
+    for term in tokenize(author, unigrams=True):
+        weights[term] = weights.get(term, 0.0) + AUTHOR_WEIGHT
+    return weights
+
+
+def idf(total, doc_count):
+    """逆文档频率，包含该词的书籍越少，该词越重要"""
+    return math.log(1 + total / doc_count)
+
+
+class InvertedIndex:
+    """标题和作者的倒排索引
+
+    postings 记录每个词出现在哪些书籍中及其权重，doc_terms 记录每本书
+    索引了哪些词，以便在更新和删除时增量维护。
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_terms = {}
+        # 权重只有少数几种取值，共享同一个 float 对象
+        self._weights = {}
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, book_id, title, author):
+        weights = term_weights(title, author)
+        terms = []
+        for term, weight in weights.items():
+            # 驻留检索词，doc_terms 与 postings 共用同一个字符串对象
+            term = sys.intern(term)
+            self.postings.setdefault(term, {})[book_id] = self._weights.setdefault(weight, weight)
+            terms.append(term)
+        self.doc_terms[book_id] = tuple(terms)
+
+    def remove(self, book_id):
+        for term in self.doc_terms.pop(book_id, ()):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(book_id, None)
+                if not docs:
+                    del self.postings[term]
+
+    def search(self, query, limit=20):
+        """返回包含全部检索词的书籍，按相关度从高到低排列的 (book_id, score) 列表
+
+        相关度为各检索词权重与逆文档频率乘积之和。从文档数最少的词开始
+        求交集，常见词不会放大计算量。
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        postings = []
+        for term in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                return []
+            postings.append(docs)
+        postings.sort(key=len)
+
+        total = len(self.doc_terms)
+        idfs = [idf(total, len(docs)) for docs in postings]
+        rarest, others = postings[0], postings[1:]
+
+        scores = []
+        for book_id, weight in rarest.items():
+            score = weight * idfs[0]
+            for docs, term_idf in zip(others, idfs[1:]):
+                other_weight = docs.get(book_id)
+                if other_weight is None:
+                    break
+                score += other_weight * term_idf
+            else:
+                scores.append((score, -book_id, book_id))
+        # 分数相同时ID小的排在前面
+        return [(book_id, score) for score, _, book_id in heapq.nlargest(limit, scores)]
@@ -0,0 +1,214 @@
+import bisect
+import contextlib
+import threading
+from itertools import chain
+
+# 书籍按ID分页保存，每页最多 2 ** PAGE_BITS 个ID；写操作只复制被修改的页
+PAGE_BITS = 10
+
+
+class BookSnapshot:
+    """某一时刻全部书籍的只读视图
+
+    pages 是 页号 -> {ID: Book}，页内按ID升序；page_numbers 是升序排列的
+    页号。快照发布之后其中的字典不再被修改，读者无需加锁即可任意遍历。
+    """
+
+    __slots__ = ('pages', 'page_numbers', 'count', 'version')
+
+    def __init__(self, pages=None, page_numbers=(), count=0, version=0):
+        self.pages = {} if pages is None else pages
+        self.page_numbers = page_numbers
+        self.count = count
+        self.version = version
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, book_id):
+        return self.get(book_id) is not None
+
+    def __iter__(self):
+        for number in self.page_numbers:
+            yield from self.pages[number]
+
+    def get(self, book_id, default=None):
+        try:
+            page = self.pages.get(book_id >> PAGE_BITS)
+        except TypeError:
+            return default
+        if page is None:
+            return default
+        return page.get(book_id, default)
+
+    def values(self):
+        return chain.from_iterable([self.pages[number].values() for number in self.page_numbers])
+
+    def items(self):
+        return chain.from_iterable([self.pages[number].items() for number in self.page_numbers])
+
+    def page(self, after_id=None, limit=100):
+        """按ID升序返回 ID 大于 after_id 的最多 limit 本书籍"""
+        numbers = self.page_numbers
+        start = 0 if after_id is None else bisect.bisect_left(numbers, after_id >> PAGE_BITS)
+        books = []
+        for i in range(start, len(numbers)):
+            for book_id, book in self.pages[numbers[i]].items():
+                if after_id is not None and book_id <= after_id:
+                    continue
+                books.append(book)
+                if len(books) >= limit:
+                    return books
+        return books
+
+
+class CopyOnWriteBookStore:
+    """写时复制的 dict 替代品，读者通过不可变的 BookSnapshot 无锁读取
+
+    写操作复制被修改的页（最多 2 ** PAGE_BITS 本书）和页表，生成新的快照
+    后替换 _snapshot 引用。替换引用是原子的，读者拿到的要么是修改前的
+    快照，要么是修改后的快照，遍历期间不受并发写入影响，写入方也从不
+    等待读者。batch() 内的多次修改共用一份副本，结束时一起发布，读者
+    同时看到全部修改。
+
+    写操作之间由内部的锁串行化。batch() 期间，执行批量写入的线程读到
+    自己尚未发布的修改，其他线程仍然读到上一个快照。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._snapshot = BookSnapshot()
+        # batch() 期间的工作副本，以及已经复制过、可以原地修改的页号
+        self._pending = None
+        self._owned = None
+        self._writer = None
+        self._depth = 0
+
+    def snapshot(self):
+        """返回最近发布的快照，O(1)
+
+        batch() 中尚未发布的修改不在其中，包括当前线程自己的修改。
+        """
+        return self._snapshot
+
+    def _current(self):
+        pending = self._pending
+        if pending is not None and self._writer == threading.get_ident():
+            return pending
+        return self._snapshot
+
+    def __len__(self):
+        return len(self._current())
+
+    def __contains__(self, book_id):
+        return book_id in self._current()
+
+    def __iter__(self):
+        return iter(self._current())
+
+    def __getitem__(self, book_id):
+        book = self._current().get(book_id)
+        if book is None:
+            raise KeyError(book_id)
+        return book
+
+    def get(self, book_id, default=None):
+        return self._current().get(book_id, default)
+
+    def keys(self):
+        return list(self._current())
+
+    def values(self):
+        return self._current().values()
+
+    def items(self):
+        return self._current().items()
+
+    def page(self, after_id=None, limit=100):
+        """按ID升序返回 ID 大于 after_id 的最多 limit 本书籍"""
+        return self._current().page(after_id, limit)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """合并多次修改，最外层的 batch() 结束时一次发布"""
+        self._begin()
+        try:
+            yield
+        finally:
+            self._end()
+
+    def _begin(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            current = self._snapshot
+            self._pending = BookSnapshot(dict(current.pages), list(current.page_numbers),
+                                         current.count, current.version + 1)
+            self._owned = set()
+            self._writer = threading.get_ident()
+        self._depth += 1
+
+    def _end(self):
+        self._depth -= 1
+        if self._depth == 0:
+            pending = self._pending
+            changed = bool(self._owned)
+            self._pending = self._owned = self._writer = None
+            # 出现异常时也发布已完成的修改，与调用方已经更新的索引保持一致
+            if changed:
+                self._snapshot = BookSnapshot(pending.pages, tuple(pending.page_numbers),
+                                              pending.count, pending.version)
+        self._lock.release()
+
+    def _writable_page(self, number, create):
+        """返回页号为 number 的页在工作副本中的可修改拷贝"""
+        pending = self._pending
+        page = pending.pages.get(number)
+        if page is not None and number in self._owned:
+            return page
+        if page is None:
+            if not create:
+                return None
+            page = {}
+            bisect.insort(pending.page_numbers, number)
+        else:
+            page = dict(page)
+        pending.pages[number] = page
+        self._owned.add(number)
+        return page
+
+    def __setitem__(self, book_id, book):
+        self._begin()
+        try:
+            page = self._writable_page(book_id >> PAGE_BITS, create=True)
+            if book_id in page:
+                page[book_id] = book
+                return
+            last = next(reversed(page), None)
+            page[book_id] = book
+            self._pending.count += 1
+            # 自动分配的ID单调递增，直接追加即保持页内有序；显式指定的较小ID需要重排
+            if last is not None and book_id < last:
+                items = sorted(page.items())
+                page.clear()
+                page.update(items)
+        finally:
+            self._end()
+
+    def pop(self, book_id, *default):
+        self._begin()
+        try:
+            if book_id not in self._pending:
+                if default:
+                    return default[0]
+                raise KeyError(book_id)
+            number = book_id >> PAGE_BITS
+            page = self._writable_page(number, create=False)
+            book = page.pop(book_id)
+            self._pending.count -= 1
+            if not page:
+                pending = self._pending
+                del pending.pages[number]
+                del pending.page_numbers[bisect.bisect_left(pending.page_numbers, number)]
+            return book
+        finally:
+            self._end()
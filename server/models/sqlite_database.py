@@ -0,0 +1,419 @@
+import contextlib
+import secrets
+import sqlite3
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 flock，不支持多个进程共享数据库
+    fcntl = None
+
+from server.models.book import Book
+from server.models.database import DuplicateISBNError, InvalidBookError, validate_book
+from server.models.search import tokenize, term_weights, idf
+
+# 预写日志落盘策略对应的 SQLite synchronous 级别
+#   always/group: 每次提交都 fsync，写入返回时已持久化
+#   interval:     WAL 模式下只在检查点时 fsync，断电可能丢失最近的提交
+#   none:         不调用 fsync
+SYNCHRONOUS_LEVELS = {
+    'always': 'FULL',
+    'group': 'FULL',
+    'interval': 'NORMAL',
+    'none': 'OFF',
+}
+
+# 每个连接缓存的预编译语句数，动态拼接的查询条件组合也能命中缓存
+STATEMENT_CACHE_SIZE = 256
+
+# 除 id 外的列不声明类型，SQLite 不做类型转换，读出的值与写入时相同
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title,
+    author,
+    publication_year,
+    isbn UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_books_author ON books (author);
+CREATE INDEX IF NOT EXISTS idx_books_year ON books (publication_year, id);
+CREATE TABLE IF NOT EXISTS book_terms (
+    term TEXT NOT NULL,
+    book_id INTEGER NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (term, book_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_book_terms_book ON book_terms (book_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS book_versions (
+    book_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_book_versions_version ON book_versions (version);
+"""
+
+# 书籍的版本号由触发器在写事务中维护，与 VersionTracker 的规则相同：每次修改
+# 都分配一个新的全局版本号，集合的版本号就是最大的版本号。删除的书籍保留版本
+# 记录，版本号不会回退。多个进程共享数据库时，各进程据此得到一致的 ETag。
+VERSION_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS books_version_{event} AFTER {event} ON books BEGIN
+    INSERT INTO book_versions (book_id, version)
+    VALUES ({row}.id, (SELECT COALESCE(MAX(version), 0) + 1 FROM book_versions))
+    ON CONFLICT (book_id) DO UPDATE SET version = excluded.version;
+END;
+"""
+
+BOOK_COLUMNS = "id, title, author, publication_year, isbn"
+SELECT_BOOKS = f"SELECT {BOOK_COLUMNS} FROM books"
+SELECT_BOOK = f"{SELECT_BOOKS} WHERE id = ?"
+SELECT_PAGE = f"{SELECT_BOOKS} WHERE id > ? ORDER BY id LIMIT ?"
+SELECT_SEQUENCE = "SELECT seq FROM sqlite_sequence WHERE name = 'books'"
+COUNT_BOOKS = "SELECT COUNT(*) FROM books"
+# 显式指定的ID已存在时替换原书籍，与内存数据库的 add_book 一致
+UPSERT_BOOK = (
+    f"INSERT INTO books ({BOOK_COLUMNS}) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (id) DO UPDATE SET title = excluded.title, author = excluded.author, "
+    "publication_year = excluded.publication_year, isbn = excluded.isbn"
+)
+UPDATE_BOOK = "UPDATE books SET title = ?, author = ?, publication_year = ?, isbn = ? WHERE id = ?"
+DELETE_BOOK = "DELETE FROM books WHERE id = ?"
+INSERT_TERM = "INSERT INTO book_terms (term, book_id, weight) VALUES (?, ?, ?)"
+DELETE_TERMS = "DELETE FROM book_terms WHERE book_id = ?"
+SELECT_VERSION = "SELECT version FROM book_versions WHERE book_id = ?"
+SELECT_COLLECTION_VERSION = "SELECT COALESCE(MAX(version), 0) FROM book_versions"
+INSERT_EPOCH = "INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)"
+SELECT_EPOCH = "SELECT value FROM meta WHERE key = 'epoch'"
+
+
+class InterProcessLock:
+    """进程内可重入、进程间互斥的锁
+
+    线程之间由 RLock 互斥，最外层加锁时再对锁文件加 flock，使多个进程中
+    "读取-修改-写入"的操作（如 If-Match 检查后更新）也不会交错。
+    """
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise RuntimeError("当前平台不支持进程间锁")
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = open(path, 'a+b')
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def close(self):
+        self._file.close()
+
+
+class SQLiteDatabase:
+    """基于 SQLite 的书籍存储
+
+    接口与 Database 相同。数据库使用 WAL 模式，读操作不会被写操作阻塞；
+    每个线程使用自己的连接，写操作在进程内由 lock 串行化。ISBN、作者和
+    出版年份上建有索引，全文检索使用与 InvertedIndex 相同分词和权重的
+    book_terms 表，两种存储返回的检索结果一致。
+
+    shared=True 时数据库由多个进程共享，lock 换成基于锁文件的进程间锁。
+    每个进程必须在 fork 之后各自创建 SQLiteDatabase，连接不能跨进程使用。
+    """
+
+    def __init__(self, path, fsync_policy='group', timeout=30.0, shared=False):
+        if fsync_policy not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"不支持的落盘策略: {fsync_policy}")
+        self.path = path
+        self.synchronous = SYNCHRONOUS_LEVELS[fsync_policy]
+        self.timeout = timeout
+        self.shared = shared
+        # 与 Database.lock 相同，需要"读取-修改-写入"的调用方也可以持有它
+        self.lock = InterProcessLock(f"{path}.lock") if shared else threading.RLock()
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # 书籍被添加、修改或删除并提交后，仍持有 lock 时以书籍ID调用的回调
+        self.listeners = []
+
+        conn = self._connection()
+        with self.lock:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA + "".join(
+                VERSION_TRIGGERS.format(event=event, row=row)
+                for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD'))
+            ))
+            conn.execute(INSERT_EPOCH, (secrets.token_hex(4),))
+        # 数据库创建时随机生成，重建数据库后旧的 ETag 不会匹配
+        self.epoch = conn.execute(SELECT_EPOCH).fetchone()[0]
+
+    def _connection(self):
+        """返回当前线程的连接，首次使用时创建"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None 关闭隐式事务，由 _transaction 显式控制
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=STATEMENT_CACHE_SIZE
+            )
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """写事务，BEGIN IMMEDIATE 在开始时就获取写锁，避免提交时才发现冲突"""
+        with self.lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def _snapshot(self):
+        """读事务，事务内的多条查询看到同一个一致的快照"""
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _notify(self, book_id):
+        for callback in self.listeners:
+            callback(book_id)
+
+    def close(self):
+        """关闭所有线程的连接"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+        if self.shared:
+            self.lock.close()
+
+    @property
+    def next_id(self):
+        """下一个自动分配的ID，删除过的ID不会被重新分配"""
+        row = self._connection().execute(SELECT_SEQUENCE).fetchone()
+        return (row[0] if row else 0) + 1
+
+    @staticmethod
+    def _row(book):
+        return (book.book_id, book.title, book.author, book.publication_year, book.isbn)
+
+    @staticmethod
+    def _term_rows(book):
+        return [(term, book.book_id, weight)
+                for term, weight in term_weights(book.title, book.author).items()]
+
+    def get_all_books(self):
+        return [Book(*row) for row in self._connection().execute(f"{SELECT_BOOKS} ORDER BY id")]
+
+    def count_books(self):
+        return self._connection().execute(COUNT_BOOKS).fetchone()[0]
+
+    def book_version(self, book_id):
+        """书籍的版本号，从未修改过的书籍为 0"""
+        row = self._connection().execute(SELECT_VERSION, (book_id,)).fetchone()
+        return row[0] if row else 0
+
+    def collection_version(self):
+        return self._connection().execute(SELECT_COLLECTION_VERSION).fetchone()[0]
+
+    def get_book_by_id(self, book_id):
+        row = self._connection().execute(SELECT_BOOK, (book_id,)).fetchone()
+        return Book(*row) if row else None
+
+    def get_books_page(self, after_id=None, limit=100):
+        """按ID升序返回 ID 大于 after_id 的最多 limit 本书籍"""
+        after_id = 0 if after_id is None else after_id
+        return [Book(*row) for row in self._connection().execute(SELECT_PAGE, (after_id, limit))]
+
+    def find_books(self, author=None, isbn=None, year_from=None, year_to=None):
+        """按作者、ISBN和出版年份范围查询书籍，结果按ID升序"""
+        conditions = []
+        params = []
+        if author is not None:
+            conditions.append("author = ?")
+            params.append(author)
+        if isbn is not None:
+            conditions.append("isbn = ?")
+            params.append(isbn)
+        if year_from is not None or year_to is not None:
+            # 只有整数年份参与范围查询
+            conditions.append("typeof(publication_year) = 'integer'")
+            if year_from is not None:
+                conditions.append("publication_year >= ?")
+                params.append(year_from)
+            if year_to is not None:
+                conditions.append("publication_year <= ?")
+                params.append(year_to)
+        sql = SELECT_BOOKS
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id"
+        return [Book(*row) for row in self._connection().execute(sql, params)]
+
+    def search_books(self, query, limit=20):
+        """全文检索标题和作者，返回按相关度排序的 (书籍, 分数) 列表"""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        placeholders = ", ".join("?" * len(terms))
+        with self._snapshot() as conn:
+            doc_counts = dict(conn.execute(
+                f"SELECT term, COUNT(*) FROM book_terms WHERE term IN ({placeholders}) GROUP BY term",
+                terms
+            ))
+            if len(doc_counts) < len(terms):
+                return []
+            total = conn.execute(COUNT_BOOKS).fetchone()[0]
+
+            # 每个检索词的权重乘以其逆文档频率，包含全部检索词的书籍才参与排序
+            cases = " ".join("WHEN ? THEN ?" for _ in terms)
+            case_params = []
+            for term in terms:
+                case_params.extend((term, idf(total, doc_counts[term])))
+            rows = conn.execute(
+                f"SELECT b.id, b.title, b.author, b.publication_year, b.isbn, s.score FROM ("
+                f"SELECT book_id, SUM(weight * CASE term {cases} END) AS score FROM book_terms "
+                f"WHERE term IN ({placeholders}) GROUP BY book_id HAVING COUNT(*) = ? "
+                f"ORDER BY score DESC, book_id LIMIT ?"
+                f") AS s JOIN books AS b ON b.id = s.book_id ORDER BY s.score DESC, s.book_id",
+                case_params + terms + [len(terms), limit]
+            ).fetchall()
+        return [(Book(*row[:5]), row[5]) for row in rows]
+
+    def _insert(self, conn, book):
+        try:
+            cursor = conn.execute(UPSERT_BOOK, self._row(book))
+        except sqlite3.IntegrityError:
+            raise DuplicateISBNError(book.isbn) from None
+        if book.book_id is None:
+            book.book_id = cursor.lastrowid
+        else:
+            conn.execute(DELETE_TERMS, (book.book_id,))
+        conn.executemany(INSERT_TERM, self._term_rows(book))
+
+    def add_book(self, book):
+        validate_book(book)
+        with self.lock:
+            with self._transaction() as conn:
+                self._insert(conn, book)
+            self._notify(book.book_id)
+        return book
+
+    def add_books(self, books):
+        """在一个事务中添加多本书籍
+
+        先预分配ID并用 executemany 批量写入；批次中有ISBN冲突时回滚该批次，
+        改为逐本写入以得到每本书的结果。返回值与 Database.add_books 相同。
+        """
+        books = list(books)
+        invalid = {}
+        for i, book in enumerate(books):
+            try:
+                validate_book(book)
+            except InvalidBookError as e:
+                invalid[i] = e
+        with self.lock:
+            added = iter(self._add_books([book for i, book in enumerate(books) if i not in invalid]))
+            results = [invalid[i] if i in invalid else next(added) for i in range(len(books))]
+            for result in results:
+                if isinstance(result, Book):
+                    self._notify(result.book_id)
+        return results
+
+    def _add_books(self, books):
+        with self._transaction() as conn:
+            original_ids = [book.book_id for book in books]
+            row = conn.execute(SELECT_SEQUENCE).fetchone()
+            next_id = (row[0] if row else 0) + 1
+            for book in books:
+                if book.book_id is None:
+                    book.book_id = next_id
+                    next_id += 1
+                elif book.book_id >= next_id:
+                    next_id = book.book_id + 1
+
+            conn.execute("SAVEPOINT bulk_insert")
+            try:
+                conn.executemany(UPSERT_BOOK, [self._row(book) for book in books])
+                conn.executemany(DELETE_TERMS, [(book.book_id,) for book in books])
+                conn.executemany(INSERT_TERM, [row for book in books for row in self._term_rows(book)])
+                conn.execute("RELEASE bulk_insert")
+                return books
+            except sqlite3.IntegrityError:
+                conn.execute("ROLLBACK TO bulk_insert")
+                conn.execute("RELEASE bulk_insert")
+                for book, book_id in zip(books, original_ids):
+                    book.book_id = book_id
+
+            results = []
+            for book in books:
+                try:
+                    self._insert(conn, book)
+                    results.append(book)
+                except DuplicateISBNError as e:
+                    results.append(e)
+            return results
+
+    def update_book(self, book_id, updated_book):
+        validate_book(updated_book)
+        with self.lock:
+            with self._transaction() as conn:
+                try:
+                    cursor = conn.execute(UPDATE_BOOK, self._row(updated_book)[1:] + (book_id,))
+                except sqlite3.IntegrityError:
+                    raise DuplicateISBNError(updated_book.isbn) from None
+                if cursor.rowcount == 0:
+                    return False
+                updated_book.book_id = book_id
+                conn.execute(DELETE_TERMS, (book_id,))
+                conn.executemany(INSERT_TERM, self._term_rows(updated_book))
+            self._notify(book_id)
+            return True
+
+    def delete_book(self, book_id):
+        with self.lock:
+            with self._transaction() as conn:
+                if conn.execute(DELETE_BOOK, (book_id,)).rowcount == 0:
+                    return False
+                conn.execute(DELETE_TERMS, (book_id,))
+            self._notify(book_id)
+            return True
@@ -0,0 +1,255 @@
+import heapq
+import itertools
+import queue
+import selectors
+import socket
+import sys
+import threading
+import time
+import logging
+from http.server import HTTPServer
+
+from common import codec
+
+logger = logging.getLogger(__name__)
+
+# 队列已满时直接返回给客户端的响应
+_BUSY_BODY = codec.dumps({"message": "服务器繁忙，请稍后重试"})
+_BUSY_RESPONSE = (
+    b'HTTP/1.0 503 Service Unavailable\r\n'
+    b'Content-Type: application/json\r\n'
+    b'Content-Length: ' + str(len(_BUSY_BODY)).encode('ascii') + b'\r\n'
+    b'Retry-After: 1\r\n'
+    b'Connection: close\r\n'
+    b'\r\n' + _BUSY_BODY
+)
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """使用固定大小线程池和有界队列处理请求的HTTP服务器
+
+    监听线程只负责accept连接并放入队列，由工作线程完成请求处理。
+    队列满时最多等待 queue_timeout 秒，仍然没有空位则直接返回503，
+    避免无限堆积连接。
+
+    还没有数据可读的连接（刚建立的连接、两个请求之间的长连接）不交给
+    工作线程，而是停放在一个 selector 中，由等待线程在连接可读后放入队列。
+    大量空闲的长连接因此不会占满工作线程。刚建立的连接最多等待
+    request_timeout 秒，长连接最多等待处理器的 idle_timeout 秒，超时后关闭。
+    """
+
+    # BookView 在两个请求之间把连接交还服务器，而不是阻塞工作线程
+    park_connections = True
+    # HTTPServer 默认的监听队列只有 5，同时建立大量连接时客户端要等待 SYN 重传
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(self, server_address, handler_class, pool_size=16,
+                 queue_size=64, request_timeout=30.0, queue_timeout=1.0, reuse_port=False):
+        # 多个进程监听同一端口（SO_REUSEPORT），由内核分配连接
+        self.allow_reuse_port = reuse_port
+        self.pool_size = pool_size
+        self.request_timeout = request_timeout
+        self.queue_timeout = queue_timeout
+        self._requests = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        self.rejected_requests = 0
+        # 等待线程之外的线程通过 _parking 提交要停放的连接，再写 _wakeup_w 唤醒它
+        self._parking = []
+        self._parking_lock = threading.Lock()
+        self._closed = False
+        # 停止时置位，之后的响应都告知客户端关闭连接
+        self.draining = False
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        try:
+            super().__init__(server_address, handler_class)
+        except BaseException:
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+            raise
+        self._start_workers()
+
+    def _start_workers(self):
+        for i in range(self.pool_size):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"book-server-worker-{i}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        self._watcher = threading.Thread(
+            target=self._watch_loop,
+            name="book-server-idle",
+            daemon=True
+        )
+        self._watcher.start()
+
+    def _worker_loop(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                self._requests.task_done()
+                break
+            request, client_address, handler = item
+            try:
+                if handler is None:
+                    handler = self.RequestHandlerClass(request, client_address, self)
+                else:
+                    handler.resume()
+            except Exception:
+                handler = None
+                self.handle_error(request, client_address)
+            if handler is not None and getattr(handler, 'parked', False):
+                self._park((request, client_address, handler), handler.idle_timeout)
+            else:
+                self.shutdown_request(request)
+            self._requests.task_done()
+
+    @property
+    def pending_requests(self):
+        """队列中和正在处理的连接数"""
+        return self._requests.unfinished_tasks
+
+    def process_request(self, request, client_address):
+        """已经有数据可读的连接放入队列，否则停放到数据到达"""
+        request.settimeout(0)
+        try:
+            ready = True
+            request.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            ready = False
+        except OSError:
+            # 连接已出错，交给工作线程按普通的读取错误处理
+            pass
+        # 单次读写的超时；BookView 还以它作为读完整个请求的截止时间，
+        # 逐字节缓慢发送的客户端也不能长期占用工作线程
+        request.settimeout(self.request_timeout)
+        item = (request, client_address, None)
+        if ready:
+            self._enqueue(item)
+        else:
+            self._park(item, self.request_timeout)
+
+    def _enqueue(self, item):
+        """将可读的连接放入队列，队列已满时返回503并关闭连接"""
+        try:
+            self._requests.put(item, timeout=self.queue_timeout)
+        except queue.Full:
+            self.rejected_requests += 1
+            logger.warning(f"请求队列已满，拒绝来自 {item[1]} 的连接")
+            try:
+                item[0].sendall(_BUSY_RESPONSE)
+            except OSError:
+                pass
+            self._close_connection(item)
+
+    def _park(self, item, timeout):
+        """把连接交给等待线程，timeout 秒内没有数据到达则关闭"""
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._parking_lock:
+            closed = self._closed
+            if not closed:
+                self._parking.append((item, deadline))
+        if closed:
+            self._close_connection(item)
+            return
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except OSError:
+            # 缓冲区已满说明等待线程已经会被唤醒
+            pass
+
+    def _close_connection(self, item):
+        request, client_address, handler = item
+        if handler is not None:
+            handler.parked = False
+            try:
+                handler.finish()
+            except OSError:
+                pass
+        self.shutdown_request(request)
+
+    def _watch_loop(self):
+        """等待停放的连接可读，可读的放入队列，超时的关闭"""
+        selector = selectors.DefaultSelector()
+        selector.register(self._wakeup_r, selectors.EVENT_READ)
+        parked = {}
+        # (截止时间, 序号, 连接)，连接被取走或重新停放后留下的旧条目在到期时跳过
+        deadlines = []
+        counter = itertools.count()
+        try:
+            while True:
+                with self._parking_lock:
+                    incoming, self._parking = self._parking, []
+                    closed = self._closed
+                for item, deadline in incoming:
+                    request = item[0]
+                    try:
+                        selector.register(request, selectors.EVENT_READ, item)
+                    except (ValueError, OSError):
+                        self._close_connection(item)
+                        continue
+                    parked[request] = item
+                    if deadline is not None:
+                        heapq.heappush(deadlines, (deadline, next(counter), item))
+                if closed:
+                    break
+
+                timeout = None
+                if deadlines:
+                    timeout = max(deadlines[0][0] - time.monotonic(), 0)
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is self._wakeup_r:
+                        try:
+                            while self._wakeup_r.recv(4096):
+                                pass
+                        except OSError:
+                            pass
+                        continue
+                    selector.unregister(key.fileobj)
+                    del parked[key.fileobj]
+                    self._enqueue(key.data)
+
+                now = time.monotonic()
+                while deadlines and deadlines[0][0] <= now:
+                    item = heapq.heappop(deadlines)[2]
+                    if parked.get(item[0]) is item:
+                        selector.unregister(item[0])
+                        del parked[item[0]]
+                        self._close_connection(item)
+        finally:
+            for item in parked.values():
+                self._close_connection(item)
+            selector.close()
+
+    def handle_error(self, request, client_address):
+        """超时和连接断开只记录日志，其他异常沿用默认处理"""
+        error = sys.exc_info()[1]
+        if isinstance(error, (socket.timeout, ConnectionError)):
+            logger.info(f"来自 {client_address} 的请求已中断: {error!r}")
+            return
+        super().handle_error(request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        # 等待线程关闭所有停放的连接后退出
+        with self._parking_lock:
+            self._closed = True
+            incoming, self._parking = self._parking, []
+        for item, _ in incoming:
+            self._close_connection(item)
+        self._wakeup()
+        self._watcher.join()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+        # 通知工作线程退出；队列仍满时工作线程是守护线程，随进程结束
+        for _ in self._workers:
+            try:
+                self._requests.put_nowait(None)
+            except queue.Full:
+                break
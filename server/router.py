@@ -0,0 +1,119 @@
+from collections import namedtuple
+
+# 匹配结果：成功时 handler 和 params 有值；路径存在但方法不支持时只有 allowed；
+# route 为匹配到的路径模板，可以作为指标的标签
+RouteMatch = namedtuple('RouteMatch', ['handler', 'params', 'allowed', 'route'])
+
+NOT_FOUND = RouteMatch(None, None, None, None)
+
+
+def _to_int(segment):
+    # 只接受 ASCII 数字，int() 还会接受正负号、空白和全角数字
+    if not (segment.isascii() and segment.isdigit()):
+        raise ValueError(segment)
+    return int(segment)
+
+
+def _to_str(segment):
+    if not segment:
+        raise ValueError(segment)
+    return segment
+
+
+# 路径参数的类型：{name:type}，未指定类型时为 str
+CONVERTERS = {
+    'int': _to_int,
+    'str': _to_str,
+}
+
+
+class _Node:
+    __slots__ = ('children', 'params', 'methods', 'template')
+
+    def __init__(self):
+        # 字面量段 -> 子节点
+        self.children = {}
+        # [(参数名, 转换函数, 子节点)]，按注册顺序尝试
+        self.params = []
+        # 请求方法 -> 处理函数，模板在该节点结束时才有值
+        self.methods = {}
+        self.template = None
+
+
+class Router:
+    """按请求方法和路径模板分发请求的路由表
+
+    模板由 / 分隔的段组成，{name} 或 {name:type} 形式的段匹配一个非空段，
+    按 CONVERTERS 中的类型转换后作为参数传给处理函数，转换失败视为不匹配。
+    不含参数的模板保存在字典中，一次查找即可命中；含参数的模板组织为按段
+    查找的前缀树，匹配耗时与路径段数成正比，字面量段优先于参数段。
+    """
+
+    def __init__(self, routes=()):
+        self._static = {}
+        self._root = _Node()
+        for method, template, handler in routes:
+            self.add(method, template, handler)
+
+    def add(self, method, template, handler):
+        if '{' not in template:
+            self._static.setdefault(template, {})[method] = handler
+            return
+        node = self._root
+        for segment in template.split('/')[1:]:
+            if segment.startswith('{') and segment.endswith('}'):
+                name, _, kind = segment[1:-1].partition(':')
+                convert = CONVERTERS[kind or 'str']
+                for param_name, param_convert, child in node.params:
+                    if param_name == name and param_convert is convert:
+                        node = child
+                        break
+                else:
+                    child = _Node()
+                    node.params.append((name, convert, child))
+                    node = child
+            else:
+                node = node.children.setdefault(segment, _Node())
+        node.methods[method] = handler
+        node.template = template
+
+    def match(self, method, path):
+        """返回 RouteMatch，路径不存在时为 NOT_FOUND"""
+        methods = self._static.get(path)
+        if methods is not None:
+            handler = methods.get(method)
+            if handler is not None:
+                return RouteMatch(handler, {}, None, path)
+        params = {}
+        node = self._match(self._root, path.split('/')[1:], 0, params)
+        if node is not None:
+            handler = node.methods.get(method)
+            if handler is not None:
+                return RouteMatch(handler, params, None, node.template)
+            route = node.template
+            methods = {**(methods or {}), **node.methods}
+        else:
+            route = path
+        if methods:
+            return RouteMatch(None, None, tuple(sorted(methods)), route)
+        return NOT_FOUND
+
+    def _match(self, node, segments, index, params):
+        if index == len(segments):
+            return node if node.methods else None
+        segment = segments[index]
+        child = node.children.get(segment)
+        if child is not None:
+            found = self._match(child, segments, index + 1, params)
+            if found is not None:
+                return found
+        for name, convert, child in node.params:
+            try:
+                params[name] = convert(segment)
+            except ValueError:
+                continue
+            found = self._match(child, segments, index + 1, params)
+            if found is not None:
+                return found
+            del params[name]
+        return None
@@ -1,29 +1,99 @@
+import argparse
+import os
 import socket
+import time
 from http.server import HTTPServer
 import threading
 import json
 import logging
 
-from server.models import Database
+from server.models import Database, PersistentDatabase, SQLiteDatabase, FSYNC_POLICIES
+from server.models.persistence import DEFAULT_FSYNC_INTERVAL
 from server.controllers import BookController
 from server.views import BookView
+from server.pool import ThreadPoolHTTPServer
+from server.cache import ResponseCache, DEFAULT_CACHE_ENTRIES
+from server.versions import DatabaseVersionTracker
+from server.async_server import AsyncHTTPServer
+from server.compression import DEFAULT_COMPRESSION_LEVEL, DEFAULT_COMPRESSION_MIN_SIZE
+from server.metrics import Metrics
+from server.access_log import AccessLog
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# 支持的服务器引擎和并发模式
+ENGINES = ('threaded', 'asyncio')
+CONCURRENCY_MODES = ('pool', 'single')
+# 支持的存储后端
+STORAGE_BACKENDS = ('memory', 'sqlite')
+# sqlite 存储在数据目录中的文件名
+SQLITE_FILE = 'books.db'
+
 class BookServer:
-    def __init__(self, host='localhost', port=8000):
+    def __init__(self, host='localhost', port=8000, engine='threaded',
+                 concurrency='pool', pool_size=16, queue_size=64,
+                 request_timeout=30.0, idle_timeout=60.0,
+                 max_keepalive_requests=1000, data_dir=None,
+                 fsync_policy='group', fsync_interval=DEFAULT_FSYNC_INTERVAL,
+                 storage='memory', compact=False,
+                 cache_size=DEFAULT_CACHE_ENTRIES,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL,
+                 compression_min_size=DEFAULT_COMPRESSION_MIN_SIZE,
+                 metrics=True, reuse_port=False, shared_storage=False,
+                 access_log='-', access_log_sample_rate=1.0):
+        if engine not in ENGINES:
+            raise ValueError(f"不支持的服务器引擎: {engine}")
+        if concurrency not in CONCURRENCY_MODES:
+            raise ValueError(f"不支持的并发模式: {concurrency}")
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError(f"不支持的存储后端: {storage}")
+        if not 0 <= compression_level <= 9:
+            raise ValueError(f"无效的压缩级别: {compression_level}")
+        if storage == 'sqlite' and not data_dir:
+            raise ValueError("sqlite 存储需要指定数据目录")
+        if shared_storage and storage != 'sqlite':
+            raise ValueError("多个进程共享存储需要使用 sqlite 存储")
         self.host = host
         self.port = port
-        self.database = Database()
-        self.controller = BookController(self.database)
+        self.engine = engine
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.request_timeout = request_timeout
+        self.idle_timeout = idle_timeout
+        self.max_keepalive_requests = max_keepalive_requests
+        self.compression_level = compression_level
+        self.compression_min_size = compression_min_size
+        self.reuse_port = reuse_port
+        self.data_dir = data_dir
+        self.storage = storage
+        if storage == 'sqlite':
+            os.makedirs(data_dir, exist_ok=True)
+            self.database = SQLiteDatabase(
+                os.path.join(data_dir, SQLITE_FILE), fsync_policy=fsync_policy, shared=shared_storage
+            )
+        elif data_dir:
+            self.database = PersistentDatabase(data_dir, fsync_policy=fsync_policy, compact=compact,
+                                               fsync_interval=fsync_interval)
+        else:
+            self.database = Database(compact=compact)
+        # cache_size 为 0 时不缓存响应。共享存储时其他进程的修改不会通知本进程，
+        # 不能缓存响应，ETag 的版本号也要从数据库读取
+        versions = None
+        if shared_storage:
+            cache_size = 0
+            versions = DatabaseVersionTracker(self.database)
+        self.cache = ResponseCache(max_entries=cache_size) if cache_size > 0 else None
+        self.controller = BookController(self.database, response_cache=self.cache, versions=versions)
+        # 请求指标，通过 GET /metrics 导出
+        self.metrics = Metrics() if metrics else None
+        # 访问日志写入的文件路径，"-" 为标准错误，None 时不记录
+        self.access_log = AccessLog(access_log, access_log_sample_rate) if access_log else None
         self.server = None
         self.server_thread = None
-        self._add_sample_data()
+        # 持久化存储中已有数据时不再添加示例数据
+        if not self.database.get_all_books():
+            self._add_sample_data()
     
     def _add_sample_data(self):
         """添加一些示例数据"""
@@ -51,16 +121,63 @@ class BookServer:
         for book_data in sample_books:
             self.controller.create_book(book_data)
     
+    def _create_http_server(self):
+        """根据引擎和并发模式创建底层HTTP服务器"""
+        if self.engine == 'asyncio':
+            return AsyncHTTPServer(
+                (self.host, self.port),
+                self.controller,
+                idle_timeout=self.idle_timeout,
+                request_timeout=self.request_timeout,
+                max_keepalive_requests=self.max_keepalive_requests,
+                compression_level=self.compression_level,
+                compression_min_size=self.compression_min_size,
+                metrics=self.metrics,
+                reuse_port=self.reuse_port,
+                access_log=self.access_log,
+                pool_size=self.pool_size
+            )
+        handler = BookView.create_handler_class(
+            self.controller,
+            idle_timeout=self.idle_timeout,
+            max_keepalive_requests=self.max_keepalive_requests,
+            compression_level=self.compression_level,
+            compression_min_size=self.compression_min_size,
+            metrics=self.metrics,
+            access_log=self.access_log
+        )
+        if self.concurrency == 'pool':
+            return ThreadPoolHTTPServer(
+                (self.host, self.port),
+                handler,
+                pool_size=self.pool_size,
+                queue_size=self.queue_size,
+                request_timeout=self.request_timeout,
+                reuse_port=self.reuse_port
+            )
+        # 单线程模式下同样设置超时，避免一个慢连接永久阻塞服务器
+        handler.timeout = self.request_timeout
+        server = HTTPServer((self.host, self.port), handler, bind_and_activate=False)
+        server.allow_reuse_port = self.reuse_port
+        try:
+            server.server_bind()
+            server.server_activate()
+        except BaseException:
+            server.server_close()
+            raise
+        return server
+    
     def start(self):
         """启动HTTP服务器"""
         try:
-            handler = BookView.create_handler_class(self.controller)
-            self.server = HTTPServer((self.host, self.port), handler)
+            self.server = self._create_http_server()
+            # 端口为0时由系统分配，记录实际监听的端口
+            self.port = self.server.server_address[1]
             self.server_thread = threading.Thread(target=self.server.serve_forever)
             self.server_thread.daemon = True
             self.server_thread.start()
             
-            logger.info(f"服务器已启动在 http://{self.host}:{self.port}")
+            logger.info(f"服务器已启动在 http://{self.host}:{self.port} (引擎: {self.engine}, 并发模式: {self.concurrency})")
             logger.info("按 Ctrl+C 停止服务器")
             
             return True
@@ -68,25 +185,133 @@ class BookServer:
             logger.error(f"启动服务器时出错: {e}")
             return False
     
+    def drain(self, timeout):
+        """停止接受新连接，最多等待 timeout 秒让正在处理的请求完成
+
+        停止后发出的响应都带有 Connection: close，空闲的长连接直接关闭。
+        正在处理的请求数来自请求指标，线程池模式下还包括队列中尚未处理
+        的连接。返回时仍未完成的请求数。
+        """
+        server = self.server
+        if server:
+            server.draining = True
+            server.shutdown()
+            server.server_close()
+            self.server = None
+            logger.info("服务器已停止接受新连接")
+        deadline = time.monotonic() + timeout
+        in_flight = self._in_flight(server)
+        while in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+            in_flight = self._in_flight(server)
+        return in_flight
+    
+    def _in_flight(self, server):
+        """正在处理的请求数，取请求指标和线程池计数中较大的一个"""
+        in_flight = self.metrics.in_flight() if self.metrics is not None else 0
+        return max(in_flight, getattr(server, 'pending_requests', 0))
+    
     def stop(self):
         """停止HTTP服务器"""
         if self.server:
             self.server.shutdown()
             self.server.server_close()
             logger.info("服务器已停止")
+        if self.access_log is not None:
+            self.access_log.close()
+        if isinstance(self.database, (PersistentDatabase, SQLiteDatabase)):
+            self.database.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="书籍管理服务器")
+    parser.add_argument("--host", default="localhost", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--engine", choices=ENGINES, default="threaded",
+                        help="服务器引擎: threaded 基于 http.server, asyncio 基于 asyncio streams")
+    parser.add_argument("--concurrency", choices=CONCURRENCY_MODES, default="pool",
+                        help="threaded 引擎的并发模式: pool 为有界线程池, single 为单线程")
+    parser.add_argument("--pool-size", type=int, default=16, help="线程池大小；asyncio 引擎中为执行写请求的线程数")
+    parser.add_argument("--queue-size", type=int, default=64, help="等待队列长度")
+    parser.add_argument("--request-timeout", type=float, default=30.0,
+                        help="单个请求的读写超时（秒）")
+    parser.add_argument("--idle-timeout", type=float, default=60.0,
+                        help="长连接等待下一个请求的超时（秒）")
+    parser.add_argument("--max-keepalive-requests", type=int, default=1000,
+                        help="单个长连接最多处理的请求数")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_ENTRIES,
+                        help="响应缓存最多保存的响应数，0 表示不缓存")
+    parser.add_argument("--compression-level", type=int, choices=range(10),
+                        default=DEFAULT_COMPRESSION_LEVEL, metavar="{0-9}",
+                        help="gzip/deflate 响应压缩级别，0 表示不压缩")
+    parser.add_argument("--compression-min-size", type=int, default=DEFAULT_COMPRESSION_MIN_SIZE,
+                        help="小于该字节数的响应不压缩")
+    parser.add_argument("--no-metrics", dest="metrics", action="store_false",
+                        help="不统计请求指标，GET /metrics 返回 404")
+    parser.add_argument("--access-log", default="-", metavar="PATH",
+                        help="JSON Lines 格式的访问日志文件，- 表示标准错误")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_const", const=None,
+                        help="不记录访问日志")
+    parser.add_argument("--access-log-sample", type=float, default=1.0, metavar="RATE",
+                        help="成功请求的访问日志抽样比例（0-1），错误请求始终记录")
+    parser.add_argument("--storage", choices=STORAGE_BACKENDS, default="memory",
+                        help="存储后端: memory 为内存（指定数据目录时使用预写日志持久化）, sqlite 为 SQLite 数据库")
+    parser.add_argument("--compact", action="store_true",
+                        help="memory 存储按列紧凑保存书籍，适合数百万本书籍")
+    parser.add_argument("--data-dir", help="持久化数据目录，不指定时数据只保存在内存中")
+    parser.add_argument("--fsync", choices=FSYNC_POLICIES, default="group",
+                        help="落盘策略")
+    parser.add_argument("--fsync-interval", type=float, default=DEFAULT_FSYNC_INTERVAL,
+                        help="interval 落盘策略的 fsync 周期（秒）")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="工作进程数，大于 1 时多个进程通过 SO_REUSEPORT 监听同一端口，需要 sqlite 存储")
+    parser.add_argument("--drain-timeout", type=float, default=10.0,
+                        help="多进程模式停止时等待正在处理的请求完成的最长时间（秒）")
+    return parser.parse_args(argv)
 
-def main():
-    server = BookServer()
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    options = dict(
+        host=args.host,
+        port=args.port,
+        engine=args.engine,
+        concurrency=args.concurrency,
+        pool_size=args.pool_size,
+        queue_size=args.queue_size,
+        request_timeout=args.request_timeout,
+        idle_timeout=args.idle_timeout,
+        max_keepalive_requests=args.max_keepalive_requests,
+        data_dir=args.data_dir,
+        fsync_policy=args.fsync,
+        fsync_interval=args.fsync_interval,
+        storage=args.storage,
+        compact=args.compact,
+        cache_size=args.cache_size,
+        compression_level=args.compression_level,
+        compression_min_size=args.compression_min_size,
+        metrics=args.metrics,
+        access_log=args.access_log,
+        access_log_sample_rate=args.access_log_sample
+    )
+    if args.workers > 1:
+        # supervisor 模块依赖本模块的 BookServer，在这里导入避免循环导入
+        from server.supervisor import Supervisor
+        Supervisor(args.workers, drain_timeout=args.drain_timeout, **options).run()
+        return
+    server = BookServer(**options)
     try:
         if server.start():
             # 让主线程等待，直到用户按Ctrl+C
             try:
                 while True:
-                    pass
+                    time.sleep(1)
             except KeyboardInterrupt:
                 pass
     finally:
         server.stop()
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,182 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+from server.server import BookServer
+
+logger = logging.getLogger(__name__)
+
+# 工作进程退出后至少间隔该秒数才重启，避免启动即崩溃时反复 fork
+RESTART_DELAY = 1.0
+# 默认等待正在处理的请求完成的最长时间（秒）
+DEFAULT_DRAIN_TIMEOUT = 10.0
+# 主循环检查工作进程状态的间隔（秒）
+POLL_INTERVAL = 0.1
+
+
+class Supervisor:
+    """多进程模式的主进程：预先 fork 多个工作进程，共同监听同一端口
+
+    每个工作进程运行一个完整的 BookServer，监听套接字设置 SO_REUSEPORT，
+    由内核在各进程之间分配连接，JSON 编解码和请求解析不再受单个进程的
+    GIL 限制。主进程不处理请求，只负责：
+
+    - 工作进程异常退出时重新启动它（同一个槽位两次启动至少间隔 RESTART_DELAY）；
+    - 收到 SIGTERM/SIGINT 时通知所有工作进程停止接受新连接，等待正在处理
+      的请求完成（最多 drain_timeout 秒），超时后强制结束。
+
+    一致性模型：所有工作进程共享数据目录中的同一个 SQLite 数据库。写操作
+    由数据库文件上的进程间锁和 SQLite 事务串行化，提交后立即对所有进程
+    可见；读操作直接查询数据库，任何进程都能读到已提交的最新数据。ETag
+    的版本号保存在数据库中，条件请求在各进程之间一致。进程内的响应缓存
+    无法得知其他进程的修改，因此不启用。请求指标按进程统计，/metrics 只
+    返回处理该请求的工作进程的指标。
+    """
+
+    def __init__(self, workers, drain_timeout=DEFAULT_DRAIN_TIMEOUT, **server_options):
+        if workers < 1:
+            raise ValueError(f"无效的工作进程数: {workers}")
+        if not hasattr(socket, 'SO_REUSEPORT') or not hasattr(os, 'fork'):
+            raise RuntimeError("当前平台不支持多进程模式")
+        if server_options.get('storage') != 'sqlite':
+            raise ValueError("多进程模式需要使用 sqlite 存储")
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self.server_options = dict(server_options, reuse_port=True, shared_storage=True)
+        self.host = server_options.get('host', 'localhost')
+        self.port = server_options.get('port', 8000)
+        # 槽位 -> 工作进程的 pid
+        self.pids = {}
+        self._started_at = {}
+        self._stopping = threading.Event()
+        self._reserved = None
+
+    def _reserve_port(self):
+        """绑定但不监听端口：端口为 0 时确定实际端口，工作进程重启期间端口也不会被占用
+
+        只有处于监听状态的套接字参与 SO_REUSEPORT 的连接分配，这个套接字不会收到连接。
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        self._reserved = sock
+        self.port = sock.getsockname()[1]
+        self.server_options['port'] = self.port
+
+    def _prepare_database(self):
+        """在 fork 之前创建数据库和示例数据，避免多个工作进程同时初始化"""
+        server = BookServer(**self.server_options)
+        server.stop()
+
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = self._run_worker(slot)
+            except BaseException:
+                logger.exception(f"工作进程 {slot} 异常退出")
+            finally:
+                # 不执行主进程注册的清理逻辑
+                os._exit(code)
+        self.pids[slot] = pid
+        self._started_at[slot] = time.monotonic()
+        logger.info(f"工作进程 {slot} 已启动 (pid {pid})")
+
+    def _run_worker(self, slot):
+        """工作进程的主函数，返回退出码"""
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        # Ctrl+C 会发给整个进程组，由主进程统一处理
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self._reserved.close()
+        server = BookServer(**self.server_options)
+        try:
+            if not server.start():
+                return 1
+            stop.wait()
+            remaining = server.drain(self.drain_timeout)
+            if remaining:
+                logger.warning(f"工作进程 {slot} 仍有 {remaining} 个请求未完成")
+        finally:
+            server.stop()
+        return 0
+
+    def _reap(self):
+        """回收已退出的工作进程，返回其槽位列表"""
+        exited = []
+        for slot, pid in list(self.pids.items()):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 0
+            if done:
+                del self.pids[slot]
+                exited.append(slot)
+                if not self._stopping.is_set():
+                    logger.warning(f"工作进程 {slot} (pid {pid}) 意外退出，状态 {status}")
+        return exited
+
+    def start(self):
+        """初始化数据库并启动所有工作进程"""
+        self._reserve_port()
+        self._prepare_database()
+        for slot in range(self.workers):
+            self._spawn(slot)
+        logger.info(f"服务器已启动在 http://{self.host}:{self.port} ({self.workers} 个工作进程)")
+
+    def supervise(self):
+        """重启意外退出的工作进程，直到调用 stop()"""
+        restart_at = {}
+        while not self._stopping.is_set():
+            for slot in self._reap():
+                restart_at[slot] = self._started_at[slot] + RESTART_DELAY
+            now = time.monotonic()
+            for slot, when in list(restart_at.items()):
+                if now >= when and not self._stopping.is_set():
+                    del restart_at[slot]
+                    self._spawn(slot)
+            self._stopping.wait(POLL_INTERVAL)
+
+    def stop(self):
+        """通知工作进程排空请求后退出，超时仍未退出的强制结束"""
+        self._stopping.set()
+        for pid in self.pids.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        # 工作进程先停止接受连接，再等待请求完成，额外留出启动和关闭的时间
+        deadline = time.monotonic() + self.drain_timeout + 5.0
+        while self.pids and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(POLL_INTERVAL)
+        for slot, pid in list(self.pids.items()):
+            logger.warning(f"工作进程 {slot} (pid {pid}) 未能按时退出，强制结束")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            del self.pids[slot]
+        if self._reserved is not None:
+            self._reserved.close()
+            self._reserved = None
+        logger.info("所有工作进程已停止")
+
+    def run(self):
+        """启动工作进程并监督它们，收到 SIGTERM 或 SIGINT 后优雅退出"""
+        def request_stop(signum, frame):
+            self._stopping.set()
+
+        previous = {sig: signal.signal(sig, request_stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            self.start()
+            self.supervise()
+        finally:
+            self.stop()
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
@@ -0,0 +1,103 @@
+import secrets
+import threading
+
+from common.msgpack_codec import FORMAT as MSGPACK_FORMAT
+from server.compression import ENCODINGS
+
+# 同一版本的不同表示在 ETag 末尾附加的后缀，按附加顺序的逆序排列
+_VARIANTS = ENCODINGS + (MSGPACK_FORMAT,)
+
+
+class VersionTracker:
+    """书籍和书籍集合的版本号，用于生成 ETag
+
+    每次修改都使全局计数器加一，被修改书籍的版本号设为新的计数值，集合的
+    版本号就是计数器本身。启动后从未修改过的书籍版本号为 0。版本号只保存
+    在内存中，ETag 带有每次启动随机生成的 epoch，重启前后的 ETag 不会相同。
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self.collection_version = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def book_changed(self, book_id):
+        """书籍被添加、修改或删除时调用"""
+        with self._lock:
+            self.collection_version += 1
+            self._versions[book_id] = self.collection_version
+
+    def book_etag(self, book_id):
+        return f'"{self.epoch}-{book_id}-{self._versions.get(book_id, 0)}"'
+
+    def collection_etag(self, variant=None):
+        """完整列表的 ETag，variant 区分同一版本的不同表示（如字段投影）"""
+        suffix = f"-{variant}" if variant else ""
+        return f'"{self.epoch}-books-{self.collection_version}{suffix}"'
+
+
+class DatabaseVersionTracker:
+    """从数据库读取版本号的 VersionTracker
+
+    版本号由 SQLiteDatabase 在写事务中维护，共享同一个数据库的多个进程
+    生成相同的 ETag。每次生成 ETag 都要查询一次数据库。
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.epoch = database.epoch
+
+    def book_changed(self, book_id):
+        """版本号已由数据库更新，无需处理"""
+
+    @property
+    def collection_version(self):
+        return self.database.collection_version()
+
+    def book_etag(self, book_id):
+        return f'"{self.epoch}-{book_id}-{self.database.book_version(book_id)}"'
+
+    def collection_etag(self, variant=None):
+        suffix = f"-{variant}" if variant else ""
+        return f'"{self.epoch}-books-{self.collection_version}{suffix}"'
+
+
+def encoded_etag(etag, variant):
+    """同一版本的其他表示（压缩编码、数据格式）使用不同的强 ETag
+
+    例如 "abc-1-0" -> "abc-1-0-gzip"，variant 为 None 时返回原 ETag。
+    """
+    if etag is None or variant is None:
+        return etag
+    return f'{etag[:-1]}-{variant}"'
+
+
+def _strip_variants(etag):
+    for variant in _VARIANTS:
+        suffix = f'-{variant}"'
+        if etag.endswith(suffix):
+            etag = etag[:-len(suffix)] + '"'
+    return etag
+
+
+def etag_matches(header, etag, weak=False):
+    """判断 If-Match / If-None-Match 请求头是否包含 etag
+
+    If-None-Match 使用弱比较（weak=True），忽略 W/ 前缀；If-Match 使用强比较。
+    同一版本的各个表示内容相同，比较时忽略 ETag 中的编码和格式后缀。
+    """
+    if header is None:
+        return False
+    header = header.strip()
+    if header == '*':
+        return True
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if _strip_variants(candidate) == etag:
+            return True
+    return False
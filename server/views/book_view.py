@@ -1,8 +1,126 @@
-import json
+import io
+import logging
+import socket
+import time
 from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import parse_qs
+
+from common import codec, msgpack_codec
+from server.cache import BOOK_KEY
+from server.compression import (
+    DEFAULT_COMPRESSION_LEVEL, DEFAULT_COMPRESSION_MIN_SIZE,
+    negotiate_encoding, compress, compress_stream
+)
+from server.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, UNMATCHED_ROUTE
+from server.router import Router
+from server.versions import etag_matches, encoded_etag
+from server.controllers.book_controller import (
+    DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT, status_for_error
+)
+
+logger = logging.getLogger(__name__)
+
+# GET /books 支持的查询过滤参数
+FILTER_PARAMS = ('author', 'isbn', 'year_from', 'year_to')
+
+# 未读取的请求体超过该大小时直接关闭连接，而不是读取后丢弃
+MAX_DISCARD_BYTES = 64 * 1024
+
+# 批量操作的路径
+BATCH_PATH = '/books:batch'
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+# 请求体和响应体支持的数据格式：媒体类型 -> 编解码模块
+WIRE_FORMATS = {
+    codec.CONTENT_TYPE: codec,
+    msgpack_codec.CONTENT_TYPE: msgpack_codec,
+    msgpack_codec.LEGACY_CONTENT_TYPE: msgpack_codec,
+}
+
+class RequestReader(socket.SocketIO):
+    """连接的原始读取端，读取一个请求的总时间不超过截止时间
+
+    套接字超时只限制单次 recv 的等待时间，客户端每隔不到超时时间发送一个
+    字节就能一直占用工作线程。deadline 不为 None 时，每次 recv 之前把超时
+    缩短为距截止时间的剩余时间，到期后抛出 TimeoutError。
+    """
+
+    def __init__(self, sock):
+        super().__init__(sock, 'rb')
+        self.connection = sock
+        self.deadline = None
+
+    def readinto(self, b):
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("读取请求超时")
+            timeout = self.connection.gettimeout()
+            if timeout is None or remaining < timeout:
+                self.connection.settimeout(remaining)
+        return super().readinto(b)
+
+def negotiate_format(accept):
+    """根据 Accept 请求头选择响应格式，q 值相同或都未列出时使用 JSON"""
+    if not accept or 'msgpack' not in accept:
+        return codec
+    best = codec
+    best_quality = 0.0
+    for item in accept.split(','):
+        media_type, _, params = item.strip().partition(';')
+        wire_format = WIRE_FORMATS.get(media_type.strip().lower())
+        if wire_format is None:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality or (quality == best_quality and wire_format is codec):
+            best, best_quality = wire_format, quality
+    return best
+
+def format_variant(wire_format):
+    """缓存键和 ETag 中区分数据格式的后缀，JSON 没有后缀"""
+    return None if wire_format is codec else wire_format.FORMAT
+
+def encode_body(data=None, message=None, extra=None, wire_format=codec):
+    """将响应数据编码为响应体，默认为紧凑的UTF-8 JSON"""
+    response = {}
+    if data is not None:
+        response['data'] = data
+    if message is not None:
+        response['message'] = message
+    if extra:
+        response.update(extra)
+    return wire_format.dumps(response)
 
 class BookView(BaseHTTPRequestHandler):
+    # 使用HTTP/1.1以支持持久连接
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体合并为一次写入
+    wbufsize = io.DEFAULT_BUFFER_SIZE
+    # 流水线请求的多个小响应不能等待前一个响应的ACK
+    disable_nagle_algorithm = True
+    # 长连接等待下一个请求的最长时间（秒）
+    idle_timeout = 60.0
+    # 服务器支持停放连接时，停放前等待下一个请求的时间（秒）
+    park_delay = 0.005
+    # 单个连接最多处理的请求数，达到后在响应中告知客户端关闭连接
+    max_keepalive_requests = 1000
+    # 响应压缩级别，0 表示不压缩
+    compression_level = DEFAULT_COMPRESSION_LEVEL
+    # 小于该字节数的响应不压缩
+    compression_min_size = DEFAULT_COMPRESSION_MIN_SIZE
+    # 请求指标，为 None 时不统计
+    metrics = None
+    # 访问日志，为 None 时不记录
+    access_log = None
+    
     def __init__(self, book_controller, *args, **kwargs):
         self.book_controller = book_controller
         # 必须在最后调用父类的__init__
@@ -11,115 +129,592 @@ class BookView(BaseHTTPRequestHandler):
         pass
     
     @classmethod
-    def create_handler_class(cls, book_controller):
+    def create_handler_class(cls, book_controller, idle_timeout=None,
+                             max_keepalive_requests=None, compression_level=None,
+                             compression_min_size=None, metrics=None, access_log=None):
         """创建一个绑定了book_controller的处理器类"""
         def __init__(self, *args, **kwargs):
             self.book_controller = book_controller
             BaseHTTPRequestHandler.__init__(self, *args, **kwargs)
         
+        attrs = cls.handler_methods(book_controller, compression_level, compression_min_size,
+                                    metrics, access_log)
+        attrs.update({
+            'protocol_version': cls.protocol_version,
+            'wbufsize': cls.wbufsize,
+            'disable_nagle_algorithm': cls.disable_nagle_algorithm,
+            'idle_timeout': idle_timeout if idle_timeout is not None else cls.idle_timeout,
+            'park_delay': cls.park_delay,
+            'setup': cls.setup,
+            'handle': cls.handle,
+            'resume': cls.resume,
+            '_handle_keep_alive': cls._handle_keep_alive,
+            '_next_request_arrived': cls._next_request_arrived,
+            '_handle_request': cls._handle_request,
+            'finish': cls.finish,
+            'log_request': cls.log_request,
+            'log_message': cls.log_message
+        })
+        if max_keepalive_requests is not None:
+            attrs['max_keepalive_requests'] = max_keepalive_requests
+        
         # 创建一个新的类
-        return type('BoundBookView', (BaseHTTPRequestHandler,), {
+        return type('BoundBookView', (BaseHTTPRequestHandler,), attrs)
+
+    @classmethod
+    def handler_methods(cls, book_controller, compression_level=None, compression_min_size=None,
+                        metrics=None, access_log=None):
+        """返回处理器类需要的属性和方法，供不同的服务器引擎复用"""
+        if compression_level is None:
+            compression_level = cls.compression_level
+        if compression_min_size is None:
+            compression_min_size = cls.compression_min_size
+        attrs = {
             'book_controller': book_controller,
-            'do_GET': cls.do_GET,
-            'do_POST': cls.do_POST,
-            'do_PUT': cls.do_PUT,
-            'do_DELETE': cls.do_DELETE,
+            '_dispatch': cls._dispatch,
+            '_route': cls._route,
+            'do_GET': cls._dispatch,
+            'do_POST': cls._dispatch,
+            'do_PUT': cls._dispatch,
+            'do_DELETE': cls._dispatch,
+            'do_PATCH': cls._dispatch,
+            'max_keepalive_requests': cls.max_keepalive_requests,
+            'compression_level': compression_level,
+            'compression_min_size': compression_min_size,
+            'metrics': metrics,
+            'access_log': access_log,
+            '_log_access': cls._log_access,
+            '_count_stream': cls._count_stream,
+            '_response_encoding': cls._response_encoding,
+            '_response_format': cls._response_format,
             '_send_response': cls._send_response,
-            '_get_book_id_from_path': cls._get_book_id_from_path,
-            '_parse_request_body': cls._parse_request_body
-        })
+            '_send_body': cls._send_body,
+            '_last_request': cls._last_request,
+            '_send_cached': cls._send_cached,
+            '_not_modified': cls._not_modified,
+            '_send_stream': cls._send_stream,
+            '_stream_books': cls._stream_books,
+            '_discard_request_body': cls._discard_request_body,
+            '_parse_request_body': cls._parse_request_body,
+            '_handle_batch': cls._handle_batch,
+            '_save_book': cls._save_book
+        }
+        # 路由表中的处理方法
+        for _, _, name in ROUTES:
+            attrs[name] = getattr(cls, name)
+        return attrs
     
-    def _send_response(self, status_code, data=None, message=None):
+    def log_request(self, code='-', size='-'):
+        """请求由 access_log 记录，不再逐行写入标准错误"""
+    
+    def log_message(self, format, *args):
+        """BaseHTTPRequestHandler 报告的错误（如无效的请求行、超时）写入日志"""
+        logger.warning(f"{self.address_string()} - {format % args}")
+    
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # 以带截止时间的读取器代替 makefile 创建的 rfile
+        self.rfile.close()
+        self._reader = RequestReader(self.connection)
+        self.rfile = io.BufferedReader(self._reader)
+    
+    def handle(self):
+        """处理一个连接上的多个请求
+
+        在两个请求之间使用 idle_timeout 等待下一个请求，读取到数据后恢复
+        请求超时。流水线请求已经在 rfile 的缓冲区中，会被依次处理。
+        """
+        self._request_timeout = self.connection.gettimeout()
+        self.close_connection = True
+        self.parked = False
+        self._handle_request()
+        self._handle_keep_alive()
+    
+    def resume(self):
+        """继续处理停放的连接，由服务器在连接上有新数据时调用"""
+        self.parked = False
+        try:
+            self._handle_request()
+            self._handle_keep_alive()
+        finally:
+            self.finish()
+    
+    def _handle_keep_alive(self):
+        """处理长连接上后续的请求
+
+        服务器支持停放连接时（线程池），下一个请求还没有到达就把连接交还
+        服务器并返回，由服务器等待连接可读后调用 resume，空闲的长连接不占用
+        工作线程。
+        """
+        park = getattr(self.server, 'park_connections', False)
+        while not self.close_connection:
+            if park:
+                if not self._next_request_arrived():
+                    self.parked = True
+                    break
+            else:
+                self.connection.settimeout(self.idle_timeout)
+                try:
+                    if not self.rfile.peek(1):
+                        break
+                except (socket.timeout, OSError):
+                    break
+            self._handle_request()
+    
+    def _next_request_arrived(self):
+        """下一个请求（或对端关闭）是否在 park_delay 秒之内到达
+
+        连续发送请求的客户端通常很快发来下一个请求，短暂等待可以避免每个
+        请求都经过一次停放。rfile 超时后不能再读取，所以只以非阻塞方式检查
+        缓冲区，等待在套接字上进行。
+        """
+        self.connection.settimeout(0)
+        try:
+            if self.rfile.peek(1):
+                return True
+            self.connection.settimeout(self.park_delay)
+            self.connection.recv(1, socket.MSG_PEEK)
+        except socket.timeout:
+            return False
+        except OSError:
+            # 连接已出错，由下一次读取报告
+            pass
+        return True
+    
+    def _handle_request(self):
+        """处理一个请求，请求行、请求头和请求体必须在请求超时之内读完"""
+        timeout = self._request_timeout
+        # 停放时套接字被设为非阻塞，每个请求都要恢复请求超时
+        self.connection.settimeout(timeout)
+        if timeout:
+            self._reader.deadline = time.monotonic() + timeout
+        try:
+            self.handle_one_request()
+        finally:
+            self._reader.deadline = None
+    
+    def finish(self):
+        """停放的连接保留 rfile 和 wfile，由服务器在关闭连接前再次调用"""
+        if getattr(self, 'parked', False):
+            return
+        BaseHTTPRequestHandler.finish(self)
+    
+    def _response_encoding(self):
+        """按 Accept-Encoding 选择响应的内容编码，不压缩时返回 None"""
+        if self.compression_level <= 0:
+            return None
+        return negotiate_encoding(self.headers.get('Accept-Encoding'))
+    
+    def _response_format(self):
+        """按 Accept 选择响应的数据格式，返回编解码模块"""
+        return negotiate_format(self.headers.get('Accept'))
+    
+    def _send_response(self, status_code, data=None, message=None, extra=None):
+        wire_format = self._response_format()
+        body = b'' if status_code == 204 else encode_body(data, message, extra, wire_format)
+        encoding = None
+        if len(body) >= self.compression_min_size:
+            encoding = self._response_encoding()
+            if encoding is not None:
+                body = compress(body, encoding, self.compression_level)
+        self._send_body(status_code, body, encoding=encoding, content_type=wire_format.CONTENT_TYPE)
+    
+    def _send_body(self, status_code, body, etag=None, encoding=None,
+                   content_type=codec.CONTENT_TYPE, headers=None):
+        """发送已编码的响应体，encoding 为响应体已使用的压缩编码，headers 为额外的响应头"""
+        # 未读取的请求体会被当作下一个请求解析，必须先处理掉
+        keep_alive = True
+        if not getattr(self, '_body_consumed', False):
+            keep_alive = self._discard_request_body()
+        self._body_consumed = False
+        self._response_status = status_code
+        self._response_bytes = len(body)
+        
+        self.requests_handled = getattr(self, 'requests_handled', 0) + 1
+        
         self.send_response(status_code)
-        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-type', content_type)
+        if status_code not in (204, 304):
+            self.send_header('Content-Length', str(len(body)))
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        # 响应内容随 Accept 和 Accept-Encoding 变化，共享缓存需要分别保存
+        self.send_header('Vary', 'Accept, Accept-Encoding' if self.compression_level > 0 else 'Accept')
+        if etag is not None:
+            self.send_header('ETag', encoded_etag(etag, encoding))
+        if headers:
+            for keyword, value in headers.items():
+                self.send_header(keyword, value)
+        if not keep_alive or self._last_request():
+            self.send_header('Connection', 'close')
         self.end_headers()
+        self.wfile.write(body)
+    
+    def _last_request(self):
+        """连接上的请求数达到上限或服务器正在停止时，响应后关闭连接"""
+        return (self.requests_handled >= self.max_keepalive_requests
+                or getattr(self.server, 'draining', False))
+    
+    def _send_cached(self, key, load, etag=None):
+        """发送缓存的响应体
+
+        未命中时调用 load 获取 (数据, 错误信息)，成功的响应编码后放入缓存。
+        etag 必须在调用之前取得，这样响应体不会比 ETag 对应的版本更旧。
+        非 JSON 格式的响应体以 key + (格式,) 为键缓存，压缩后的响应体再在
+        键的末尾加上编码另外缓存。
+        """
+        wire_format = self._response_format()
+        variant = format_variant(wire_format)
+        if variant is not None:
+            key = key + (variant,)
+            etag = encoded_etag(etag, variant)
+        cache = self.book_controller.response_cache
+        body = None
+        if cache is not None:
+            generation = cache.generation
+            body = cache.get(key)
+        if body is None:
+            data, error = load()
+            if error:
+                self._send_response(status_for_error(error), message=error)
+                return
+            body = encode_body(data, wire_format=wire_format)
+            if cache is not None:
+                cache.put(key, body, generation)
+        
+        encoding = None
+        if len(body) >= self.compression_min_size:
+            encoding = self._response_encoding()
+        if encoding is not None:
+            compressed = cache.peek(key + (encoding,)) if cache is not None else None
+            if compressed is None:
+                compressed = compress(body, encoding, self.compression_level)
+                if cache is not None:
+                    cache.put(key + (encoding,), compressed, generation)
+            body = compressed
+        self._send_body(200, body, etag, encoding, wire_format.CONTENT_TYPE)
+    
+    def _not_modified(self, etag):
+        """If-None-Match 与当前 ETag 匹配时发送 304 并返回 True"""
+        header = self.headers.get('If-None-Match')
+        if not etag_matches(header, etag, weak=True):
+            return False
+        # 304 响应带上客户端缓存的那个表示的 ETag
+        wire_format = self._response_format()
+        etag = encoded_etag(etag, format_variant(wire_format))
+        encoding = self._response_encoding()
+        if encoding is None or encoded_etag(etag, encoding) not in header:
+            encoding = None
+        self._send_body(304, b'', etag, encoding, wire_format.CONTENT_TYPE)
+        return True
+    
+    def _send_stream(self, chunks, content_type):
+        """以 chunked 编码逐块发送响应，HTTP/1.0 客户端则发送完后关闭连接"""
+        self._body_consumed = False
+        self._response_status = 200
+        self.requests_handled = getattr(self, 'requests_handled', 0) + 1
+        chunked = self.request_version != 'HTTP/1.0'
+        encoding = self._response_encoding()
+        if encoding is not None:
+            chunks = compress_stream(chunks, encoding, self.compression_level)
+        if self.metrics is not None or self.access_log is not None:
+            chunks = self._count_stream(chunks)
         
-        response = {}
-        if data is not None:
-            response['data'] = data
-        if message is not None:
-            response['message'] = message
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept, Accept-Encoding' if self.compression_level > 0 else 'Accept')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        if not chunked or self._last_request():
+            self.send_header('Connection', 'close')
+        self.end_headers()
         
-        self.wfile.write(json.dumps(response).encode('utf-8'))
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            else:
+                self.wfile.write(chunk)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+    
+    def _count_stream(self, chunks):
+        """统计流式响应的字节数，分块发送完或连接中断时计入指标"""
+        count = 0
+        try:
+            for chunk in chunks:
+                count += len(chunk)
+                yield chunk
+        finally:
+            self._stream_bytes = count
+            if self.metrics is not None:
+                self.metrics.add_bytes_out(self.command, self._route_label, count)
+            # asyncio 引擎在请求处理结束后才写出分块，写完时再记录访问日志
+            if self.access_log is not None and getattr(self, 'stream', None) is not None:
+                self._log_access(time.perf_counter() - self._request_start)
     
-    def _get_book_id_from_path(self):
-        path = urlparse(self.path).path
-        parts = path.strip('/').split('/')
-        if len(parts) >= 2 and parts[0] == 'books' and parts[1]:
-            return parts[1]
-        return None
+    def _stream_books(self, fields, ndjson):
+        """逐页序列化书籍，生成响应体的各个分块"""
+        pages = self.book_controller.iter_book_pages(fields)
+        dumps = codec.dumps
+        if ndjson:
+            for books in pages:
+                yield b''.join(dumps(book) + b'\n' for book in books)
+            return
+        # 与非流式响应相同的 {"data":[...]} 结构
+        yield b'{"data":['
+        first = True
+        for books in pages:
+            chunk = b','.join(dumps(book) for book in books)
+            yield chunk if first else b',' + chunk
+            first = False
+        yield b']}'
+    
+    def _discard_request_body(self):
+        """丢弃未读取的请求体，请求体过大无法丢弃时返回 False"""
+        content_length = int(self.headers.get('Content-Length', 0) or 0)
+        if content_length <= 0:
+            return True
+        if content_length > MAX_DISCARD_BYTES:
+            return False
+        self.rfile.read(content_length)
+        return True
     
     def _parse_request_body(self):
+        self._body_consumed = True
         content_length = int(self.headers.get('Content-Length', 0))
         if content_length > 0:
-            request_body = self.rfile.read(content_length).decode('utf-8')
-            return json.loads(request_body)
+            content_type = self.headers.get('Content-Type', '').partition(';')[0].strip().lower()
+            wire_format = WIRE_FORMATS.get(content_type, codec)
+            body = wire_format.loads(self.rfile.read(content_length))
+            if wire_format is msgpack_codec:
+                msgpack_codec.check_json_compatible(body)
+            return body
         return {}
     
-    def do_GET(self):
-        parsed_url = urlparse(self.path)
-        path = parsed_url.path
-        
-        if path == '/books':
-            # 获取所有书籍
-            books = self.book_controller.get_all_books()
-            self._send_response(200, books)
-        elif path.startswith('/books/'):
-            # 获取单本书籍
-            book_id = self._get_book_id_from_path()
-            if book_id:
-                book, error = self.book_controller.get_book(book_id)
-                if book:
-                    self._send_response(200, book)
-                else:
-                    self._send_response(404, message=error)
-            else:
-                self._send_response(400, message="无效的请求路径")
+    def _handle_batch(self, operation):
+        """解析批量请求体并交给控制器，响应中包含逐项结果"""
+        try:
+            items = self._parse_request_body()
+        except codec.DecodeError:
+            self._send_response(400, message="无效的JSON数据")
+            return
+        results, error = operation(items)
+        if error:
+            # 请求体是数组但超过上限时返回413，否则格式错误
+            self._send_response(413 if isinstance(items, list) else 400, message=error)
         else:
-            self._send_response(404, message="未找到资源")
+            self._send_response(200, results)
+    
+    def _dispatch(self):
+        """按路由表分发请求，启用指标或访问日志时记录状态码、耗时和字节数"""
+        path, _, query = self.path.partition('?')
+        match = ROUTER.match(self.command, path)
+        metrics = self.metrics
+        if metrics is None and self.access_log is None:
+            self._route(match, query)
+            return
+        # 未发送响应就抛出异常时按 500 统计
+        self._response_status = 500
+        self._response_bytes = 0
+        self._stream_bytes = 0
+        self._route_label = match.route or UNMATCHED_ROUTE
+        try:
+            self._bytes_in = int(self.headers.get('Content-Length', 0) or 0)
+        except ValueError:
+            self._bytes_in = 0
+        if metrics is not None:
+            metrics.request_started()
+        self._request_start = start = time.perf_counter()
+        try:
+            self._route(match, query)
+        finally:
+            duration = time.perf_counter() - start
+            if metrics is not None:
+                metrics.request_finished(
+                    self.command, self._route_label, self._response_status,
+                    duration, self._bytes_in, self._response_bytes
+                )
+            if self.access_log is not None and getattr(self, 'stream', None) is None:
+                self._log_access(duration)
     
-    def do_POST(self):
-        if self.path == '/books':
-            try:
-                book_data = self._parse_request_body()
-                book, error = self.book_controller.create_book(book_data)
-                if book:
-                    self._send_response(201, book)
-                else:
-                    self._send_response(400, message=error)
-            except json.JSONDecodeError:
-                self._send_response(400, message="无效的JSON数据")
+    def _log_access(self, duration):
+        client = getattr(self, 'client_address', None)
+        self.access_log.record(
+            self.command, self.path.partition('?')[0], self._route_label, self._response_status,
+            duration, self._bytes_in, self._response_bytes + self._stream_bytes,
+            client[0] if client else None
+        )
+    
+    def _route(self, match, query):
+        """调用匹配到的处理方法，路径存在但方法不支持时返回 405"""
+        if match.handler is not None:
+            getattr(self, match.handler)(query, **match.params)
+        elif match.allowed is not None:
+            self._send_body(
+                405, encode_body(message="不支持的请求方法"),
+                headers={'Allow': ', '.join(match.allowed)}
+            )
         else:
             self._send_response(404, message="未找到资源")
     
-    def do_PUT(self):
-        if self.path.startswith('/books/'):
-            book_id = self._get_book_id_from_path()
-            if book_id:
-                try:
-                    book_data = self._parse_request_body()
-                    book, error = self.book_controller.update_book(book_id, book_data)
-                    if book:
-                        self._send_response(200, book)
-                    else:
-                        self._send_response(404, message=error)
-                except json.JSONDecodeError:
-                    self._send_response(400, message="无效的JSON数据")
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = _dispatch
+    
+    def _list_books(self, query):
+        query = parse_qs(query)
+        limit = query.get('limit', [None])[0]
+        cursor = query.get('cursor', [None])[0]
+        fields = query.get('fields', [None])[0]
+        ndjson = NDJSON_CONTENT_TYPE in self.headers.get('Accept', '')
+        filters = {name: query[name][0] for name in FILTER_PARAMS if name in query}
+        if filters:
+            # 通过二级索引查询
+            books, error = self.book_controller.find_books(fields=fields, **filters)
+            if error:
+                self._send_response(400, message=error)
             else:
-                self._send_response(400, message="无效的请求路径")
+                self._send_response(200, books)
+        elif ndjson or query.get('stream', ['0'])[0] not in ('0', 'false', ''):
+            # 流式导出全部书籍
+            selected, error = self.book_controller.parse_fields(fields)
+            if error:
+                self._send_response(400, message=error)
+                return
+            content_type = NDJSON_CONTENT_TYPE if ndjson else 'application/json'
+            self._send_stream(self._stream_books(selected, ndjson), content_type)
+        elif limit is None and cursor is None:
+            # 获取所有书籍
+            selected, error = self.book_controller.parse_fields(fields)
+            if error:
+                self._send_response(400, message=error)
+                return
+            etag = self.book_controller.books_etag(selected)
+            if self._not_modified(etag):
+                return
+            self._send_cached(
+                ('books', selected),
+                lambda: (self.book_controller.get_all_books(selected), None),
+                etag
+            )
         else:
-            self._send_response(404, message="未找到资源")
+            # 键集分页
+            page, error = self.book_controller.get_books_page(
+                limit or DEFAULT_PAGE_SIZE, cursor, fields
+            )
+            if error:
+                self._send_response(400, message=error)
+                return
+            books, next_cursor = page
+            self._send_response(200, books, extra={'next_cursor': next_cursor})
     
-    def do_DELETE(self):
-        if self.path.startswith('/books/'):
-            book_id = self._get_book_id_from_path()
-            if book_id:
-                success, error = self.book_controller.delete_book(book_id)
-                if success:
-                    self._send_response(204)
-                else:
-                    self._send_response(404, message=error)
-            else:
-                self._send_response(400, message="无效的请求路径")
+    def _search_books(self, query):
+        """全文检索"""
+        query = parse_qs(query)
+        books, error = self.book_controller.search_books(
+            query.get('q', [''])[0],
+            query.get('limit', [DEFAULT_SEARCH_LIMIT])[0],
+            query.get('fields', [None])[0]
+        )
+        if error:
+            self._send_response(400, message=error)
+        else:
+            self._send_response(200, books)
+    
+    def _get_book(self, query, book_id):
+        etag = self.book_controller.book_etag(book_id)
+        if self._not_modified(etag):
+            return
+        self._send_cached((BOOK_KEY, book_id), lambda: self.book_controller.get_book(book_id), etag)
+    
+    def _create_book(self, query):
+        try:
+            book_data = self._parse_request_body()
+        except codec.DecodeError:
+            self._send_response(400, message="无效的JSON数据")
+            return
+        book, error = self.book_controller.create_book(book_data)
+        if book:
+            self._send_response(201, book)
+        else:
+            self._send_response(status_for_error(error), message=error)
+    
+    def _update_book(self, query, book_id):
+        self._save_book(book_id, self.book_controller.replace_book)
+    
+    def _patch_book(self, query, book_id):
+        self._save_book(book_id, self.book_controller.update_book)
+    
+    def _save_book(self, book_id, operation):
+        """PUT 和 PATCH 共用：解析请求体，交给控制器保存并返回新版本和 ETag"""
+        try:
+            book_data = self._parse_request_body()
+        except codec.DecodeError:
+            self._send_response(400, message="无效的JSON数据")
+            return
+        # 在同一次加锁中取得新版本的 ETag，避免拿到之后其他修改的版本号
+        with self.book_controller.database.lock:
+            book, error = operation(book_id, book_data, self.headers.get('If-Match'))
+            etag = self.book_controller.book_etag(book_id) if book else None
+        if book:
+            wire_format = self._response_format()
+            self._send_body(
+                200, encode_body(book, wire_format=wire_format),
+                encoded_etag(etag, format_variant(wire_format)),
+                content_type=wire_format.CONTENT_TYPE
+            )
+        else:
+            self._send_response(status_for_error(error), message=error)
+    
+    def _delete_book(self, query, book_id):
+        success, error = self.book_controller.delete_book(book_id, self.headers.get('If-Match'))
+        if success:
+            self._send_response(204)
         else:
-            self._send_response(404, message="未找到资源") 
\ No newline at end of file
+            self._send_response(status_for_error(error), message=error)
+    
+    def _create_books(self, query):
+        self._handle_batch(self.book_controller.create_books)
+    
+    def _update_books(self, query):
+        self._handle_batch(lambda items: self.book_controller.update_books(items, replace=True))
+    
+    def _patch_books(self, query):
+        self._handle_batch(self.book_controller.update_books)
+    
+    def _delete_books(self, query):
+        self._handle_batch(self.book_controller.delete_books)
+    
+    def _get_metrics(self, query):
+        """以 Prometheus 文本格式导出指标，未启用指标时返回 404"""
+        if self.metrics is None:
+            self._send_response(404, message="未找到资源")
+            return
+        body = self.metrics.render(self.book_controller.database, self.book_controller.response_cache)
+        encoding = None
+        if len(body) >= self.compression_min_size:
+            encoding = self._response_encoding()
+            if encoding is not None:
+                body = compress(body, encoding, self.compression_level)
+        self._send_body(200, body, encoding=encoding, content_type=METRICS_CONTENT_TYPE)
+
+
+# 请求方法、路径模板和 BookView 中的处理方法名，处理方法的参数为查询字符串和路径参数
+ROUTES = (
+    ('GET', '/books', '_list_books'),
+    ('POST', '/books', '_create_book'),
+    ('GET', '/books/search', '_search_books'),
+    ('GET', '/books/{book_id:int}', '_get_book'),
+    ('PUT', '/books/{book_id:int}', '_update_book'),
+    ('PATCH', '/books/{book_id:int}', '_patch_book'),
+    ('DELETE', '/books/{book_id:int}', '_delete_book'),
+    ('POST', BATCH_PATH, '_create_books'),
+    ('PUT', BATCH_PATH, '_update_books'),
+    ('PATCH', BATCH_PATH, '_patch_books'),
+    ('DELETE', BATCH_PATH, '_delete_books'),
+    ('GET', '/metrics', '_get_metrics'),
+)
+
+ROUTER = Router(ROUTES)
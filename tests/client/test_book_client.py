@@ -1,7 +1,8 @@
 import pytest
-import json
+import requests
 from unittest.mock import patch, MagicMock
 from client.book_client import BookClient
+from common import codec, msgpack_codec
 
 class TestBookClient:
     """测试BookClient类"""
@@ -31,12 +32,12 @@ class TestBookClient:
             }
         ]
     
-    @patch('client.book_client.requests.get')
+    @patch('client.book_client.requests.Session.get')
     def test_get_all_books_success(self, mock_get):
         """测试成功获取所有书籍"""
         # 配置模拟响应
         mock_response = MagicMock()
-        mock_response.json.return_value = {"data": self.test_books}
+        mock_response.content = codec.dumps({"data": self.test_books})
         mock_response.raise_for_status.return_value = None
         mock_get.return_value = mock_response
         
@@ -46,13 +47,13 @@ class TestBookClient:
         # 验证结果
         assert error is None
         assert books == self.test_books
-        mock_get.assert_called_once_with(f"{self.base_url}/books")
+        mock_get.assert_called_once_with(f"{self.base_url}/books", timeout=self.client.timeout)
     
-    @patch('client.book_client.requests.get')
+    @patch('client.book_client.requests.Session.get')
     def test_get_all_books_error(self, mock_get):
         """测试获取所有书籍时出错"""
         # 配置模拟响应
-        mock_get.side_effect = Exception("模拟的网络错误")
+        mock_get.side_effect = requests.exceptions.ConnectionError("模拟的网络错误")
         
         # 调用客户端方法
         books, error = self.client.get_all_books()
@@ -62,12 +63,12 @@ class TestBookClient:
         assert error is not None
         assert "模拟的网络错误" in error
     
-    @patch('client.book_client.requests.get')
+    @patch('client.book_client.requests.Session.get')
     def test_get_book_success(self, mock_get):
         """测试成功获取单本书籍"""
         # 配置模拟响应
         mock_response = MagicMock()
-        mock_response.json.return_value = {"data": self.test_book}
+        mock_response.content = codec.dumps({"data": self.test_book})
         mock_response.raise_for_status.return_value = None
         mock_get.return_value = mock_response
         
@@ -77,13 +78,13 @@ class TestBookClient:
         # 验证结果
         assert error is None
         assert book == self.test_book
-        mock_get.assert_called_once_with(f"{self.base_url}/books/1")
+        mock_get.assert_called_once_with(f"{self.base_url}/books/1", timeout=self.client.timeout)
     
-    @patch('client.book_client.requests.get')
+    @patch('client.book_client.requests.Session.get')
     def test_get_book_error(self, mock_get):
         """测试获取单本书籍时出错"""
         # 配置模拟响应
-        mock_get.side_effect = Exception("模拟的网络错误")
+        mock_get.side_effect = requests.exceptions.ConnectionError("模拟的网络错误")
         
         # 调用客户端方法
         book, error = self.client.get_book(1)
@@ -93,7 +94,7 @@ class TestBookClient:
         assert error is not None
         assert "模拟的网络错误" in error
     
-    @patch('client.book_client.requests.post')
+    @patch('client.book_client.requests.Session.post')
     def test_create_book_success(self, mock_post):
         """测试成功创建书籍"""
         # 准备创建数据
@@ -109,7 +110,7 @@ class TestBookClient:
         
         # 配置模拟响应
         mock_response = MagicMock()
-        mock_response.json.return_value = {"data": created_book}
+        mock_response.content = codec.dumps({"data": created_book})
         mock_response.raise_for_status.return_value = None
         mock_post.return_value = mock_response
         
@@ -121,11 +122,12 @@ class TestBookClient:
         assert book == created_book
         mock_post.assert_called_once_with(
             f"{self.base_url}/books",
-            json=new_book_data,
-            headers={'Content-Type': 'application/json'}
+            data=codec.dumps(new_book_data),
+            headers={'Content-Type': 'application/json'},
+            timeout=self.client.timeout
         )
     
-    @patch('client.book_client.requests.post')
+    @patch('client.book_client.requests.Session.post')
     def test_create_book_error(self, mock_post):
         """测试创建书籍时出错"""
         # 准备创建数据
@@ -135,7 +137,7 @@ class TestBookClient:
         }
         
         # 配置模拟响应
-        mock_post.side_effect = Exception("模拟的网络错误")
+        mock_post.side_effect = requests.exceptions.ConnectionError("模拟的网络错误")
         
         # 调用客户端方法
         book, error = self.client.create_book(new_book_data)
@@ -145,8 +147,8 @@ class TestBookClient:
         assert error is not None
         assert "模拟的网络错误" in error
     
-    @patch('client.book_client.requests.put')
-    def test_update_book_success(self, mock_put):
+    @patch('client.book_client.requests.Session.patch')
+    def test_update_book_success(self, mock_patch):
         """测试成功更新书籍"""
         # 准备更新数据
         update_data = {
@@ -159,9 +161,9 @@ class TestBookClient:
         
         # 配置模拟响应
         mock_response = MagicMock()
-        mock_response.json.return_value = {"data": updated_book}
+        mock_response.content = codec.dumps({"data": updated_book})
         mock_response.raise_for_status.return_value = None
-        mock_put.return_value = mock_response
+        mock_patch.return_value = mock_response
         
         # 调用客户端方法
         book, error = self.client.update_book(1, update_data)
@@ -169,14 +171,15 @@ class TestBookClient:
         # 验证结果
         assert error is None
         assert book == updated_book
-        mock_put.assert_called_once_with(
+        mock_patch.assert_called_once_with(
             f"{self.base_url}/books/1",
-            json=update_data,
-            headers={'Content-Type': 'application/json'}
+            data=codec.dumps(update_data),
+            headers={'Content-Type': 'application/json'},
+            timeout=self.client.timeout
         )
     
-    @patch('client.book_client.requests.put')
-    def test_update_book_error(self, mock_put):
+    @patch('client.book_client.requests.Session.patch')
+    def test_update_book_error(self, mock_patch):
         """测试更新书籍时出错"""
         # 准备更新数据
         update_data = {
@@ -184,7 +187,7 @@ class TestBookClient:
         }
         
         # 配置模拟响应
-        mock_put.side_effect = Exception("模拟的网络错误")
+        mock_patch.side_effect = requests.exceptions.ConnectionError("模拟的网络错误")
         
         # 调用客户端方法
         book, error = self.client.update_book(1, update_data)
@@ -194,7 +197,7 @@ class TestBookClient:
         assert error is not None
         assert "模拟的网络错误" in error
     
-    @patch('client.book_client.requests.delete')
+    @patch('client.book_client.requests.Session.delete')
     def test_delete_book_success(self, mock_delete):
         """测试成功删除书籍"""
         # 配置模拟响应
@@ -208,13 +211,13 @@ class TestBookClient:
         # 验证结果
         assert error is None
         assert success is True
-        mock_delete.assert_called_once_with(f"{self.base_url}/books/1")
+        mock_delete.assert_called_once_with(f"{self.base_url}/books/1", timeout=self.client.timeout)
     
-    @patch('client.book_client.requests.delete')
+    @patch('client.book_client.requests.Session.delete')
     def test_delete_book_error(self, mock_delete):
         """测试删除书籍时出错"""
         # 配置模拟响应
-        mock_delete.side_effect = Exception("模拟的网络错误")
+        mock_delete.side_effect = requests.exceptions.ConnectionError("模拟的网络错误")
         
         # 调用客户端方法
         success, error = self.client.delete_book(1)
@@ -222,4 +225,154 @@ class TestBookClient:
         # 验证结果
         assert success is False
         assert error is not None
-        assert "模拟的网络错误" in error 
\ No newline at end of file
+        assert "模拟的网络错误" in error
+    
+    def test_session_reused_across_requests(self):
+        """测试所有请求共用同一个连接池"""
+        adapter = self.client.session.get_adapter(self.base_url)
+        
+        assert adapter is self.client.session.get_adapter(f"{self.base_url}/books/1")
+        assert adapter.max_retries.total == 3
+        assert 503 in adapter.max_retries.status_forcelist
+        assert 'POST' not in adapter.max_retries.allowed_methods
+    
+    def test_context_manager_closes_session(self):
+        """测试上下文管理器退出时关闭连接池"""
+        with patch.object(requests.Session, 'close') as mock_close:
+            with BookClient(self.base_url) as client:
+                assert isinstance(client, BookClient)
+            mock_close.assert_called_once()
+    
+    def test_keep_alive_disabled(self):
+        """测试关闭长连接时请求头带 Connection: close"""
+        client = BookClient(self.base_url, keep_alive=False)
+        
+        assert client.session.headers['Connection'] == 'close'
+    
+    @patch('client.book_client.requests.Session.request')
+    def test_create_books_chunked(self, mock_request):
+        """测试批量创建时自动分块"""
+        def fake_response(method, url, data=None, **kwargs):
+            response = MagicMock()
+            response.raise_for_status.return_value = None
+            response.content = codec.dumps({"data": [{"status": 201, "data": book} for book in codec.loads(data)]})
+            return response
+        mock_request.side_effect = fake_response
+        
+        books = ({"title": f"书籍{i}"} for i in range(5))
+        results, error = self.client.create_books(books, chunk_size=2)
+        
+        assert error is None
+        assert len(results) == 5
+        assert mock_request.call_count == 3
+        assert mock_request.call_args_list[0].args == ('POST', f"{self.base_url}/books:batch")
+    
+    @patch('client.book_client.requests.Session.request')
+    def test_create_books_partial_failure(self, mock_request):
+        """测试批量创建中途失败时返回已完成的结果"""
+        ok = MagicMock()
+        ok.raise_for_status.return_value = None
+        ok.content = codec.dumps({"data": [{"status": 201}, {"status": 201}]})
+        mock_request.side_effect = [ok, requests.exceptions.ConnectionError("模拟的网络错误")]
+        
+        results, error = self.client.create_books([{}] * 4, chunk_size=2)
+        
+        assert len(results) == 2
+        assert "模拟的网络错误" in error
+    
+    @patch('client.book_client.requests.Session.get')
+    def test_iter_books(self, mock_get):
+        """测试按游标逐页遍历书籍"""
+        pages = {
+            None: {"data": [self.test_books[0]], "next_cursor": "Mg"},
+            "Mg": {"data": [self.test_books[1]], "next_cursor": None}
+        }
+        def fake_get(url, params=None, **kwargs):
+            response = MagicMock()
+            response.raise_for_status.return_value = None
+            response.content = codec.dumps(pages[params.get('cursor')])
+            return response
+        mock_get.side_effect = fake_get
+        
+        books = self.client.iter_books(page_size=1)
+        
+        assert next(books) == self.test_books[0]
+        assert mock_get.call_count == 1
+        assert list(books) == [self.test_books[1]]
+        assert mock_get.call_count == 2
+    
+    @patch('client.book_client.requests.Session.get')
+    def test_get_book_uses_validator_cache(self, mock_get):
+        """测试再次获取书籍时发送 If-None-Match，304 时使用本地数据"""
+        body = codec.dumps({"data": self.test_book})
+        first = MagicMock(status_code=200, headers={'ETag': '"v1"'}, content=body)
+        not_modified = MagicMock(status_code=304, headers={'ETag': '"v1"'})
+        mock_get.side_effect = [first, not_modified]
+        
+        assert self.client.get_book(1) == (self.test_book, None)
+        assert self.client.get_book_etag(1) == '"v1"'
+        book, error = self.client.get_book(1)
+        
+        assert error is None
+        assert book == self.test_book
+        mock_get.assert_called_with(
+            f"{self.base_url}/books/1",
+            headers={'If-None-Match': '"v1"'},
+            timeout=self.client.timeout
+        )
+    
+    @patch('client.book_client.requests.Session.get')
+    def test_validator_cache_bounded(self, mock_get):
+        """测试本地保存的响应数不超过上限"""
+        client = BookClient(self.base_url, validator_cache_size=2)
+        response = MagicMock(status_code=200, headers={'ETag': '"v1"'}, content=b'{"data":{}}')
+        mock_get.return_value = response
+        
+        for book_id in (1, 2, 3):
+            client.get_book(book_id)
+        
+        assert client.get_book_etag(1) is None
+        assert client.get_book_etag(3) == '"v1"'
+    
+    @patch('client.book_client.requests.Session.patch')
+    def test_update_book_if_match(self, mock_patch):
+        """测试指定 etag 时发送 If-Match"""
+        mock_response = MagicMock(headers={'ETag': '"v2"'})
+        mock_response.content = codec.dumps({"data": self.test_book})
+        mock_patch.return_value = mock_response
+        
+        book, error = self.client.update_book(1, {"title": "测试书籍"}, etag='"v1"')
+        
+        assert error is None
+        assert self.client.get_book_etag(1) == '"v2"'
+        mock_patch.assert_called_once_with(
+            f"{self.base_url}/books/1",
+            data=codec.dumps({"title": "测试书籍"}),
+            headers={'Content-Type': 'application/json', 'If-Match': '"v1"'},
+            timeout=self.client.timeout
+        )
+    
+    @patch('client.book_client.requests.Session.post')
+    def test_msgpack_wire_format(self, mock_post):
+        """测试 msgpack 格式的请求体和 Accept 请求头，响应按 Content-Type 解码"""
+        client = BookClient(self.base_url, wire_format="msgpack")
+        mock_response = MagicMock(headers={'Content-Type': 'application/msgpack'},
+                                  content=msgpack_codec.dumps({"data": self.test_book}))
+        mock_post.return_value = mock_response
+        
+        book, error = client.create_book({"title": "测试书籍"})
+        
+        assert error is None
+        assert book == self.test_book
+        assert client.session.headers['Accept'] == 'application/msgpack'
+        mock_post.assert_called_once_with(
+            f"{self.base_url}/books",
+            data=msgpack_codec.dumps({"title": "测试书籍"}),
+            headers={'Content-Type': 'application/msgpack'},
+            timeout=client.timeout
+        )
+    
+    def test_unknown_wire_format(self):
+        with pytest.raises(ValueError):
+            BookClient(self.base_url, wire_format="xml")
+
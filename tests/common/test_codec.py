@@ -0,0 +1,71 @@
+import importlib.util
+import os
+
+import pytest
+from common import codec
+from common.codec import BACKENDS, DecodeError, get_codec
+
+# 只测试已安装的后端
+INSTALLED = [name for name in BACKENDS if name == 'json' or importlib.util.find_spec(name)]
+
+BOOK = {
+    "id": 1,
+    "title": "深入理解计算机系统",
+    "author": "李四",
+    "publication_year": 2018,
+    "isbn": "9787111544937"
+}
+
+@pytest.fixture(params=INSTALLED)
+def backend(request):
+    return get_codec(request.param)
+
+class TestCodec:
+    """测试各个 JSON 后端的编解码结果一致"""
+    
+    def test_compact_utf8(self, backend):
+        """测试输出紧凑的 UTF-8，中文字符不转义"""
+        body = backend.dumps({"data": [BOOK], "message": None})
+        
+        assert isinstance(body, bytes)
+        assert "深入理解计算机系统".encode("utf-8") in body
+        assert b"\\u" not in body
+        assert b", " not in body and b": " not in body
+        assert body == get_codec("json").dumps({"data": [BOOK], "message": None})
+    
+    def test_round_trip(self, backend):
+        """测试 bytes 和 str 都可以解码"""
+        body = backend.dumps(BOOK)
+        
+        assert backend.loads(body) == BOOK
+        assert backend.loads(body.decode("utf-8")) == BOOK
+    
+    def test_values_outside_fast_path(self, backend):
+        """测试超过 64 位的整数和非字符串键回退到标准库编码"""
+        assert backend.dumps({"year": 10 ** 30}) == b'{"year":%d}' % 10 ** 30
+        assert backend.dumps({1: "a"}) == b'{"1":"a"}'
+    
+    @pytest.mark.parametrize("number", [10 ** 30, 2 ** 64, -2 ** 63 - 1, 10 ** 18])
+    def test_large_integers_decoded_exactly(self, backend, number):
+        """测试超过 64 位的整数解码为精确的整数而不是浮点数"""
+        body = b'{"id":%d,"title":"%d"}' % (number, number)
+        
+        for data in (body, body.decode("utf-8"), bytearray(body)):
+            value = backend.loads(data)
+            assert value == {"id": number, "title": str(number)}
+            assert type(value["id"]) is int
+    
+    @pytest.mark.parametrize("data", [b"", b"{", b"[1,]", b"\xff\xfe", "不是JSON"])
+    def test_decode_error(self, backend, data):
+        """测试无效数据统一抛出 DecodeError，它也是 ValueError"""
+        with pytest.raises(DecodeError):
+            backend.loads(data)
+        assert issubclass(DecodeError, ValueError)
+    
+    def test_default_backend(self):
+        """测试默认使用已安装的最快后端"""
+        assert codec.BACKEND == os.environ.get("BOOK_JSON_BACKEND", INSTALLED[0])
+    
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            get_codec("pickle")
@@ -0,0 +1,81 @@
+import importlib.util
+
+import pytest
+from common import codec, msgpack_codec
+from common.codec import DecodeError
+from common.msgpack_codec import get_codec
+
+# 纯 Python 实现总是参与测试，msgpack 库安装时也一起测试
+IMPLEMENTATIONS = ['python'] + (['msgpack'] if importlib.util.find_spec('msgpack') else [])
+
+@pytest.fixture(params=IMPLEMENTATIONS)
+def implementation(request):
+    return get_codec(request.param)
+
+class TestMsgpackCodec:
+    """测试 MessagePack 编解码"""
+    
+    @pytest.mark.parametrize("value,expected", [
+        (None, b"\xc0"),
+        (True, b"\xc3"),
+        (False, b"\xc2"),
+        (1, b"\x01"),
+        (-1, b"\xff"),
+        (-33, b"\xd0\xdf"),
+        (200, b"\xcc\xc8"),
+        (2020, b"\xcd\x07\xe4"),
+        (2 ** 32, b"\xcf\x00\x00\x00\x01\x00\x00\x00\x00"),
+        (1.5, b"\xcb\x3f\xf8\x00\x00\x00\x00\x00\x00"),
+        ("书", b"\xa3\xe4\xb9\xa6"),
+        ("a" * 32, b"\xd9\x20" + b"a" * 32),
+        (b"\x00", b"\xc4\x01\x00"),
+        ([1, 2], b"\x92\x01\x02"),
+        ({"id": 1}, b"\x81\xa2id\x01"),
+        (list(range(16)), b"\xdc\x00\x10" + bytes(range(16))),
+    ])
+    def test_encoding(self, implementation, value, expected):
+        """测试各类型使用规范中最短的格式"""
+        assert implementation.dumps(value) == expected
+        assert implementation.loads(expected) == value
+    
+    def test_round_trip_book_payload(self, implementation):
+        """测试书籍响应的往返编解码，结果比 JSON 更小"""
+        payload = {"data": [
+            {"id": i, "title": f"书籍{i}" * (i % 20), "author": "作者", "publication_year": 2000 + i,
+             "isbn": None, "score": i / 7}
+            for i in range(300)
+        ], "next_cursor": "Mg"}
+        body = implementation.dumps(payload)
+        
+        assert implementation.loads(body) == payload
+        assert implementation.loads(bytearray(body)) == payload
+        assert len(body) < len(codec.dumps(payload))
+    
+    def test_tuple_and_subclasses(self, implementation):
+        """测试元组按数组编码，str/int 的子类按基类编码"""
+        class Title(str):
+            pass
+        assert implementation.loads(implementation.dumps((1, Title("a")))) == [1, "a"]
+    
+    @pytest.mark.parametrize("data", [b"", b"\x92\x01", b"\xc1", b"\xa3ab", b"\xa2\xff\xfe", b"\x01\x02", b"\xd4\x01\x00"])
+    def test_decode_error(self, implementation, data):
+        """测试不完整、多余、保留或扩展类型的数据抛出 DecodeError"""
+        with pytest.raises(DecodeError):
+            implementation.loads(data)
+    
+    def test_check_json_compatible(self, implementation):
+        """测试 bin 类型和非字符串的键不是 JSON 能表示的值"""
+        msgpack_codec.check_json_compatible(implementation.loads(implementation.dumps(
+            {"data": [{"id": 1, "title": "书", "score": 1.5, "isbn": None}], "ok": True}
+        )))
+        for value in ({"title": b"\x00"}, [{"tags": [b"x"]}], {1: "a"}, [{"a": {None: 1}}]):
+            with pytest.raises(DecodeError):
+                msgpack_codec.check_json_compatible(implementation.loads(implementation.dumps(value)))
+    
+    def test_unsupported_type(self, implementation):
+        with pytest.raises(TypeError):
+            implementation.dumps({"a": object()})
+    
+    def test_default_implementation(self):
+        """测试默认优先使用 msgpack 库"""
+        assert msgpack_codec.BACKEND == IMPLEMENTATIONS[-1]
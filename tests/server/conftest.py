@@ -0,0 +1,15 @@
+import pytest
+from server.models.database import Database
+from server.models.sqlite_database import SQLiteDatabase
+
+@pytest.fixture(params=['memory', 'compact', 'sqlite'])
+def database(request, tmp_path):
+    """分别使用内存、紧凑内存和 SQLite 存储后端的数据库"""
+    if request.param == 'memory':
+        yield Database()
+    elif request.param == 'compact':
+        yield Database(compact=True)
+    else:
+        db = SQLiteDatabase(str(tmp_path / "books.db"))
+        yield db
+        db.close()
@@ -0,0 +1,129 @@
+import io
+import json
+import threading
+
+import pytest
+from server.access_log import AccessLog
+
+class SlowStream(io.BytesIO):
+    """write 阻塞到 release 被设置，模拟写出缓慢的日志文件"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, data):
+        self.release.wait()
+        return super().write(data)
+
+def read_lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+class TestAccessLog:
+    """测试结构化访问日志"""
+
+    def setup_method(self):
+        """每个测试方法运行前的设置"""
+        self.stream = io.BytesIO()
+
+    def test_record_fields(self):
+        """测试每个请求写出一行带有路由、状态码、耗时和字节数的 JSON"""
+        log = AccessLog(stream=self.stream)
+        log.record('GET', '/books/1', '/books/{book_id:int}', 200, 0.0015, 0, 128, '127.0.0.1')
+        log.record('POST', '/books', '/books', 201, 0.002, 64, 96)
+        log.close()
+
+        first, second = read_lines(self.stream)
+        assert first['method'] == 'GET'
+        assert first['path'] == '/books/1'
+        assert first['route'] == '/books/{book_id:int}'
+        assert first['status'] == 200
+        assert first['duration_ms'] == 1.5
+        assert first['bytes_in'] == 0
+        assert first['bytes_out'] == 128
+        assert first['client'] == '127.0.0.1'
+        assert first['ts'].endswith('+00:00')
+        assert 'sample_rate' not in first
+        assert second['bytes_in'] == 64
+        assert 'client' not in second
+        assert log.written == 2
+
+    def test_batching(self):
+        """测试攒够一批后立即写出，不等待刷新间隔"""
+        log = AccessLog(stream=self.stream, batch_size=10, flush_interval=60)
+        for i in range(10):
+            log.record('GET', f'/books/{i}', '/books/{book_id:int}', 200, 0.001, 0, 10)
+        for _ in range(100):
+            if log.written == 10:
+                break
+            threading.Event().wait(0.01)
+        assert log.written == 10
+        assert len(read_lines(self.stream)) == 10
+        log.close()
+
+    def test_sampling(self):
+        """测试抽样只作用于成功的请求，错误请求始终记录"""
+        log = AccessLog(stream=self.stream, sample_rate=0.0)
+        for _ in range(100):
+            log.record('GET', '/books/1', '/books/{book_id:int}', 200, 0.001, 0, 10)
+        log.record('GET', '/books/999', '/books/{book_id:int}', 404, 0.001, 0, 10)
+        log.record('POST', '/books', '/books', 500, 0.001, 10, 10)
+        log.close()
+        assert [line['status'] for line in read_lines(self.stream)] == [404, 500]
+
+        stream = io.BytesIO()
+        log = AccessLog(stream=stream, sample_rate=0.5)
+        for _ in range(1000):
+            log.record('GET', '/books/1', '/books/{book_id:int}', 200, 0.001, 0, 10)
+        log.close()
+        lines = read_lines(stream)
+        assert 300 < len(lines) < 700
+        assert all(line['sample_rate'] == 0.5 for line in lines)
+
+    def test_invalid_sample_rate(self):
+        """测试抽样比例超出 0-1 时报错"""
+        with pytest.raises(ValueError):
+            AccessLog(stream=self.stream, sample_rate=1.5)
+
+    def test_max_pending(self):
+        """测试写出缓慢时待写记录不超过上限，丢弃的条数写入日志"""
+        stream = SlowStream()
+        log = AccessLog(stream=stream, batch_size=1, max_pending=5)
+        log.record('GET', '/books/0', '/books/{book_id:int}', 200, 0.001, 0, 10)
+        # 等待后台线程取走第一条记录并阻塞在写出上
+        for _ in range(100):
+            if not log._pending:
+                break
+            threading.Event().wait(0.01)
+        for i in range(1, 21):
+            log.record('GET', f'/books/{i}', '/books/{book_id:int}', 200, 0.001, 0, 10)
+        assert len(log._pending) == 5
+        assert log.dropped == 15
+
+        stream.release.set()
+        log.close()
+        lines = read_lines(stream)
+        assert [line['path'] for line in lines if 'path' in line] == [f'/books/{i}' for i in range(6)]
+        assert [line for line in lines if line.get('event') == 'dropped'][0]['count'] == 15
+        assert log.written == 6
+
+    def test_close_flushes(self):
+        """测试关闭时写出尚未到刷新间隔的记录，关闭后的记录被丢弃"""
+        log = AccessLog(stream=self.stream, flush_interval=60)
+        log.record('DELETE', '/books/1', '/books/{book_id:int}', 204, 0.001, 0, 0)
+        log.close()
+        assert len(read_lines(self.stream)) == 1
+        log.record('GET', '/books/1', '/books/{book_id:int}', 200, 0.001, 0, 10)
+        assert log.dropped == 1
+        log.close()
+
+    def test_file(self, tmp_path):
+        """测试以追加方式写入文件"""
+        path = tmp_path / 'access.log'
+        path.write_bytes(b'{"existing": true}\n')
+        log = AccessLog(str(path))
+        log.record('GET', '/books', '/books', 200, 0.001, 0, 10)
+        log.close()
+        lines = [json.loads(line) for line in path.read_bytes().splitlines()]
+        assert lines[0] == {'existing': True}
+        assert lines[1]['route'] == '/books'
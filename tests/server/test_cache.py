@@ -0,0 +1,78 @@
+import pytest
+from server.cache import ResponseCache, BOOK_KEY
+
+class TestResponseCache:
+    """测试已编码响应体的缓存"""
+    
+    def setup_method(self):
+        """每个测试方法运行前的设置"""
+        self.cache = ResponseCache(max_entries=3, max_bytes=100)
+    
+    def test_hit_and_miss(self):
+        """测试命中和未命中计数"""
+        assert self.cache.get((BOOK_KEY, 1)) is None
+        self.cache.put((BOOK_KEY, 1), b"book1", self.cache.generation)
+        
+        assert self.cache.get((BOOK_KEY, 1)) == b"book1"
+        assert self.cache.stats() == {
+            "entries": 1, "bytes": 5, "hits": 1, "misses": 1, "evictions": 0
+        }
+    
+    def test_lru_eviction(self):
+        """测试超过条数上限时淘汰最久未使用的响应"""
+        for book_id in (1, 2, 3):
+            self.cache.put((BOOK_KEY, book_id), b"x", self.cache.generation)
+        self.cache.get((BOOK_KEY, 1))
+        self.cache.put((BOOK_KEY, 4), b"x", self.cache.generation)
+        
+        assert self.cache.get((BOOK_KEY, 2)) is None
+        assert self.cache.get((BOOK_KEY, 1)) == b"x"
+        assert self.cache.evictions == 1
+    
+    def test_byte_limit(self):
+        """测试总字节数上限和过大的响应"""
+        self.cache.put((BOOK_KEY, 1), b"a" * 60, self.cache.generation)
+        self.cache.put((BOOK_KEY, 2), b"b" * 60, self.cache.generation)
+        self.cache.put((BOOK_KEY, 3), b"c" * 200, self.cache.generation)
+        
+        assert self.cache.get((BOOK_KEY, 1)) is None
+        assert self.cache.get((BOOK_KEY, 2)) == b"b" * 60
+        assert self.cache.get((BOOK_KEY, 3)) is None
+        assert self.cache.stats()["bytes"] == 60
+    
+    def test_invalidate(self):
+        """测试修改一本书只使这本书和集合响应失效"""
+        generation = self.cache.generation
+        self.cache.put((BOOK_KEY, 1), b"book1", generation)
+        self.cache.put((BOOK_KEY, 2), b"book2", generation)
+        self.cache.put(("books", None), b"all", generation)
+        
+        self.cache.invalidate(1)
+        
+        assert self.cache.get((BOOK_KEY, 1)) is None
+        assert self.cache.get(("books", None)) is None
+        assert self.cache.get((BOOK_KEY, 2)) == b"book2"
+    
+    def test_invalidate_variants(self):
+        """测试失效时同时删除书籍响应的压缩变体，peek 不计入命中率"""
+        generation = self.cache.generation
+        self.cache.put((BOOK_KEY, 1), b"book1", generation)
+        self.cache.put((BOOK_KEY, 1, "gzip"), b"gz1", generation)
+        self.cache.put((BOOK_KEY, 2, "gzip"), b"gz2", generation)
+        assert self.cache.peek((BOOK_KEY, 1, "gzip")) == b"gz1"
+        assert self.cache.hits == 0
+        
+        self.cache.invalidate(1)
+        
+        assert self.cache.peek((BOOK_KEY, 1)) is None
+        assert self.cache.peek((BOOK_KEY, 1, "gzip")) is None
+        assert self.cache.peek((BOOK_KEY, 2, "gzip")) == b"gz2"
+        assert len(self.cache) == 1
+    
+    def test_stale_put_ignored(self):
+        """测试读取数据后发生修改时不缓存旧数据"""
+        generation = self.cache.generation
+        self.cache.invalidate(1)
+        self.cache.put((BOOK_KEY, 1), b"stale", generation)
+        
+        assert self.cache.get((BOOK_KEY, 1)) is None
@@ -0,0 +1,81 @@
+import pytest
+from server.models.book import Book
+from server.models import columnar
+from server.models.columnar import ColumnarBookStore
+
+class TestColumnarBookStore:
+    """测试按列紧凑存储书籍"""
+    
+    def setup_method(self):
+        """每个测试方法运行前的设置"""
+        self.store = ColumnarBookStore()
+    
+    def test_round_trip(self):
+        """测试各种字段值写入后原样读出"""
+        books = [
+            Book(1, "Python编程", "张三", 2020, "9787111612727"),
+            Book(2, None, None, None, None),
+            Book(3, "标题", 42, "未知", "0123456789"),
+            Book(4, "\ud800", "作者", True, "123456789X"),
+            Book(5, "", "张三", -2 ** 31, "97871116127271234567"),
+        ]
+        for book in books:
+            self.store[book.book_id] = book
+        
+        for book in books:
+            stored = self.store[book.book_id]
+            assert stored.to_dict() == book.to_dict()
+            assert type(stored.publication_year) is type(book.publication_year)
+        assert len(self.store) == 5
+    
+    def test_authors_interned(self):
+        """测试相同作者只保存一次"""
+        for i in range(100):
+            self.store[i] = Book(i, f"书籍{i}", f"作者{i % 3}", 2020, None)
+        
+        assert len(self.store._authors) == 4
+        assert self.store[99].author == "作者0"
+    
+    def test_sparse_ids(self):
+        """测试远离现有范围的ID不会撑大列"""
+        self.store[1] = Book(1, "书籍1", "作者", 2020, None)
+        self.store[10 ** 9] = Book(10 ** 9, "远处的书籍", "作者", 2020, None)
+        
+        assert len(self.store._present) == 2
+        assert list(self.store) == [1, 10 ** 9]
+        assert self.store.pop(10 ** 9).title == "远处的书籍"
+        assert 10 ** 9 not in self.store
+    
+    def test_update_and_delete(self):
+        """测试更新和删除后读取最新数据"""
+        self.store[1] = Book(1, "旧标题", "作者", "未知", None)
+        self.store[1] = Book(1, "新标题", "作者", 2021, None)
+        self.store[2] = Book(2, "书籍2", "作者", 2020, None)
+        
+        assert self.store[1].title == "新标题"
+        assert self.store[1].publication_year == 2021
+        assert self.store._other == {}
+        assert self.store.pop(2).title == "书籍2"
+        assert self.store.get(2) is None
+        assert self.store.pop(2, None) is None
+        with pytest.raises(KeyError):
+            self.store[2]
+        assert [book.book_id for book in self.store.values()] == [1]
+    
+    def test_compact_text(self, monkeypatch):
+        """测试废弃的标题字节过多时整理标题区"""
+        monkeypatch.setattr(columnar, "COMPACT_THRESHOLD", 10)
+        for i in range(10):
+            self.store[i] = Book(i, f"书籍{i}", "作者", 2020, None)
+        for i in range(8):
+            self.store.pop(i)
+        
+        assert len(self.store._text) < 10 * len("书籍0".encode("utf-8"))
+        assert [book.title for book in self.store.values()] == ["书籍8", "书籍9"]
+    
+    def test_returned_books_are_copies(self):
+        """测试修改读取到的书籍不影响存储的数据"""
+        self.store[1] = Book(1, "书籍1", "作者", 2020, None)
+        self.store[1].title = "修改"
+        
+        assert self.store[1].title == "书籍1"
@@ -0,0 +1,52 @@
+import gzip
+import zlib
+
+import pytest
+from server.compression import negotiate_encoding, compress, compress_stream
+
+class TestNegotiateEncoding:
+    """测试 Accept-Encoding 协商"""
+    
+    def test_prefers_gzip(self):
+        """测试同时接受两种编码时优先使用 gzip"""
+        assert negotiate_encoding("gzip, deflate") == "gzip"
+        assert negotiate_encoding("deflate, gzip") == "gzip"
+        assert negotiate_encoding("br, deflate") == "deflate"
+    
+    def test_quality_values(self):
+        """测试 q 值和通配符"""
+        assert negotiate_encoding("gzip;q=0.5, deflate;q=0.8") == "deflate"
+        assert negotiate_encoding("gzip;q=0, deflate") == "deflate"
+        assert negotiate_encoding("*") == "gzip"
+        assert negotiate_encoding("*;q=0") is None
+        assert negotiate_encoding("gzip;q=abc") is None
+    
+    def test_no_acceptable_encoding(self):
+        """测试不接受压缩时返回 None"""
+        assert negotiate_encoding(None) is None
+        assert negotiate_encoding("") is None
+        assert negotiate_encoding("identity") is None
+        assert negotiate_encoding("br") is None
+
+
+class TestCompress:
+    """测试响应体压缩"""
+    
+    @pytest.mark.parametrize("encoding,decompress", [
+        ("gzip", gzip.decompress),
+        ("deflate", zlib.decompress),
+    ])
+    def test_round_trip(self, encoding, decompress):
+        """测试一次性压缩和流式压缩都能被标准解压函数还原"""
+        chunks = [b'{"id": %d, "title": "book"}\n' % i for i in range(500)]
+        body = b''.join(chunks)
+        
+        compressed = compress(body, encoding)
+        assert len(compressed) < len(body)
+        assert decompress(compressed) == body
+        assert decompress(b''.join(compress_stream(iter(chunks), encoding))) == body
+    
+    def test_level(self):
+        """测试压缩级别越高结果越小"""
+        body = b''.join(b'{"id": %d, "title": "book %d"}' % (i, i * 7) for i in range(2000))
+        assert len(compress(body, "gzip", 9)) <= len(compress(body, "gzip", 1))
@@ -1,14 +1,14 @@
 import pytest
 from server.models.book import Book
-from server.models.database import Database
-from server.controllers.book_controller import BookController
+from server.controllers.book_controller import BookController, status_for_error
 
 class TestBookController:
     """测试BookController类"""
     
-    def setup_method(self):
-        """每个测试方法运行前的设置"""
-        self.db = Database()
+    @pytest.fixture(autouse=True)
+    def setup_controller(self, database):
+        """每个测试方法运行前的设置，分别使用三种存储后端（内存、紧凑、SQLite）"""
+        self.db = database
         self.controller = BookController(self.db)
         
         # 添加一些测试数据
@@ -120,6 +120,18 @@ class TestBookController:
         assert error is not None
         assert "无效" in error
     
+    def test_replace_book(self):
+        """测试整体替换书籍，未提供的字段被清空"""
+        book, error = self.controller.replace_book(1, {"title": "替换的书籍", "author": "替换的作者"})
+        
+        assert error is None
+        assert book == {"id": 1, "title": "替换的书籍", "author": "替换的作者",
+                        "publication_year": None, "isbn": None}
+        assert self.controller.get_book(1)[0] == book
+        
+        assert self.controller.replace_book(999, {"title": "不存在"})[1] == "找不到指定的书籍"
+        assert "无效" in self.controller.replace_book("abc", {"title": "无效"})[1]
+    
     def test_delete_book(self):
         """测试删除书籍"""
         # 删除存在的书籍
@@ -144,4 +156,175 @@ class TestBookController:
         
         assert success is False
         assert error is not None
-        assert "无效" in error 
\ No newline at end of file
+        assert "无效" in error
+    
+    def test_create_books(self):
+        """测试批量创建书籍"""
+        results, error = self.controller.create_books([
+            {"title": "批量1", "author": "作者", "publication_year": 2020, "isbn": "1000000001"},
+            "不是对象",
+            {"title": "批量2", "author": "作者", "publication_year": 2021, "isbn": "1000000002"}
+        ])
+        
+        assert error is None
+        assert [r["status"] for r in results] == [201, 400, 201]
+        assert results[0]["data"]["id"] == 2
+        assert results[2]["data"]["id"] == 3
+        assert len(self.controller.get_all_books()) == 3
+    
+    def test_invalid_field_types(self):
+        """测试字段类型无效时返回错误而不是抛出异常"""
+        book, error = self.controller.create_book({"title": "书籍", "author": ["作者"]})
+        assert book is None
+        assert status_for_error(error) == 400
+        
+        for update in (self.controller.update_book, self.controller.replace_book):
+            book, error = update(1, {"author": {"name": "作者"}})
+            assert book is None
+            assert status_for_error(error) == 400
+        assert self.controller.update_book(1, ["不是对象"])[0] is None
+        assert self.controller.get_book(1)[0]["author"] == "测试作者"
+        
+        results, error = self.controller.create_books([{"title": ["列表"]}, {"title": "正常"}])
+        assert [r["status"] for r in results] == [400, 201]
+    
+    def test_create_books_with_ids(self):
+        """测试批量创建时逐项校验书籍ID，无效的ID只使该项失败"""
+        results, error = self.controller.create_books([
+            {"id": "abc", "title": "无效ID"},
+            {"id": "10", "title": "字符串ID"},
+            {"id": [1], "title": "列表ID"},
+            {"title": "自动分配"}
+        ])
+        
+        assert error is None
+        assert [r["status"] for r in results] == [400, 201, 400, 201]
+        assert results[0]["message"] == "无效的书籍ID"
+        assert results[1]["data"]["id"] == 10
+        assert results[3]["data"]["id"] == 11
+    
+    def test_update_and_delete_books(self):
+        """测试批量更新和删除书籍"""
+        results, error = self.controller.update_books([
+            {"id": 1, "title": "批量更新"},
+            {"id": 999, "title": "不存在"},
+            {"title": "缺少ID"}
+        ])
+        
+        assert error is None
+        assert [r["status"] for r in results] == [200, 404, 400]
+        assert results[0]["data"]["title"] == "批量更新"
+        assert results[0]["data"]["isbn"] == "1234567890"
+        
+        results, error = self.controller.update_books([{"id": 1, "title": "批量替换"}], replace=True)
+        assert results[0]["data"]["title"] == "批量替换"
+        assert results[0]["data"]["isbn"] is None
+        
+        results, error = self.controller.delete_books([1, 999, "abc"])
+        
+        assert error is None
+        assert [r["status"] for r in results] == [204, 404, 400]
+        assert self.controller.get_all_books() == []
+    
+    def test_batch_limits(self):
+        """测试批量请求的格式和大小限制"""
+        controller = BookController(self.db, max_batch_size=2)
+        
+        results, error = controller.create_books([{}, {}, {}])
+        assert results is None
+        assert "最多" in error
+        
+        results, error = controller.delete_books({"id": 1})
+        assert results is None
+        assert "数组" in error
+    
+    def test_get_books_page(self):
+        """测试游标分页和字段投影"""
+        self.controller.create_books([{"title": f"书籍{i}"} for i in range(4)])
+        
+        (books, cursor), error = self.controller.get_books_page(limit=2, fields="id,title")
+        assert error is None
+        assert books == [{"id": 1, "title": "测试书籍"}, {"id": 2, "title": "书籍0"}]
+        assert cursor is not None
+        
+        # 翻页期间删除已读过的书籍不影响后续页
+        self.controller.delete_book(1)
+        (books, cursor), error = self.controller.get_books_page(limit=2, cursor=cursor)
+        assert [b["id"] for b in books] == [3, 4]
+        
+        (books, cursor), error = self.controller.get_books_page(limit=2, cursor=cursor)
+        assert [b["id"] for b in books] == [5]
+        assert cursor is None
+    
+    def test_get_books_page_invalid_params(self):
+        """测试无效的分页参数"""
+        assert "limit" in self.controller.get_books_page(limit=0)[1]
+        assert "limit" in self.controller.get_books_page(limit="abc")[1]
+        assert "游标" in self.controller.get_books_page(cursor="!!!")[1]
+        assert "未知字段" in self.controller.get_books_page(fields="id,price")[1]
+    
+    def test_iter_book_pages(self):
+        """测试流式导出按页生成书籍"""
+        self.controller.create_books([{"title": f"书籍{i}"} for i in range(4)])
+        
+        pages = list(self.controller.iter_book_pages(fields=("id",), page_size=2))
+        
+        assert pages == [[{"id": 1}, {"id": 2}], [{"id": 3}, {"id": 4}], [{"id": 5}]]
+    
+    def test_find_books(self):
+        """测试按条件查询书籍"""
+        self.controller.create_book({"title": "书籍2", "author": "测试作者", "publication_year": 2010, "isbn": "2222222222"})
+        
+        books, error = self.controller.find_books(author="测试作者", year_from="2015", fields="id")
+        assert error is None
+        assert books == [{"id": 1}]
+        
+        books, error = self.controller.find_books(year_to="abc")
+        assert books is None
+        assert "年份" in error
+    
+    def test_duplicate_isbn(self):
+        """测试重复ISBN返回冲突错误"""
+        book, error = self.controller.create_book(self.test_book_data)
+        assert book is None
+        assert status_for_error(error) == 409
+        
+        results, _ = self.controller.create_books([{"isbn": "1234567890"}, {"isbn": "3333333333"}])
+        assert [r["status"] for r in results] == [409, 201]
+    
+    def test_search_books(self):
+        """测试全文检索随增删改同步更新"""
+        self.controller.create_book({"title": "深入理解计算机系统", "author": "李四"})
+        
+        books, error = self.controller.search_books("计算机", fields="id,title")
+        assert error is None
+        assert [b["id"] for b in books] == [2]
+        assert "score" in books[0]
+        
+        self.controller.update_book(2, {"title": "算法导论"})
+        assert self.controller.search_books("计算机")[0] == []
+        assert [b["id"] for b in self.controller.search_books("算法")[0]] == [2]
+        
+        assert "检索词" in self.controller.search_books("  ")[1]
+        assert "limit" in self.controller.search_books("算法", limit=1000)[1]
+    
+    def test_if_match(self):
+        """测试 If-Match 乐观并发控制"""
+        etag = self.controller.book_etag(1)
+        
+        book, error = self.controller.update_book(1, {"title": "第一次修改"}, if_match=etag)
+        assert error is None
+        assert self.controller.book_etag(1) != etag
+        
+        # 使用旧的 ETag 修改或删除会失败
+        book, error = self.controller.update_book(1, {"title": "第二次修改"}, if_match=etag)
+        assert book is None
+        assert status_for_error(error) == 412
+        success, error = self.controller.delete_book(1, if_match=etag)
+        assert success is False
+        assert status_for_error(error) == 412
+        
+        success, error = self.controller.delete_book(1, if_match=self.controller.book_etag(1))
+        assert success is True
+        success, error = self.controller.delete_book(1, if_match="*")
+        assert status_for_error(error) == 404
@@ -0,0 +1,104 @@
+import re
+import threading
+
+import pytest
+from server.cache import ResponseCache
+from server.metrics import Metrics, LATENCY_BUCKETS
+from server.models import Book, Database
+
+def sample(text, line):
+    """返回指标文本中以 line 开头的样本值"""
+    match = re.search(rf'^{re.escape(line)} (\S+)$', text, re.MULTILINE)
+    assert match, line
+    return float(match.group(1))
+
+class TestMetrics:
+    """测试请求指标"""
+
+    def setup_method(self):
+        """每个测试方法运行前的设置"""
+        self.metrics = Metrics()
+
+    def render(self, *args):
+        return self.metrics.render(*args).decode('utf-8')
+
+    def test_request_counts(self):
+        """测试按方法、路由和状态码计数"""
+        for status in (200, 200, 404):
+            self.metrics.request_started()
+            self.metrics.request_finished('GET', '/books/{book_id:int}', status, 0.001)
+        text = self.render()
+        assert sample(text, 'bookserver_requests_total{method="GET",route="/books/{book_id:int}",status="200"}') == 2
+        assert sample(text, 'bookserver_requests_total{method="GET",route="/books/{book_id:int}",status="404"}') == 1
+        assert sample(text, 'bookserver_requests_in_flight') == 0
+
+    def test_histogram(self):
+        """测试直方图的桶是累计的，+Inf 等于请求总数"""
+        for duration in (0.00005, 0.003, 0.003, 20.0):
+            self.metrics.request_finished('GET', '/books', 200, duration)
+        text = self.render()
+        labels = 'method="GET",route="/books"'
+        assert sample(text, f'bookserver_request_duration_seconds_bucket{{{labels},le="0.0001"}}') == 1
+        assert sample(text, f'bookserver_request_duration_seconds_bucket{{{labels},le="0.005"}}') == 3
+        assert sample(text, f'bookserver_request_duration_seconds_bucket{{{labels},le="10.0"}}') == 3
+        assert sample(text, f'bookserver_request_duration_seconds_bucket{{{labels},le="+Inf"}}') == 4
+        assert sample(text, f'bookserver_request_duration_seconds_count{{{labels}}}') == 4
+        assert sample(text, f'bookserver_request_duration_seconds_sum{{{labels}}}') == pytest.approx(20.00605)
+
+    def test_quantiles(self):
+        """测试由直方图估算的分位数落在正确的桶内"""
+        for _ in range(90):
+            self.metrics.request_finished('GET', '/books', 200, 0.0003)
+        for _ in range(10):
+            self.metrics.request_finished('GET', '/books', 200, 0.02)
+        text = self.render()
+        labels = 'method="GET",route="/books"'
+        p50 = sample(text, f'bookserver_request_duration_quantile_seconds{{{labels},quantile="0.5"}}')
+        p99 = sample(text, f'bookserver_request_duration_quantile_seconds{{{labels},quantile="0.99"}}')
+        assert 0.00025 < p50 <= 0.0005
+        assert 0.01 < p99 <= 0.025
+
+    def test_quantile_empty_and_overflow(self):
+        """测试没有样本时为 0，超出最大的桶时为最大的桶上界"""
+        counts = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0, 0, 0]
+        assert self.metrics.quantile(counts, 0.5) == 0.0
+        counts[len(LATENCY_BUCKETS)] = 1
+        assert self.metrics.quantile(counts, 0.5) == LATENCY_BUCKETS[-1]
+
+    def test_bytes_and_in_flight(self):
+        """测试请求和响应字节数以及正在处理的请求数"""
+        self.metrics.request_started()
+        self.metrics.request_started()
+        self.metrics.request_finished('POST', '/books', 201, 0.001, bytes_in=50, bytes_out=80)
+        self.metrics.add_bytes_out('POST', '/books', 20)
+        text = self.render()
+        assert sample(text, 'bookserver_request_bytes_total{method="POST",route="/books"}') == 50
+        assert sample(text, 'bookserver_response_bytes_total{method="POST",route="/books"}') == 100
+        assert sample(text, 'bookserver_requests_in_flight') == 1
+
+    def test_database_and_cache(self):
+        """测试导出书籍数量和缓存统计"""
+        database = Database()
+        database.add_book(Book(None, "书籍1", "作者1", 2020, "1111111111"))
+        cache = ResponseCache(max_entries=10)
+        cache.put(('books', None), b'[]', cache.generation)
+        cache.get(('books', None))
+        text = self.render(database, cache)
+        assert sample(text, 'bookserver_books') == 1
+        assert sample(text, 'bookserver_cache_hits_total') == 1
+        assert sample(text, 'bookserver_cache_entries') == 1
+
+    def test_threads_merged(self):
+        """测试各线程的计数在导出时汇总"""
+        def worker():
+            for _ in range(1000):
+                self.metrics.request_started()
+                self.metrics.request_finished('GET', '/books', 200, 0.001)
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        text = self.render()
+        assert sample(text, 'bookserver_requests_total{method="GET",route="/books",status="200"}') == 8000
+        assert sample(text, 'bookserver_requests_in_flight') == 0
@@ -1,6 +1,7 @@
 import pytest
+import threading
 from server.models.book import Book
-from server.models.database import Database
+from server.models.database import DuplicateISBNError, InvalidBookError
 
 class TestBook:
     """测试Book模型类"""
@@ -63,9 +64,10 @@ class TestBook:
 class TestDatabase:
     """测试Database类"""
     
-    def setup_method(self):
-        """每个测试方法运行前的设置"""
-        self.db = Database()
+    @pytest.fixture(autouse=True)
+    def setup_database(self, database):
+        """每个测试方法运行前的设置，分别使用三种存储后端（内存、紧凑、SQLite）"""
+        self.db = database
         self.test_book = Book(None, "测试书籍", "测试作者", 2022, "1234567890")
     
     def test_add_book(self):
@@ -73,8 +75,8 @@ class TestDatabase:
         book = self.db.add_book(self.test_book)
         
         assert book.book_id == 1  # 自动分配ID=1
-        assert len(self.db.books) == 1
-        assert self.db.books[1] == book
+        assert len(self.db.get_all_books()) == 1
+        assert self.db.get_book_by_id(1).to_dict() == book.to_dict()
     
     def test_get_book_by_id(self):
         """测试通过ID获取书籍"""
@@ -101,6 +103,15 @@ class TestDatabase:
         assert books[0].title == "书籍1"
         assert books[1].title == "书籍2"
         assert books[2].title == "书籍3"
+
+    def test_count_books(self):
+        """测试统计书籍数量"""
+        assert self.db.count_books() == 0
+        self.db.add_book(Book(None, "书籍1", "作者1", 2020, "1111111111"))
+        book = self.db.add_book(Book(None, "书籍2", "作者2", 2021, "2222222222"))
+        assert self.db.count_books() == 2
+        self.db.delete_book(book.book_id)
+        assert self.db.count_books() == 1
     
     def test_update_book(self):
         """测试更新书籍"""
@@ -132,4 +143,113 @@ class TestDatabase:
         
         # 测试删除不存在的书籍
         non_existent_delete = self.db.delete_book(999)
-        assert non_existent_delete is False 
\ No newline at end of file
+        assert non_existent_delete is False
+    
+    def test_concurrent_add_book_unique_ids(self):
+        """测试并发添加书籍时不会分配重复ID"""
+        def add_many():
+            for i in range(200):
+                self.db.add_book(Book(None, f"书籍{i}", "作者", 2020, None))
+        
+        threads = [threading.Thread(target=add_many) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len(self.db.get_all_books()) == 1600
+        assert self.db.next_id == 1601
+    
+    def test_add_book_with_explicit_id_advances_next_id(self):
+        """测试显式指定ID后自动分配的ID不会与之冲突"""
+        self.db.add_book(Book(5, "书籍5", "作者", 2020, None))
+        book = self.db.add_book(self.test_book)
+        
+        assert book.book_id == 6
+    
+    def test_get_books_page(self):
+        """测试按ID顺序分页获取书籍"""
+        self.db.add_book(Book(10, "书籍10", "作者", 2020, None))
+        for i in range(5):
+            self.db.add_book(Book(None, f"书籍{i}", "作者", 2020, None))
+        self.db.add_book(Book(3, "书籍3", "作者", 2020, None))
+        self.db.delete_book(12)
+        
+        first = self.db.get_books_page(limit=3)
+        rest = self.db.get_books_page(after_id=first[-1].book_id, limit=10)
+        
+        assert [b.book_id for b in first] == [3, 10, 11]
+        assert [b.book_id for b in rest] == [13, 14, 15]
+    
+    def test_isbn_unique(self):
+        """测试ISBN唯一约束"""
+        self.db.add_book(self.test_book)
+        
+        with pytest.raises(DuplicateISBNError):
+            self.db.add_book(Book(None, "重复", "作者", 2020, "1234567890"))
+        other = self.db.add_book(Book(None, "另一本", "作者", 2020, "5555555555"))
+        with pytest.raises(DuplicateISBNError):
+            self.db.update_book(other.book_id, Book(None, "重复", "作者", 2020, "1234567890"))
+        
+        # 更新自身时保留原ISBN不算冲突
+        assert self.db.update_book(1, Book(None, "新标题", "作者", 2020, "1234567890")) is True
+    
+    def test_invalid_fields_rejected_before_mutation(self):
+        """测试字段类型无效时不修改书籍和索引，也不通知监听者"""
+        changed = []
+        self.db.add_listener(changed.append)
+        self.db.add_book(self.test_book)
+        
+        with pytest.raises(InvalidBookError):
+            self.db.add_book(Book(None, "书籍", ["作者"], 2020, None))
+        with pytest.raises(InvalidBookError):
+            self.db.add_book(Book("abc", "书籍", "作者", 2020, None))
+        with pytest.raises(InvalidBookError):
+            self.db.update_book(1, Book(None, "新标题", "新作者", 2020, {"isbn": 1}))
+        results = self.db.add_books([Book(None, b"bytes", "作者", 2020, None),
+                                     Book(None, "书籍2", "作者", 2020, None)])
+        
+        assert isinstance(results[0], InvalidBookError)
+        assert results[1].book_id == 2
+        assert changed == [1, 2]
+        assert self.db.get_book_by_id(1).to_dict() == self.test_book.to_dict()
+        assert [b.book_id for b in self.db.find_books(author="测试作者")] == [1]
+        assert self.db.find_books(author="新作者") == []
+        assert [b.title for b, _ in self.db.search_books("测试")] == ["测试书籍"]
+    
+    def test_find_books_indexes(self):
+        """测试二级索引在增删改后保持一致"""
+        self.db.add_book(Book(None, "书籍1", "作者A", 2001, "1111111111"))
+        self.db.add_book(Book(None, "书籍2", "作者A", 2005, "2222222222"))
+        self.db.add_book(Book(None, "书籍3", "作者B", 2003, "3333333333"))
+        self.db.add_book(Book(None, "书籍4", "作者B", "未知", None))
+        
+        assert [b.book_id for b in self.db.find_books(author="作者A")] == [1, 2]
+        assert [b.book_id for b in self.db.find_books(isbn="3333333333")] == [3]
+        assert [b.book_id for b in self.db.find_books(year_from=2002, year_to=2005)] == [2, 3]
+        assert [b.book_id for b in self.db.find_books(author="作者B", year_from=2000)] == [3]
+        
+        self.db.update_book(2, Book(None, "书籍2", "作者B", 1999, "4444444444"))
+        self.db.delete_book(3)
+        
+        assert [b.book_id for b in self.db.find_books(author="作者A")] == [1]
+        assert [b.book_id for b in self.db.find_books(author="作者B")] == [2, 4]
+        assert self.db.find_books(isbn="2222222222") == []
+        assert [b.book_id for b in self.db.find_books(year_to=2000)] == [2]
+        assert self.db.find_books(year_from=2002) == []
+        
+        # ISBN 释放后可以被其他书籍使用
+        self.db.add_book(Book(None, "书籍5", "作者C", 2010, "3333333333"))
+    
+    def test_listeners_notified(self):
+        """测试增删改后以书籍ID通知监听者"""
+        changed = []
+        self.db.add_listener(changed.append)
+        
+        self.db.add_book(self.test_book)
+        self.db.update_book(1, Book(None, "新标题", "作者", 2020, None))
+        self.db.update_book(999, Book(None, "不存在", "作者", 2020, None))
+        self.db.add_books([Book(None, "书籍2", "作者", 2020, None)])
+        self.db.delete_book(1)
+        
+        assert changed == [1, 1, 2, 1]
@@ -0,0 +1,180 @@
+import pytest
+import os
+import threading
+import time
+from server.models.book import Book
+from server.models.persistence import PersistentDatabase, WriteAheadLog, SNAPSHOT_FILE
+
+class TestPersistentDatabase:
+    """测试带预写日志和快照的持久化数据库"""
+    
+    def reopen(self, db, **kwargs):
+        db.close()
+        return PersistentDatabase(self.data_dir, **kwargs)
+    
+    @pytest.fixture(autouse=True)
+    def setup_dir(self, tmp_path):
+        self.data_dir = str(tmp_path / "data")
+    
+    @pytest.mark.parametrize("policy", ["always", "group", "interval", "none"])
+    def test_recover_after_restart(self, policy):
+        """测试重启后从日志恢复数据"""
+        db = PersistentDatabase(self.data_dir, fsync_policy=policy)
+        db.add_book(Book(None, "书籍1", "作者", 2020, "1111111111"))
+        db.add_book(Book(None, "书籍2", "作者", 2021, "2222222222"))
+        db.update_book(1, Book(None, "更新的书籍1", "作者", 2020, "1111111111"))
+        db.delete_book(2)
+        
+        db = self.reopen(db, fsync_policy=policy)
+        
+        assert [b.title for b in db.get_all_books()] == ["更新的书籍1"]
+        # 删除过的最大ID不会被重新分配
+        assert db.add_book(Book(None, "书籍3", "作者", 2022, None)).book_id == 3
+        assert db.find_books(isbn="1111111111")[0].book_id == 1
+        db.close()
+    
+    def test_snapshot_compacts_log(self):
+        """测试快照后删除旧日志段，恢复时加载快照加新日志"""
+        db = PersistentDatabase(self.data_dir, snapshot_interval=10)
+        for i in range(25):
+            db.add_book(Book(None, f"书籍{i}", "作者", 2000 + i, None))
+        db.snapshot()
+        db.delete_book(1)
+        
+        segments = [name for name in os.listdir(self.data_dir) if name.startswith("wal-")]
+        assert os.path.exists(os.path.join(self.data_dir, SNAPSHOT_FILE))
+        assert len(segments) == 1
+        
+        db = self.reopen(db, snapshot_interval=10)
+        
+        assert len(db.get_all_books()) == 24
+        assert db.get_book_by_id(1) is None
+        assert db.next_id == 26
+        db.close()
+    
+    def test_automatic_snapshot_keeps_every_write(self):
+        """测试写入触发的快照包含触发它的那次写入，重启后所有书籍都在"""
+        db = PersistentDatabase(self.data_dir, fsync_policy="always", snapshot_interval=2)
+        for i in range(5):
+            db.add_book(Book(None, f"书籍{i}", "作者", 2000 + i, None))
+            # 等待快照写完，下一次写入才会再生成快照
+            if db._snapshot_thread is not None:
+                db._snapshot_thread.join()
+        db.update_book(1, Book(None, "更新的书籍", "作者", 2000, None))
+        db.delete_book(2)
+        
+        db = self.reopen(db, snapshot_interval=2)
+        
+        assert [b.book_id for b in db.get_all_books()] == [1, 3, 4, 5]
+        assert db.get_book_by_id(1).title == "更新的书籍"
+        db.close()
+    
+    @pytest.mark.parametrize("compact", [False, True])
+    def test_snapshot_during_batch_keeps_batch(self, compact):
+        """测试批量写入中途达到快照间隔时，快照包含整批书籍，重启后都在"""
+        db = PersistentDatabase(self.data_dir, snapshot_interval=3, compact=compact)
+        results = db.add_books([Book(None, f"书籍{i}", "作者", 2000 + i, None) for i in range(5)])
+        assert [book.book_id for book in results] == [1, 2, 3, 4, 5]
+        
+        db = self.reopen(db, snapshot_interval=3, compact=compact)
+        
+        assert [b.book_id for b in db.get_all_books()] == [1, 2, 3, 4, 5]
+        db.close()
+    
+    def test_torn_last_record_ignored(self):
+        """测试崩溃时写了一半的最后一条记录被忽略"""
+        db = PersistentDatabase(self.data_dir)
+        db.add_book(Book(None, "书籍1", "作者", 2020, None))
+        segment = db.wal.segment
+        db.close()
+        with open(os.path.join(self.data_dir, f"wal-{segment:010d}.log"), "ab") as f:
+            f.write(b'{"op": "put", "book": {"id": 2, "ti')
+        
+        db = PersistentDatabase(self.data_dir)
+        
+        assert [b.book_id for b in db.get_all_books()] == [1]
+        db.close()
+    
+    def test_group_commit_batches_fsync(self):
+        """测试并发写入在组提交下共享 fsync"""
+        db = PersistentDatabase(self.data_dir, fsync_policy="group", group_commit_interval=0.005)
+        
+        def writer(n):
+            for i in range(20):
+                db.add_book(Book(None, f"书籍{n}-{i}", "作者", 2020, None))
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len(db.get_all_books()) == 160
+        assert db.wal.fsync_count < 160
+        db = self.reopen(db)
+        assert len(db.get_all_books()) == 160
+        db.close()
+    
+    def test_interval_policy_syncs_periodically(self):
+        """测试 interval 策略按周期 fsync，而不是每次写入或有写入就立即同步"""
+        db = PersistentDatabase(self.data_dir, fsync_policy="interval", fsync_interval=0.2)
+        for i in range(50):
+            db.add_book(Book(None, f"书籍{i}", "作者", 2020, None))
+        assert db.wal.fsync_count == 0
+        
+        for _ in range(100):
+            if db.wal.fsync_count:
+                break
+            time.sleep(0.01)
+        assert db.wal.fsync_count == 1
+        # 周期内没有新的写入时不再 fsync
+        time.sleep(0.3)
+        assert db.wal.fsync_count == 1
+        db.close()
+        
+        # 关闭时不必等待周期结束
+        db = PersistentDatabase(self.data_dir, fsync_policy="interval", fsync_interval=60)
+        db.add_book(Book(None, "书籍", "作者", 2020, None))
+        start = time.monotonic()
+        db = self.reopen(db)
+        assert time.monotonic() - start < 5
+        assert len(db.get_all_books()) == 51
+        db.close()
+    
+    @pytest.mark.parametrize("compact", [False, True])
+    def test_failed_append_undoes_change(self, compact):
+        """测试追加日志失败时撤销内存中的修改，索引和 next_id 保持不变"""
+        db = PersistentDatabase(self.data_dir, compact=compact)
+        db.add_book(Book(None, "原书名", "原作者", 2001, "1111111111"))
+        append = db.wal.append
+        
+        def fail(record):
+            raise OSError("磁盘已满")
+        db.wal.append = fail
+        book = Book(None, "新书", "作者", 2002, "2222222222")
+        with pytest.raises(OSError):
+            db.add_book(book)
+        assert book.book_id is None
+        with pytest.raises(OSError):
+            db.update_book(1, Book(None, "新书名", "新作者", 2003, "3333333333"))
+        with pytest.raises(OSError):
+            db.delete_book(1)
+        db.wal.append = append
+        
+        assert [b.to_dict() for b in db.get_all_books()] == [
+            {"id": 1, "title": "原书名", "author": "原作者", "publication_year": 2001, "isbn": "1111111111"}
+        ]
+        assert db.next_id == 2
+        assert [b.book_id for b in db.find_books(author="原作者")] == [1]
+        assert [b.book_id for b in db.find_books(year_from=2001, year_to=2001)] == [1]
+        assert db.find_books(isbn="2222222222") == db.find_books(author="新作者") == []
+        assert [b.title for b, _ in db.search_books("新书")] == []
+        
+        assert db.add_book(Book(None, "新书", "作者", 2002, "2222222222")).book_id == 2
+        db = self.reopen(db)
+        assert [b.title for b in db.get_all_books()] == ["原书名", "新书"]
+        db.close()
+    
+    def test_invalid_policy(self):
+        """测试不支持的落盘策略"""
+        with pytest.raises(ValueError):
+            WriteAheadLog(self.data_dir, fsync_policy="sometimes")
@@ -0,0 +1,57 @@
+import pytest
+from server.router import Router, NOT_FOUND
+
+class TestRouter:
+    """测试路由表"""
+    
+    def setup_method(self):
+        """每个测试方法运行前的设置"""
+        self.router = Router([
+            ('GET', '/books', 'list'),
+            ('POST', '/books', 'create'),
+            ('GET', '/books/search', 'search'),
+            ('GET', '/books/{book_id:int}', 'get'),
+            ('DELETE', '/books/{book_id:int}', 'delete'),
+            ('GET', '/authors/{name}/books', 'by_author'),
+        ])
+    
+    def test_static_route(self):
+        """测试不含参数的路径"""
+        match = self.router.match('POST', '/books')
+        assert match.handler == 'create'
+        assert match.params == {}
+    
+    def test_typed_param(self):
+        """测试路径参数按类型转换"""
+        match = self.router.match('GET', '/books/42')
+        assert match.handler == 'get'
+        assert match.params == {'book_id': 42}
+        assert self.router.match('GET', '/authors/张三/books').params == {'name': '张三'}
+    
+    def test_literal_before_param(self):
+        """测试字面量段优先于参数段"""
+        assert self.router.match('GET', '/books/search').handler == 'search'
+    
+    @pytest.mark.parametrize("path", ['/books/abc', '/books/-1', '/books/+1', '/books/１', '/books/',
+                                      '/books/1/', '/books/1/extra', '/authors//books', '/unknown', ''])
+    def test_not_found(self, path):
+        """测试参数转换失败或路径不存在时不匹配"""
+        assert self.router.match('GET', path) == NOT_FOUND
+    
+    def test_method_not_allowed(self):
+        """测试路径存在但方法不支持时返回允许的方法"""
+        assert self.router.match('PUT', '/books/1').allowed == ('DELETE', 'GET')
+        assert self.router.match('DELETE', '/books').allowed == ('GET', 'POST')
+        assert self.router.match('PUT', '/books/search').allowed == ('GET',)
+
+    def test_route_template(self):
+        """测试匹配结果带有路径模板"""
+        assert self.router.match('GET', '/books').route == '/books'
+        assert self.router.match('GET', '/books/42').route == '/books/{book_id:int}'
+        assert self.router.match('PUT', '/books/42').route == '/books/{book_id:int}'
+        assert self.router.match('GET', '/authors/张三/books').route == '/authors/{name}/books'
+        assert self.router.match('GET', '/unknown').route is None
+    
+    def test_unknown_converter(self):
+        with pytest.raises(KeyError):
+            self.router.add('GET', '/books/{book_id:uuid}', 'get')
@@ -0,0 +1,55 @@
+import pytest
+from server.models.search import InvertedIndex, tokenize
+
+class TestTokenize:
+    """测试检索分词"""
+    
+    def test_cjk_bigrams(self):
+        """测试中文按二元组切分"""
+        assert tokenize("计算机系统") == ["计算", "算机", "机系", "系统"]
+        assert tokenize("算") == ["算"]
+    
+    def test_mixed_text(self):
+        """测试中英文混合文本"""
+        assert tokenize("Python编程 第3版") == ["编程", "第", "版", "python", "3"]
+    
+    def test_unigrams(self):
+        """测试建索引时额外输出单字"""
+        assert tokenize("编程", unigrams=True) == ["编程", "编", "程"]
+
+
+class TestInvertedIndex:
+    """测试倒排索引"""
+    
+    def setup_method(self):
+        """每个测试方法运行前的设置"""
+        self.index = InvertedIndex()
+        self.index.add(1, "Python编程", "张三")
+        self.index.add(2, "深入理解计算机系统", "李四")
+        self.index.add(3, "计算机网络", "王五")
+        self.index.add(4, "编程珠玑", "Python社区")
+    
+    def test_search_all_terms_required(self):
+        """测试结果必须包含全部检索词"""
+        assert [book_id for book_id, _ in self.index.search("计算机")] == [2, 3]
+        assert self.index.search("计算机编程") == []
+    
+    def test_title_ranked_above_author(self):
+        """测试标题命中的书籍排在作者命中之前"""
+        results = self.index.search("python")
+        
+        assert [book_id for book_id, _ in results] == [1, 4]
+        assert results[0][1] > results[1][1]
+    
+    def test_single_character_and_limit(self):
+        """测试单字检索和返回条数限制"""
+        assert len(self.index.search("机")) == 2
+        assert len(self.index.search("机", limit=1)) == 1
+    
+    def test_remove(self):
+        """测试删除后不再被检索到"""
+        self.index.remove(2)
+        
+        assert [book_id for book_id, _ in self.index.search("计算机")] == [3]
+        assert "深入" not in self.index.postings
+        assert len(self.index) == 3
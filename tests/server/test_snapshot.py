@@ -0,0 +1,206 @@
+import sys
+import threading
+
+import pytest
+from server.models.book import Book
+from server.models.database import Database
+from server.models.snapshot import CopyOnWriteBookStore, PAGE_BITS
+
+class TestCopyOnWriteBookStore:
+    """测试写时复制的书籍存储"""
+
+    def setup_method(self):
+        """每个测试方法运行前的设置"""
+        self.store = CopyOnWriteBookStore()
+
+    def test_dict_interface(self):
+        """测试与 dict 相同的读写接口，遍历按ID升序"""
+        far = 5 << PAGE_BITS
+        for book_id in (3, far, 1, 2):
+            self.store[book_id] = Book(book_id, f"书籍{book_id}", "作者", 2020, None)
+
+        assert len(self.store) == 4
+        assert list(self.store) == [1, 2, 3, far]
+        assert [b.book_id for b in self.store.values()] == [1, 2, 3, far]
+        assert self.store[far].title == f"书籍{far}"
+        assert self.store.get("1") is None
+        assert self.store.pop(far).book_id == far
+        assert self.store.pop(far, None) is None
+        with pytest.raises(KeyError):
+            self.store[far]
+        assert self.store.snapshot().page_numbers == (0,)
+
+    def test_snapshot_unchanged_by_writes(self):
+        """测试已取得的快照不受之后的写入影响，遍历期间可以写入"""
+        for i in range(1, 101):
+            self.store[i] = Book(i, f"书籍{i}", "作者", 2020, None)
+        snapshot = self.store.snapshot()
+
+        seen = []
+        for book in snapshot.values():
+            seen.append(book.book_id)
+            if book.book_id == 50:
+                self.store.pop(1)
+                self.store[5000] = Book(5000, "新书", "作者", 2020, None)
+                self.store[51] = Book(51, "新标题", "作者", 2020, None)
+
+        assert seen == list(range(1, 101))
+        assert snapshot.get(51).title == "书籍51"
+        assert len(snapshot) == 100
+        assert len(self.store) == 100
+        assert self.store.snapshot().version > snapshot.version
+
+    def test_batch_published_once(self):
+        """测试 batch() 内的修改在结束时一起发布，写入线程能读到自己的修改"""
+        self.store[1] = Book(1, "书籍1", "作者", 2020, None)
+        before = self.store.snapshot()
+
+        with self.store.batch():
+            self.store[2] = Book(2, "书籍2", "作者", 2020, None)
+            self.store.pop(1)
+            assert list(self.store) == [2]
+            assert self.store.snapshot() is before
+
+        assert list(self.store.snapshot()) == [2]
+        assert self.store.snapshot().version == before.version + 1
+
+    def test_page(self):
+        """测试按ID分页跨越存储页"""
+        ids = [1, 2, (1 << PAGE_BITS) - 1, 1 << PAGE_BITS, 3 << PAGE_BITS]
+        for book_id in reversed(ids):
+            self.store[book_id] = Book(book_id, "书籍", "作者", 2020, None)
+
+        assert [b.book_id for b in self.store.page(limit=2)] == ids[:2]
+        assert [b.book_id for b in self.store.page(after_id=2, limit=2)] == ids[2:4]
+        assert [b.book_id for b in self.store.page(after_id=ids[3])] == ids[4:]
+        assert self.store.page(after_id=ids[4]) == []
+
+class TestConcurrentReadsAndWrites:
+    """多个线程同时读写数据库，检查读者看到的始终是一致的状态"""
+
+    @pytest.fixture(autouse=True)
+    def setup_database(self, database):
+        """每个测试方法运行前的设置，分别使用三种存储后端
+
+        缩短线程切换间隔，使线程更频繁地在写操作中途被打断。
+        """
+        self.db = database
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        yield
+        sys.setswitchinterval(interval)
+
+    def test_mixed_reads_and_writes(self):
+        """成对添加的书籍同时可见，列表有序且无重复，同一读者看到的版本不回退"""
+        counter = self.db.add_book(Book(None, "版本0", "计数", 2020, None))
+        errors = []
+        stop = threading.Event()
+
+        def guarded(target):
+            def run():
+                try:
+                    target()
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+            return threading.Thread(target=run)
+
+        def add_pairs(writer):
+            for i in range(60):
+                self.db.add_books([Book(None, f"{writer}-{i}-a", f"成对{writer}-{i}", 2020, None),
+                                   Book(None, f"{writer}-{i}-b", f"成对{writer}-{i}", 2020, None)])
+
+        def churn():
+            for i in range(60):
+                book = self.db.add_book(Book(None, f"临时{i}", "临时", 2000 + i, None))
+                self.db.update_book(book.book_id, Book(None, f"临时{i}", "临时", 1999, None))
+                self.db.delete_book(book.book_id)
+
+        def bump():
+            for version in range(1, 121):
+                self.db.update_book(counter.book_id, Book(None, f"版本{version}", "计数", 2020, None))
+
+        def check_listing():
+            last_version = 0
+            while not stop.is_set():
+                books = self.db.get_all_books()
+                ids = [book.book_id for book in books]
+                assert ids == sorted(set(ids))
+                pairs = {}
+                for book in books:
+                    if book.author.startswith("成对"):
+                        pairs[book.author] = pairs.get(book.author, 0) + 1
+                assert set(pairs.values()) <= {2}
+                version = int(books[0].title[2:])
+                assert version >= last_version
+                last_version = version
+
+        def check_reads():
+            last_version = 0
+            while not stop.is_set():
+                version = int(self.db.get_book_by_id(counter.book_id).title[2:])
+                assert version >= last_version
+                last_version = version
+                after_id, seen = None, []
+                while True:
+                    page = self.db.get_books_page(after_id, 25)
+                    if not page:
+                        break
+                    seen.extend(book.book_id for book in page)
+                    after_id = page[-1].book_id
+                assert seen == sorted(set(seen))
+
+        writers = [guarded(lambda w=w: add_pairs(w)) for w in range(3)]
+        writers += [guarded(churn), guarded(bump)]
+        readers = [guarded(check_listing) for _ in range(3)] + [guarded(check_reads) for _ in range(2)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        assert errors == []
+        books = self.db.get_all_books()
+        assert len(books) == self.db.count_books() == 1 + 3 * 60 * 2
+        assert self.db.get_book_by_id(counter.book_id).title == "版本120"
+        assert self.db.find_books(author="临时") == []
+        assert self.db.find_books(year_to=1999) == []
+        for writer in range(3):
+            pair = self.db.find_books(author=f"成对{writer}-59")
+            assert [b.title for b in pair] == [f"{writer}-59-a", f"{writer}-59-b"]
+
+    def test_batch_atomic(self):
+        """测试 Database.batch() 内的删除和添加同时对读者可见"""
+        if not isinstance(self.db, Database):
+            pytest.skip("SQLiteDatabase 依靠事务保证原子性")
+        self.db.add_book(Book(None, "旧书", "作者", 2020, None))
+        before = self.db.get_all_books()
+
+        with self.db.batch():
+            self.db.delete_book(1)
+            self.db.add_book(Book(None, "新书", "作者", 2020, None))
+            titles = threading.Thread(target=lambda: before.extend(self.db.get_all_books()))
+            titles.start()
+            titles.join(0.5)
+        titles.join()
+
+        assert [b.title for b in before] in (["旧书", "旧书"], ["旧书", "新书"])
+        assert [b.title for b in self.db.get_all_books()] == ["新书"]
+
+    def test_batch_notifies_after_publish(self):
+        """测试 batch() 内修改的通知在快照发布之后发出，回调读到的是新数据"""
+        if not isinstance(self.db, Database):
+            pytest.skip("SQLiteDatabase 没有 batch()")
+        seen = []
+        self.db.add_listener(lambda book_id: seen.append((book_id, len(self.db.get_all_books()))))
+
+        with self.db.batch():
+            with self.db.batch():
+                self.db.add_book(Book(None, "书籍1", "作者", 2020, None))
+            assert seen == []
+            self.db.add_book(Book(None, "书籍2", "作者", 2020, None))
+        self.db.add_books([Book(None, "书籍3", "作者", 2020, None)])
+
+        assert seen == [(1, 2), (2, 2), (3, 3)]
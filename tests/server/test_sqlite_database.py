@@ -0,0 +1,131 @@
+import pytest
+import threading
+from server.models.book import Book
+from server.models.database import DuplicateISBNError
+from server.models.sqlite_database import SQLiteDatabase
+
+class TestSQLiteDatabase:
+    """测试 SQLite 存储特有的行为"""
+    
+    @pytest.fixture(autouse=True)
+    def setup_path(self, tmp_path):
+        self.path = str(tmp_path / "books.db")
+        self.db = SQLiteDatabase(self.path)
+        yield
+        self.db.close()
+    
+    def test_data_survives_reopen(self):
+        """测试关闭后重新打开数据仍然存在，删除过的ID不会被重用"""
+        self.db.add_book(Book(None, "书籍1", "作者", 2020, "1111111111"))
+        self.db.add_book(Book(None, "书籍2", "作者", 2021, None))
+        self.db.delete_book(2)
+        self.db.close()
+        
+        self.db = SQLiteDatabase(self.path)
+        
+        assert [b.title for b in self.db.get_all_books()] == ["书籍1"]
+        assert self.db.add_book(Book(None, "书籍3", "作者", 2022, None)).book_id == 3
+        assert [b.book_id for b, _ in self.db.search_books("书籍")] == [1, 3]
+    
+    def test_journal_mode_is_wal(self):
+        """测试数据库使用 WAL 模式"""
+        mode = self.db._connection().execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+    
+    def test_add_books_bulk(self):
+        """测试批量写入预分配的ID与逐本写入一致"""
+        self.db.add_book(Book(None, "已有", "作者", 2020, "1111111111"))
+        books = [Book(None, f"书籍{i}", "作者", 2020, None) for i in range(3)]
+        books.insert(1, Book(10, "指定ID", "作者", 2020, None))
+        
+        results = self.db.add_books(books)
+        
+        assert [b.book_id for b in results] == [2, 10, 11, 12]
+        assert self.db.next_id == 13
+        assert len(self.db.find_books(author="作者")) == 5
+    
+    def test_add_books_with_duplicate_falls_back(self):
+        """测试批次中有ISBN冲突时只有冲突项失败"""
+        self.db.add_book(Book(None, "已有", "作者", 2020, "1111111111"))
+        
+        results = self.db.add_books([
+            Book(None, "新书1", "作者", 2020, "2222222222"),
+            Book(None, "重复", "作者", 2020, "1111111111"),
+            Book(None, "新书2", "作者", 2020, "2222222222"),
+            Book(None, "新书3", "作者", 2020, None),
+        ])
+        
+        assert results[0].book_id == 2
+        assert isinstance(results[1], DuplicateISBNError)
+        assert isinstance(results[2], DuplicateISBNError)
+        assert results[3].book_id == 3
+        assert [b.title for b, _ in self.db.search_books("重复")] == []
+    
+    def test_concurrent_readers_and_writers(self):
+        """测试多个线程各自使用连接并发读写"""
+        errors = []
+        
+        def writer(n):
+            for i in range(50):
+                self.db.add_book(Book(None, f"书籍{n}-{i}", "作者", 2020, None))
+        
+        def reader():
+            try:
+                for _ in range(50):
+                    self.db.get_books_page(limit=20)
+                    self.db.find_books(author="作者")
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        threads += [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == []
+        assert len(self.db.get_all_books()) == 200
+    
+    def test_versions_maintained_by_database(self):
+        """测试版本号随写入更新，在同一数据库的其他连接中可见"""
+        other = SQLiteDatabase(self.path)
+        try:
+            assert other.epoch == self.db.epoch
+            assert self.db.book_version(1) == 0
+            self.db.add_book(Book(None, "书籍1", "作者", 2020, None))
+            self.db.add_book(Book(None, "书籍2", "作者", 2020, None))
+            self.db.update_book(1, Book(None, "新书名", "作者", 2020, None))
+            assert other.book_version(1) == 3
+            assert other.book_version(2) == 2
+            assert other.collection_version() == 3
+            # 删除的书籍版本号也会增加，不会回退
+            other.delete_book(2)
+            assert self.db.book_version(2) == 4
+            assert self.db.collection_version() == 4
+        finally:
+            other.close()
+    
+    def test_shared_lock_excludes_other_instances(self):
+        """测试共享模式下不同实例（模拟不同进程）的锁互斥"""
+        first = SQLiteDatabase(self.path, shared=True)
+        second = SQLiteDatabase(self.path, shared=True)
+        acquired = threading.Event()
+        
+        def hold_second():
+            with second.lock:
+                acquired.set()
+        
+        try:
+            with first.lock:
+                # 同一实例内可重入
+                with first.lock:
+                    pass
+                thread = threading.Thread(target=hold_second)
+                thread.start()
+                assert not acquired.wait(0.2)
+            assert acquired.wait(5)
+            thread.join()
+        finally:
+            first.close()
+            second.close()
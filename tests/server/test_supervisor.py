@@ -0,0 +1,129 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from server.supervisor import Supervisor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith('linux') or not hasattr(socket, 'SO_REUSEPORT'),
+    reason="多进程模式需要 Linux 的 SO_REUSEPORT"
+)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+def child_pids(pid):
+    """通过 /proc 查找 pid 的子进程"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 进程名可能包含空格，父进程ID在最后一个右括号之后的第二个字段
+        if int(stat.rpartition(')')[2].split()[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+@pytest.fixture
+def cluster(tmp_path):
+    """以两个工作进程启动服务器，返回 (进程, 基础URL)"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "server.server", "--workers", "2", "--port", str(port),
+         "--storage", "sqlite", "--data-dir", str(tmp_path), "--drain-timeout", "2"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f"http://localhost:{port}"
+
+    def ready():
+        try:
+            return requests.get(f"{base}/books/1", timeout=1).status_code == 200
+        except requests.ConnectionError:
+            return False
+
+    try:
+        assert wait_until(ready), "服务器未能启动"
+        assert wait_until(lambda: len(child_pids(process.pid)) == 2)
+        yield process, base
+    finally:
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+class TestSupervisor:
+    """测试多进程模式"""
+
+    def test_requires_sqlite(self):
+        """测试多进程模式只支持 sqlite 存储"""
+        with pytest.raises(ValueError):
+            Supervisor(2, storage='memory')
+        with pytest.raises(ValueError):
+            Supervisor(0, storage='sqlite')
+
+    def test_writes_visible_to_all_workers(self, cluster):
+        """测试写入后任何工作进程都能读到，ETag 在各进程之间一致"""
+        _, base = cluster
+        book = requests.post(f"{base}/books", json={
+            "title": "多进程", "author": "作者", "publication_year": 2024, "isbn": "9780000000002"
+        }).json()["data"]
+        # 每个请求使用新连接，由内核分配给不同的工作进程
+        responses = [requests.get(f"{base}/books/{book['id']}", headers={"Connection": "close"})
+                     for _ in range(20)]
+        assert {r.status_code for r in responses} == {200}
+        etags = {r.headers["ETag"] for r in responses}
+        assert len(etags) == 1
+        stale = etags.pop()
+
+        # 其他进程的修改使所有进程的 ETag 失效
+        requests.put(f"{base}/books/{book['id']}", json=dict(book, title="新书名"))
+        for _ in range(10):
+            response = requests.get(f"{base}/books/{book['id']}",
+                                    headers={"If-None-Match": stale, "Connection": "close"})
+            assert response.status_code == 200
+            assert response.json()["data"]["title"] == "新书名"
+
+    def test_crashed_worker_restarted(self, cluster):
+        """测试工作进程崩溃后被重新启动，服务不中断"""
+        process, base = cluster
+        victim = child_pids(process.pid)[0]
+        os.kill(victim, signal.SIGKILL)
+        assert wait_until(lambda: len(child_pids(process.pid)) == 2
+                          and victim not in child_pids(process.pid))
+        for _ in range(10):
+            assert requests.get(f"{base}/books/1", headers={"Connection": "close"}).status_code == 200
+
+    def test_graceful_shutdown(self, cluster):
+        """测试收到 SIGTERM 后所有进程退出"""
+        process, base = cluster
+        workers = child_pids(process.pid)
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(15) == 0
+        # 主进程退出前已回收所有工作进程
+        for pid in workers:
+            assert not os.path.exists(f"/proc/{pid}")
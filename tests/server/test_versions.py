@@ -0,0 +1,79 @@
+import pytest
+from server.models.book import Book
+from server.models.sqlite_database import SQLiteDatabase
+from server.versions import VersionTracker, DatabaseVersionTracker, etag_matches, encoded_etag
+
+class TestVersionTracker:
+    """测试书籍版本号和 ETag"""
+    
+    def setup_method(self):
+        """每个测试方法运行前的设置"""
+        self.versions = VersionTracker()
+    
+    def test_book_etag_changes_only_for_changed_book(self):
+        """测试修改一本书只改变这本书和集合的 ETag"""
+        book1 = self.versions.book_etag(1)
+        book2 = self.versions.book_etag(2)
+        collection = self.versions.collection_etag()
+        
+        self.versions.book_changed(1)
+        
+        assert self.versions.book_etag(1) != book1
+        assert self.versions.book_etag(2) == book2
+        assert self.versions.collection_etag() != collection
+    
+    def test_collection_etag_variants(self):
+        """测试不同表示使用不同的 ETag"""
+        assert self.versions.collection_etag("id") != self.versions.collection_etag()
+    
+    def test_epoch_differs_between_trackers(self):
+        """测试重启后不会产生与之前相同的 ETag"""
+        assert VersionTracker().book_etag(1) != self.versions.book_etag(1)
+
+
+class TestEtagMatches:
+    """测试条件请求头的比较"""
+    
+    def test_list_and_wildcard(self):
+        """测试逗号分隔的列表和通配符"""
+        assert etag_matches('"a", "b"', '"b"')
+        assert etag_matches('*', '"b"')
+        assert not etag_matches('"a"', '"b"')
+        assert not etag_matches(None, '"b"')
+    
+    def test_weak_comparison(self):
+        """测试 If-None-Match 使用弱比较，If-Match 使用强比较"""
+        assert etag_matches('W/"a"', '"a"', weak=True)
+        assert not etag_matches('W/"a"', '"a"')
+    
+    def test_encoded_etag(self):
+        """测试压缩表示的 ETag 与原 ETag 不同，但比较时视为同一版本"""
+        assert encoded_etag('"a-1-0"', "gzip") == '"a-1-0-gzip"'
+        assert encoded_etag('"a-1-0"', None) == '"a-1-0"'
+        assert etag_matches('"a-1-0-gzip"', '"a-1-0"')
+        assert etag_matches('W/"a-1-0-deflate"', '"a-1-0"', weak=True)
+        assert not etag_matches('"a-1-1-gzip"', '"a-1-0"')
+        assert etag_matches(encoded_etag(encoded_etag('"a-1-0"', "msgpack"), "gzip"), '"a-1-0"')
+
+class TestDatabaseVersionTracker:
+    """测试从共享数据库读取版本号"""
+    
+    def test_trackers_agree_across_instances(self, tmp_path):
+        """测试两个实例（模拟两个进程）生成相同的 ETag"""
+        path = str(tmp_path / "books.db")
+        first = SQLiteDatabase(path)
+        second = SQLiteDatabase(path)
+        try:
+            tracker1 = DatabaseVersionTracker(first)
+            tracker2 = DatabaseVersionTracker(second)
+            book = first.add_book(Book(None, "书籍", "作者", 2020, None))
+            etag = tracker2.book_etag(book.book_id)
+            assert etag == tracker1.book_etag(book.book_id)
+            assert tracker1.collection_etag("id") == tracker2.collection_etag("id")
+            
+            second.update_book(book.book_id, Book(None, "新书名", "作者", 2020, None))
+            assert tracker1.book_etag(book.book_id) != etag
+            assert tracker1.book_etag(book.book_id) == tracker2.book_etag(book.book_id)
+        finally:
+            first.close()
+            second.close()
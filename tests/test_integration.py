@@ -1,6 +1,11 @@
 import pytest
+import asyncio
 import threading
 import time
+import socket
+import http.client
+import re
+import json
 import requests
 
 from server.models import Book, Database
@@ -8,13 +13,15 @@ from server.controllers import BookController
 from server.views import BookView
 from server.server import BookServer
 from client.book_client import BookClient
+from client.async_book_client import AsyncBookClient
+from common import msgpack_codec
 
-@pytest.fixture
-def server():
-    """启动测试服务器的fixture"""
+@pytest.fixture(params=['threaded', 'asyncio'])
+def server(request):
+    """启动测试服务器的fixture，分别使用两种服务器引擎"""
     # 使用一个不太可能冲突的端口
     port = 8099
-    server = BookServer(port=port)
+    server = BookServer(port=port, engine=request.param)
     
     # 启动服务器
     server.start()
@@ -117,4 +124,679 @@ class TestIntegration:
         success, error = client.delete_book(9999)
         
         assert success is False
-        assert error is not None 
\ No newline at end of file
+        assert error is not None
+    
+    def test_slow_client_does_not_block_others(self, server):
+        """测试慢客户端不会阻塞其他请求"""
+        slow = socket.create_connection(("localhost", server.port))
+        try:
+            # 只发送请求头，请求体迟迟不发送
+            slow.sendall(
+                b"POST /books HTTP/1.1\r\n"
+                b"Host: localhost\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Content-Length: 100\r\n\r\n"
+            )
+            start = time.time()
+            response = requests.get(f"http://localhost:{server.port}/books", timeout=5)
+            assert response.status_code == 200
+            assert time.time() - start < 2
+        finally:
+            slow.close()
+    
+    @pytest.mark.parametrize('concurrency', ['pool', 'single'])
+    def test_trickling_client_times_out(self, request, concurrency):
+        """测试逐字节缓慢发送请求的客户端在请求超时后被断开，而不是每收到一个字节重新计时"""
+        server = BookServer(port=0, concurrency=concurrency, request_timeout=1.0, access_log=None)
+        server.start()
+        request.addfinalizer(server.stop)
+        with socket.create_connection(("localhost", server.port), timeout=5) as sock:
+            start = time.time()
+            sock.sendall(b"GET /books HTTP/1.1\r\n")
+            closed = False
+            while time.time() - start < 4:
+                try:
+                    sock.sendall(b"X")
+                except OSError:
+                    closed = True
+                    break
+                sock.settimeout(0.3)
+                try:
+                    if sock.recv(1024) == b"":
+                        closed = True
+                        break
+                except socket.timeout:
+                    pass
+            assert closed
+            assert time.time() - start < 2.5
+    
+    def test_slow_write_does_not_block_reads(self, server, monkeypatch):
+        """测试写请求等待持久化时，其他连接上的读请求照常完成"""
+        entered = threading.Event()
+        release = threading.Event()
+        create_book = server.controller.create_book
+        def slow_create_book(book_data):
+            # 模拟等待日志 fsync 或 SQLite 写入
+            entered.set()
+            release.wait(5)
+            return create_book(book_data)
+        monkeypatch.setattr(server.controller, 'create_book', slow_create_book)
+        
+        writer = http.client.HTTPConnection("localhost", server.port, timeout=10)
+        try:
+            writer.request("POST", "/books", body=json.dumps({"title": "慢写入", "author": "作者"}),
+                           headers={"Content-Type": "application/json"})
+            assert entered.wait(5)
+            start = time.time()
+            response = requests.get(f"http://localhost:{server.port}/books/1", timeout=3)
+            assert response.status_code == 200
+            assert time.time() - start < 1
+            release.set()
+            response = writer.getresponse()
+            response.read()
+            assert response.status == 201
+        finally:
+            release.set()
+            writer.close()
+    
+    def test_many_idle_connections(self, server):
+        """测试保持大量空闲连接（包括长连接）时仍能处理请求"""
+        idle = [socket.create_connection(("localhost", server.port)) for _ in range(200)]
+        # 处理过一个请求后空闲的长连接，数量超过线程池大小
+        kept = [http.client.HTTPConnection("localhost", server.port, timeout=5) for _ in range(40)]
+        try:
+            for conn in kept:
+                conn.request("GET", "/books/1")
+                assert conn.getresponse().read()
+            response = requests.get(f"http://localhost:{server.port}/books", timeout=5)
+            assert response.status_code == 200
+            # 空闲的长连接仍然可以继续使用
+            for conn in kept:
+                conn.request("GET", "/books/1")
+                response = conn.getresponse()
+                response.read()
+                assert response.status == 200
+        finally:
+            for conn in idle:
+                conn.close()
+            for conn in kept:
+                conn.close()
+    
+    def test_drain_closes_keep_alive_connections(self, server, monkeypatch):
+        """测试停止时关闭空闲的长连接，正在处理的请求的响应带有 Connection: close"""
+        idle = http.client.HTTPConnection("localhost", server.port, timeout=5)
+        idle.request("GET", "/books/1")
+        idle.getresponse().read()
+        
+        entered = threading.Event()
+        release = threading.Event()
+        book_etag = server.controller.book_etag
+        def slow_book_etag(book_id):
+            entered.set()
+            release.wait(5)
+            return book_etag(book_id)
+        monkeypatch.setattr(server.controller, 'book_etag', slow_book_etag)
+        busy = http.client.HTTPConnection("localhost", server.port, timeout=5)
+        busy.request("GET", "/books/1")
+        assert entered.wait(5)
+        
+        http_server = server.server
+        remaining = []
+        drain = threading.Thread(target=lambda: remaining.append(server.drain(5)))
+        drain.start()
+        try:
+            for _ in range(100):
+                if getattr(http_server, 'draining', False):
+                    break
+                time.sleep(0.01)
+            release.set()
+            response = busy.getresponse()
+            assert response.status == 200
+            assert response.getheader("Connection") == "close"
+            response.read()
+            
+            idle.sock.settimeout(5)
+            assert idle.sock.recv(1) == b""
+        finally:
+            release.set()
+            drain.join(10)
+            idle.close()
+            busy.close()
+        assert remaining == [0]
+    
+    def test_keep_alive_connection_reused(self, server):
+        """测试同一个连接可以连续处理多个请求"""
+        conn = http.client.HTTPConnection("localhost", server.port, timeout=5)
+        try:
+            for _ in range(3):
+                conn.request("GET", "/books/1")
+                response = conn.getresponse()
+                body = response.read()
+                assert response.status == 200
+                assert response.getheader("Content-Length") == str(len(body))
+                assert not response.will_close
+            sock = conn.sock
+            conn.request("GET", "/books")
+            conn.getresponse().read()
+            assert conn.sock is sock
+        finally:
+            conn.close()
+    
+    def test_pipelined_requests(self, server):
+        """测试流水线请求按顺序返回响应"""
+        with socket.create_connection(("localhost", server.port), timeout=5) as sock:
+            body = b'{"title": "pipeline"}'
+            sock.sendall(
+                b"GET /books/1 HTTP/1.1\r\nHost: localhost\r\n\r\n"
+                b"POST /unknown HTTP/1.1\r\nHost: localhost\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body +
+                b"GET /books/2 HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n"
+            )
+            data = b""
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        
+        statuses = re.findall(rb"HTTP/1\.1 (\d{3}) ", data)
+        assert statuses == [b"200", b"404", b"200"]
+    
+    def test_max_keepalive_requests(self, request):
+        """测试达到单连接请求上限后服务器关闭连接"""
+        server = BookServer(port=0, engine='threaded', max_keepalive_requests=2)
+        server.start()
+        request.addfinalizer(server.stop)
+        
+        conn = http.client.HTTPConnection("localhost", server.port, timeout=5)
+        try:
+            conn.request("GET", "/books/1")
+            first = conn.getresponse()
+            first.read()
+            conn.request("GET", "/books/1")
+            second = conn.getresponse()
+            second.read()
+            assert not first.will_close
+            assert second.will_close
+        finally:
+            conn.close()
+
+    
+    def test_async_client_crud(self, server):
+        """测试异步客户端的CRUD操作"""
+        async def scenario():
+            async with AsyncBookClient(f"http://localhost:{server.port}") as client:
+                created, error = await client.create_book({
+                    "title": "异步客户端书籍",
+                    "author": "测试作者",
+                    "publication_year": 2024,
+                    "isbn": "5566778899"
+                })
+                assert error is None
+                book_id = created["id"]
+                
+                book, error = await client.get_book(book_id)
+                assert error is None
+                assert book["title"] == "异步客户端书籍"
+                
+                updated, error = await client.update_book(book_id, {"title": "更新的异步书籍"})
+                assert error is None
+                assert updated["title"] == "更新的异步书籍"
+                assert updated["isbn"] == "5566778899"
+                
+                books, error = await client.get_all_books()
+                assert error is None
+                assert any(b["id"] == book_id for b in books)
+                
+                success, error = await client.delete_book(book_id)
+                assert success is True
+                
+                book, error = await client.get_book(book_id)
+                assert book is None
+                assert "找不到" in error
+        
+        asyncio.run(scenario())
+    
+    def test_async_client_gather_books(self, server):
+        """测试异步客户端通过流水线批量获取书籍"""
+        async def scenario():
+            async with AsyncBookClient(f"http://localhost:{server.port}",
+                                       max_connections=2, pipeline_depth=4) as client:
+                concurrent = await asyncio.gather(*(client.get_book(1) for _ in range(20)))
+                assert all(error is None for _, error in concurrent)
+                return await client.gather_books([1, 2, 3, 9999] * 5)
+        
+        results = asyncio.run(scenario())
+        
+        assert len(results) == 20
+        assert [book["id"] for book, _ in results[:3]] == [1, 2, 3]
+        assert results[3][0] is None
+        assert "404" in results[3][1]
+    
+    def test_async_client_gather_books_limited(self, server):
+        """测试 gather_books 同时进行的流水线组数不超过 max_concurrency"""
+        async def scenario():
+            async with AsyncBookClient(f"http://localhost:{server.port}", max_connections=8,
+                                       max_concurrency=2, pipeline_depth=2) as client:
+                send = client._send
+                active = peak = 0
+                
+                async def tracked(requests):
+                    nonlocal active, peak
+                    active += 1
+                    peak = max(peak, active)
+                    try:
+                        return await send(requests)
+                    finally:
+                        active -= 1
+                client._send = tracked
+                results = await client.gather_books([1, 2, 3] * 10)
+                return results, peak
+        
+        results, peak = asyncio.run(scenario())
+        
+        assert [book["id"] for book, _ in results] == [1, 2, 3] * 10
+        assert peak == 2
+    
+    def test_async_client_retries_only_reads(self):
+        """测试复用的连接失效时只重发读请求，写请求不会被重复执行"""
+        received = []
+        
+        async def handle(reader, writer):
+            # 每个连接只响应第一个请求，收到第二个请求后直接关闭，模拟服务器关闭空闲连接
+            served = 0
+            try:
+                while True:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                    match = re.search(rb"Content-Length: (\d+)", head)
+                    if match:
+                        await reader.readexactly(int(match.group(1)))
+                    received.append(head.split(b" ", 1)[0].decode())
+                    if served:
+                        return
+                    served += 1
+                    body = b'{"data": {"id": 1}}'
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+                    await writer.drain()
+            except asyncio.IncompleteReadError:
+                pass
+            finally:
+                writer.close()
+        
+        async def scenario():
+            stub = await asyncio.start_server(handle, "localhost", 0)
+            port = stub.sockets[0].getsockname()[1]
+            async with stub:
+                async with AsyncBookClient(f"http://localhost:{port}", max_connections=1) as client:
+                    assert (await client.get_book(1))[1] is None
+                    created, error = await client.create_book({"title": "书籍", "author": "作者"})
+                    assert created is None and error is not None
+                    
+                    assert (await client.get_book(1))[1] is None
+                    book, error = await client.get_book(1)
+                    assert error is None and book == {"id": 1}
+        
+        asyncio.run(scenario())
+        
+        # POST 只发送了一次；失效连接上的 GET 在新连接上重发
+        assert received == ["GET", "POST", "GET", "GET", "GET"]
+    
+    def test_batch_operations(self, client):
+        """测试批量创建、更新和删除"""
+        books = [
+            {"title": f"批量书籍{i}", "author": "批量作者", "publication_year": 2000 + i, "isbn": f"97800000000{i:02d}"}
+            for i in range(25)
+        ]
+        results, error = client.create_books(books, chunk_size=10)
+        assert error is None
+        assert len(results) == 25
+        assert all(r["status"] == 201 for r in results)
+        ids = [r["data"]["id"] for r in results]
+        
+        results, error = client.update_books([{"id": book_id, "author": "新作者"} for book_id in ids])
+        assert error is None
+        assert all(r["data"]["author"] == "新作者" for r in results)
+        
+        results, error = client.delete_books(ids + [99999])
+        assert error is None
+        assert [r["status"] for r in results] == [204] * 25 + [404]
+        
+        response = requests.post(client.batch_url, json=[{}] * 1001)
+        assert response.status_code == 413
+    
+    def test_put_replaces_patch_merges(self, client):
+        """测试 PUT 整体替换书籍，PATCH 只修改提供的字段"""
+        book, error = client.create_book({"title": "原书名", "author": "原作者", "publication_year": 2001, "isbn": "9780000000999"})
+        book_url = f"{client.books_url}/{book['id']}"
+        
+        patched = requests.patch(book_url, json={"title": "补丁"}).json()["data"]
+        assert patched == dict(book, title="补丁")
+        replaced = requests.put(book_url, json={"title": "替换"}).json()["data"]
+        assert replaced == {"id": book["id"], "title": "替换", "author": None, "publication_year": None, "isbn": None}
+        
+        book, error = client.replace_book(book["id"], {"title": "客户端替换", "author": "作者"})
+        assert error is None
+        assert book["publication_year"] is None
+        results, error = client.replace_books([{"id": book["id"], "title": "批量替换"}])
+        assert results[0]["data"]["author"] is None
+    
+    def test_pagination(self, client):
+        """测试分页参数和客户端逐页遍历"""
+        client.create_books([{"title": f"分页书籍{i}"} for i in range(7)])
+        
+        response = requests.get(client.books_url, params={"limit": 2, "fields": "id,title"})
+        assert response.status_code == 200
+        body = response.json()
+        assert len(body["data"]) == 2
+        assert set(body["data"][0]) == {"id", "title"}
+        assert body["next_cursor"]
+        
+        all_books, _ = client.get_all_books()
+        assert [b["id"] for b in client.iter_books(page_size=3)] == sorted(b["id"] for b in all_books)
+        
+        response = requests.get(client.books_url, params={"limit": 5000})
+        assert response.status_code == 400
+    
+    def test_streaming_listing(self, client):
+        """测试 chunked JSON 和 NDJSON 流式导出"""
+        client.create_books([{"title": f"流式书籍{i}", "author": "作者"} for i in range(250)])
+        expected, _ = client.get_all_books()
+        expected_ids = sorted(b["id"] for b in expected)
+        
+        response = requests.get(client.books_url, params={"stream": 1})
+        assert response.headers["Transfer-Encoding"] == "chunked"
+        assert [b["id"] for b in response.json()["data"]] == expected_ids
+        
+        streamed = list(client.stream_books(fields=["id", "title"]))
+        assert [b["id"] for b in streamed] == expected_ids
+        assert set(streamed[0]) == {"id", "title"}
+        
+        # 流式响应之后连接仍可继续使用
+        book, error = client.get_book(1)
+        assert error is None
+    
+    def test_query_filters(self, client):
+        """测试按作者、ISBN和年份范围查询"""
+        base = client.books_url
+        
+        response = requests.get(base, params={"author": "张三"})
+        assert [b["isbn"] for b in response.json()["data"]] == ["9787111612727"]
+        
+        response = requests.get(base, params={"year_from": 2019, "year_to": 2020, "fields": "id"})
+        assert response.json()["data"] == [{"id": 1}, {"id": 3}]
+        
+        books, error = client.find_books(isbn="9787111544937")
+        assert error is None
+        assert [b["author"] for b in books] == ["李四"]
+        
+        response = requests.post(base, json={"title": "重复", "isbn": "9787111612727"})
+        assert response.status_code == 409
+    
+    def test_search(self, client):
+        """测试全文检索接口"""
+        response = requests.get(f"{client.books_url}/search", params={"q": "计算机", "limit": 5})
+        assert response.status_code == 200
+        assert [b["title"] for b in response.json()["data"]] == ["深入理解计算机系统"]
+        
+        books, error = client.search_books("python")
+        assert error is None
+        assert books[0]["title"] == "Python编程"
+        
+        response = requests.get(f"{client.books_url}/search")
+        assert response.status_code == 400
+    
+    @pytest.mark.parametrize("storage", ["memory", "sqlite"])
+    def test_persistent_server_restart(self, tmp_path, storage):
+        """测试使用数据目录的服务器重启后保留数据且不重复添加示例数据"""
+        data_dir = str(tmp_path / "data")
+        server = BookServer(port=0, data_dir=data_dir, storage=storage)
+        server.start()
+        try:
+            client = BookClient(f"http://localhost:{server.port}")
+            book, error = client.create_book({"title": "持久化", "author": "作者"})
+            assert error is None
+            client.delete_book(1)
+            client.close()
+        finally:
+            server.stop()
+        
+        server = BookServer(port=0, data_dir=data_dir, storage=storage)
+        server.start()
+        try:
+            client = BookClient(f"http://localhost:{server.port}")
+            books, error = client.get_all_books()
+            assert error is None
+            assert len(books) == 3
+            assert "持久化" in [b["title"] for b in books]
+            client.close()
+        finally:
+            server.stop()
+    
+    def test_response_cache_invalidated(self, server, client):
+        """测试响应缓存命中以及修改后立即失效"""
+        server.cache.clear()
+        book_url = f"{client.books_url}/1"
+        
+        first = requests.get(book_url).content
+        assert requests.get(book_url).content == first
+        assert server.cache.hits == 1
+        
+        requests.put(book_url, json={"title": "缓存后修改"})
+        assert requests.get(book_url).json()["data"]["title"] == "缓存后修改"
+        
+        requests.get(client.books_url)
+        requests.post(client.books_url, json={"title": "新书"})
+        titles = [b["title"] for b in requests.get(client.books_url).json()["data"]]
+        assert "新书" in titles
+    
+    def test_conditional_requests(self, client):
+        """测试 ETag、304 和 If-Match"""
+        book_url = f"{client.books_url}/1"
+        
+        response = requests.get(book_url)
+        etag = response.headers["ETag"]
+        not_modified = requests.get(book_url, headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["ETag"] == etag
+        
+        listing = requests.get(client.books_url)
+        assert requests.get(client.books_url, headers={"If-None-Match": listing.headers["ETag"]}).status_code == 304
+        
+        updated = requests.put(book_url, json={"title": "新标题"}, headers={"If-Match": etag})
+        assert updated.status_code == 200
+        assert updated.headers["ETag"] != etag
+        assert requests.put(book_url, json={"title": "冲突"}, headers={"If-Match": etag}).status_code == 412
+        assert requests.delete(book_url, headers={"If-Match": etag}).status_code == 412
+        assert requests.get(client.books_url, headers={"If-None-Match": listing.headers["ETag"]}).status_code == 200
+        
+        # 客户端透明地使用本地缓存的响应
+        book, error = client.get_book(2)
+        book_again, error = client.get_book(2)
+        assert error is None
+        assert book_again == book
+        book, error = client.update_book(2, {"title": "客户端修改"}, etag=client.get_book_etag(2))
+        assert error is None
+        assert client.get_book(2)[0]["title"] == "客户端修改"
+        assert client.delete_book(2, etag='"stale"')[0] is False
+    
+    def test_response_compression(self, client):
+        """测试按 Accept-Encoding 压缩响应"""
+        client.create_books([{"title": f"压缩书籍{i}", "author": "作者"} for i in range(100)])
+        base = client.books_url
+        
+        plain = requests.get(base, headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in plain.headers
+        assert plain.headers["Vary"] == "Accept, Accept-Encoding"
+        
+        for encoding in ("gzip", "deflate"):
+            # 第二次请求命中缓存的压缩响应
+            for _ in range(2):
+                response = requests.get(base, headers={"Accept-Encoding": encoding})
+                assert response.headers["Content-Encoding"] == encoding
+                assert int(response.headers["Content-Length"]) < len(plain.content)
+                assert response.json() == plain.json()
+        
+        # 小响应不压缩
+        book = requests.get(f"{base}/1", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in book.headers
+        
+        # 压缩表示有自己的 ETag，条件请求对任一表示的 ETag 都有效
+        gzipped = requests.get(base, headers={"Accept-Encoding": "gzip"})
+        assert gzipped.headers["ETag"] != plain.headers["ETag"]
+        not_modified = requests.get(base, headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["ETag"]})
+        assert not_modified.status_code == 304
+        assert not_modified.headers["ETag"] == gzipped.headers["ETag"]
+        assert requests.get(base, headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["ETag"]}).status_code == 304
+        
+        # 修改后压缩的缓存响应也失效
+        client.create_book({"title": "压缩后新增", "author": "作者"})
+        response = requests.get(base, headers={"Accept-Encoding": "gzip"})
+        assert response.json()["data"][-1]["title"] == "压缩后新增"
+        
+        # 流式响应逐块压缩
+        streamed = requests.get(base, params={"stream": 1}, headers={"Accept-Encoding": "gzip"})
+        assert streamed.headers["Content-Encoding"] == "gzip"
+        assert streamed.json()["data"] == response.json()["data"]
+        
+        asyncio.run(self._check_async_client_decompresses(client.base_url))
+    
+    async def _check_async_client_decompresses(self, base_url):
+        async with AsyncBookClient(base_url) as async_client:
+            books, error = await async_client.get_all_books()
+            assert error is None
+            assert books[-1]["title"] == "压缩后新增"
+    
+    def test_msgpack_wire_format(self, server):
+        """测试按 Accept 和 Content-Type 协商 MessagePack 格式"""
+        base = f"http://localhost:{server.port}/books"
+        headers = {"Accept": "application/msgpack"}
+        
+        response = requests.get(f"{base}/1", headers=headers)
+        assert response.headers["Content-Type"] == "application/msgpack"
+        book = msgpack_codec.loads(response.content)["data"]
+        assert book == requests.get(f"{base}/1").json()["data"]
+        # 缓存命中时仍按请求的格式返回
+        assert requests.get(f"{base}/1").headers["Content-Type"] == "application/json"
+        assert msgpack_codec.loads(requests.get(f"{base}/1", headers=headers).content)["data"] == book
+        
+        # 两种格式是同一版本的不同表示
+        etag = response.headers["ETag"]
+        assert etag != requests.get(f"{base}/1").headers["ETag"]
+        not_modified = requests.get(f"{base}/1", headers={**headers, "If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.headers["ETag"] == etag
+        
+        # 请求体使用 MessagePack，错误响应也按协商的格式返回
+        created = requests.post(base, data=msgpack_codec.dumps({"title": "二进制", "author": "作者"}),
+                                headers={**headers, "Content-Type": "application/msgpack"})
+        assert created.status_code == 201
+        assert msgpack_codec.loads(created.content)["data"]["title"] == "二进制"
+        invalid = requests.post(base, data=b"\xc1", headers={**headers, "Content-Type": "application/msgpack"})
+        assert invalid.status_code == 400
+        assert "message" in msgpack_codec.loads(invalid.content)
+        # JSON 无法表示的 bin 类型和非字符串的键不会被保存
+        for body in ({"title": b"\x00", "author": "作者"}, {"title": "书", 1: "键"}):
+            rejected = requests.post(base, data=msgpack_codec.dumps(body),
+                                     headers={**headers, "Content-Type": "application/msgpack"})
+            assert rejected.status_code == 400
+        assert requests.get(base).json()["data"][-1]["title"] == "二进制"
+        
+        # JSON 优先级更高时返回 JSON
+        preferred = requests.get(base, headers={"Accept": "application/json, application/msgpack;q=0.5"})
+        assert preferred.headers["Content-Type"] == "application/json"
+        
+        with BookClient(f"http://localhost:{server.port}", wire_format="msgpack") as client:
+            book, error = client.create_book({"title": "客户端二进制", "author": "作者"})
+            assert error is None
+            assert client.get_book(book["id"]) == (book, None)
+            assert client.get_book(book["id"]) == (book, None)
+            updated, error = client.update_book(book["id"], {"title": "改名"}, etag=client.get_book_etag(book["id"]))
+            assert error is None
+            assert updated["title"] == "改名"
+            results, error = client.create_books([{"title": f"批量{i}"} for i in range(3)])
+            assert [r["status"] for r in results] == [201] * 3
+            books, error = client.get_all_books()
+            assert books == requests.get(base).json()["data"]
+    
+    def test_routing_errors(self, server):
+        """测试不支持的方法返回 405 和 Allow，无效的书籍ID返回 404"""
+        base = f"http://localhost:{server.port}/books"
+        
+        response = requests.post(f"{base}/1", json={"title": "补丁"})
+        assert response.status_code == 405
+        assert response.headers["Allow"] == "DELETE, GET, PATCH, PUT"
+        assert requests.delete(base).headers["Allow"] == "GET, POST"
+        assert requests.post(f"{base}/search").status_code == 405
+        
+        assert requests.get(f"{base}/abc").status_code == 404
+        assert requests.get(f"{base}/1/extra").status_code == 404
+        # 查询字符串不影响路由
+        assert requests.get(f"{base}/1", params={"x": "1"}).json()["data"]["id"] == 1
+
+    def test_metrics_endpoint(self, server):
+        """测试 /metrics 以 Prometheus 文本格式导出请求指标"""
+        base = f"http://localhost:{server.port}"
+        requests.get(f"{base}/books/1")
+        requests.get(f"{base}/books/999")
+        requests.post(f"{base}/books", json={
+            "title": "指标", "author": "作者", "publication_year": 2024, "isbn": "9780000000001"
+        })
+        requests.get(f"{base}/unknown")
+        list(requests.get(f"{base}/books", params={"stream": "1"}, stream=True).iter_content())
+
+        response = requests.get(f"{base}/metrics")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+        route = 'method="GET",route="/books/{book_id:int}"'
+        assert f'bookserver_requests_total{{{route},status="200"}} 1' in text
+        assert f'bookserver_requests_total{{{route},status="404"}} 1' in text
+        assert 'bookserver_requests_total{method="POST",route="/books",status="201"} 1' in text
+        assert 'bookserver_requests_total{method="GET",route="unmatched",status="404"} 1' in text
+        assert f'bookserver_request_duration_seconds_count{{{route}}} 2' in text
+        assert f'bookserver_request_duration_quantile_seconds{{{route},quantile="0.99"}}' in text
+        assert re.search(r'^bookserver_request_bytes_total\{method="POST",route="/books"\} [1-9]', text, re.M)
+        assert re.search(r'^bookserver_response_bytes_total\{method="GET",route="/books"\} [1-9]', text, re.M)
+        # 正在处理的请求只有 /metrics 本身
+        assert 'bookserver_requests_in_flight 1' in text
+        assert 'bookserver_books 4' in text
+
+    def test_metrics_disabled(self, request):
+        """测试不统计指标时 /metrics 返回 404"""
+        server = BookServer(port=0, metrics=False)
+        server.start()
+        request.addfinalizer(server.stop)
+        assert requests.get(f"http://localhost:{server.port}/metrics").status_code == 404
+    
+    @pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+    def test_access_log(self, tmp_path, engine):
+        """测试每个请求在访问日志中记录一行，包含路由、状态码和字节数"""
+        path = tmp_path / 'access.log'
+        server = BookServer(port=0, engine=engine, metrics=False, access_log=str(path))
+        server.start()
+        base = f"http://localhost:{server.port}"
+        try:
+            requests.get(f"{base}/books/1", params={"x": "1"})
+            requests.get(f"{base}/books/999")
+            requests.post(f"{base}/books", json={
+                "title": "访问日志", "author": "作者", "publication_year": 2024, "isbn": "9780000000002"
+            })
+            streamed = requests.get(f"{base}/books", params={"stream": "1"},
+                                    headers={"Accept-Encoding": "identity"}).content
+        finally:
+            # 停止服务器时写出剩余的访问日志
+            server.stop()
+
+        lines = [json.loads(line) for line in path.read_bytes().splitlines()]
+        assert [(line["method"], line["route"], line["status"]) for line in lines] == [
+            ("GET", "/books/{book_id:int}", 200),
+            ("GET", "/books/{book_id:int}", 404),
+            ("POST", "/books", 201),
+            ("GET", "/books", 200),
+        ]
+        assert lines[0]["path"] == "/books/1"
+        assert lines[0]["client"] == "127.0.0.1"
+        assert lines[2]["bytes_in"] > 0
+        assert all(line["bytes_out"] > 0 for line in lines)
+        assert lines[3]["bytes_out"] == len(streamed)